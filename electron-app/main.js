@@ -67,6 +67,7 @@ function initUserData() {
         if (!configData.llm_settings.temperature) configData.llm_settings.temperature = 0.1;
         if (!configData.llm_settings.timeout) configData.llm_settings.timeout = 600;
         if (!configData.llm_settings.base_url) configData.llm_settings.base_url = 'https://openrouter.ai/api/v1';
+        if (!configData.llm_settings.max_concurrency) configData.llm_settings.max_concurrency = 4;
         if (!configData.output_path) configData.output_path = '';
 
         fs.writeFileSync(CONFIG_PATH, yaml.dump(configData), 'utf8');
@@ -157,7 +158,8 @@ const DEFAULT_CONFIG = {
         model: "google/gemini-2.0-flash-exp:free",
         temperature: 0.1,
         timeout: 600,
-        base_url: "https://openrouter.ai/api/v1"
+        base_url: "https://openrouter.ai/api/v1",
+        max_concurrency: 4
     },
     output_path: ""
 };
@@ -172,11 +174,11 @@ ipcMain.handle('get-config', async () => {
             const userConfig = yaml.load(fileContents);
             // Deep merge or just shallow merge top keys for now
             if (userConfig) {
-                if (userConfig.llm_settings) {
-                    finalConfig.llm_settings = { ...finalConfig.llm_settings, ...userConfig.llm_settings };
-                }
-                if (userConfig.output_path) {
-                    finalConfig.output_path = userConfig.output_path;
+                // Keep sections the UI does not edit (rate limits, cache, ...)
+                finalConfig = { ...finalConfig, ...userConfig };
+                finalConfig.llm_settings = { ...DEFAULT_CONFIG.llm_settings, ...(userConfig.llm_settings || {}) };
+                if (!userConfig.output_path) {
+                    finalConfig.output_path = DEFAULT_CONFIG.output_path;
                 }
             }
         }
@@ -219,6 +221,150 @@ ipcMain.handle('save-prompt', async (event, content) => {
 });
 
 // 4. Run Process Pipeline
+// One long-lived worker (process_pipeline --serve) takes every drop as a
+// JSON-RPC job over stdin/stdout, so interpreter start-up, imports and the
+// pandoc check are paid once per app session instead of once per drop.
+let worker = null;
+let nextRequestId = 1;
+const pendingRequests = new Map(); // request id -> callback(error, result)
+const jobEvents = new Map();       // job id -> IPC event of the drop
+
+function pipelineCommand(args) {
+    if (app.isPackaged) {
+        // In production, use the bundled executable
+        // It should be in resources/python/process_pipeline (or .exe)
+        const ext = process.platform === 'win32' ? '.exe' : '';
+        return { cmd: path.join(process.resourcesPath, 'python', 'process_pipeline' + ext), cmdArgs: args };
+    }
+    // In dev, use python (or python3 on macOS/Linux)
+    return { cmd: process.platform === 'win32' ? 'python' : 'python3', cmdArgs: [PROCESS_SCRIPT, ...args] };
+}
+
+function handleWorkerMessage(message) {
+    if (message.id !== undefined && pendingRequests.has(message.id)) {
+        const callback = pendingRequests.get(message.id);
+        pendingRequests.delete(message.id);
+        callback(message.error ? new Error(message.error.message) : null, message.result);
+        return;
+    }
+    const params = message.params || {};
+    const event = jobEvents.get(params.job);
+    if (message.method === 'log') {
+        if (event) event.reply('process-log', params.text);
+        else console.log(`[pipeline] ${params.text}`);
+    } else if (message.method === 'progress') {
+        if (event) event.reply('process-progress', params);
+    } else if (message.method === 'job-done') {
+        jobEvents.delete(params.job);
+        if (!event) return;
+        if (params.ok) {
+            event.reply('process-log', "Processing Complete!");
+        } else if (params.cancelled) {
+            event.reply('process-log', "Processing cancelled");
+        }
+        event.reply('process-done', Boolean(params.ok));
+    }
+}
+
+function failAllJobs(message) {
+    for (const event of jobEvents.values()) {
+        event.reply('process-log', message);
+        event.reply('process-done', false);
+    }
+    jobEvents.clear();
+    for (const callback of pendingRequests.values()) callback(new Error(message));
+    pendingRequests.clear();
+}
+
+function startWorker(retries = 3) {
+    const { cmd, cmdArgs } = pipelineCommand(['--serve']);
+    console.log(`Spawning worker: ${cmd} with args: ${cmdArgs}`);
+    const child = spawn(cmd, cmdArgs, {
+        cwd: app.isPackaged ? path.dirname(cmd) : ROOT_DIR,
+        env: {
+            ...process.env,
+            OPENROUTER_API_KEY: DOT_ENV.OPENROUTER_API_KEY || '',
+            HDP_CACHE_DIR: path.join(USER_DATA_PATH, 'cache'),
+            PYTHONIOENCODING: 'utf-8',
+            PYTHONUTF8: '1'
+        }
+    });
+    worker = child;
+    // Requests written before the process is up; resent to the replacement
+    // if the spawn fails with EAGAIN and is retried.
+    child.unsent = [];
+    child.on('spawn', () => { child.unsent = []; });
+    child.stdin.on('error', (err) => console.error("Worker stdin error:", err));
+
+    let pending = '';
+    child.stdout.on('data', (data) => {
+        pending += data.toString();
+        const lines = pending.split('\n');
+        pending = lines.pop();
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            try {
+                handleWorkerMessage(JSON.parse(line));
+            } catch (e) {
+                console.log(`[pipeline] ${line}`);
+            }
+        }
+    });
+
+    child.stderr.on('data', (data) => {
+        for (const event of jobEvents.values()) event.reply('process-log', `ERROR: ${data.toString()}`);
+    });
+
+    child.on('error', (err) => {
+        console.error("Spawn error:", err);
+        if (err.code === 'EAGAIN' && retries > 0) {
+            // Stays the current worker until the retry replaces it, so the
+            // requests made meanwhile are queued for the new process too.
+            child.retrying = true;
+            setTimeout(() => {
+                const next = startWorker(retries - 1);
+                for (const line of child.unsent) writeWorker(next, line);
+            }, 1000);
+        } else {
+            if (worker === child) worker = null;
+            failAllJobs(`CRITICAL ERROR: Failed to start Python process. ${err.message}`);
+        }
+    });
+
+    child.on('close', (code, signal) => {
+        if (child.retrying) return;
+        if (worker === child) worker = null;
+        // Anything but the shutdown at quit leaves requests and jobs that
+        // will never get an answer.
+        if (!child.stopping) {
+            failAllJobs(code !== null ? `Process exited with code ${code}` : `Process killed by ${signal}`);
+        }
+    });
+    return child;
+}
+
+function writeWorker(child, line) {
+    if (child.unsent) child.unsent.push(line);
+    child.stdin.write(line);
+}
+
+function callWorker(method, params, callback) {
+    // A failed start answers the request through failAllJobs, like a crash.
+    if (!worker) startWorker();
+    const id = nextRequestId++;
+    pendingRequests.set(id, callback);
+    // `worker` is re-read here: an EAGAIN retry may have replaced the child.
+    writeWorker(worker, JSON.stringify({ jsonrpc: '2.0', id, method, params }) + '\n');
+}
+
+app.on('before-quit', () => {
+    if (worker) {
+        worker.stopping = true;
+        worker.stdin.write(JSON.stringify({ jsonrpc: '2.0', id: nextRequestId++, method: 'shutdown' }) + '\n');
+        worker.stdin.end();
+    }
+});
+
 ipcMain.on('run-process', (event, filePaths) => {
     // 1. Copy files to input_docs
     if (!fs.existsSync(INPUT_DOCS_DIR)) fs.mkdirSync(INPUT_DOCS_DIR, { recursive: true });
@@ -240,7 +386,7 @@ ipcMain.on('run-process', (event, filePaths) => {
 
     event.reply('process-log', `Copied ${copiedCount} files. Starting pipeline...`);
 
-    // Prepare Args
+    // Prepare job parameters (the config is re-read by every job)
     let outputPath = null;
     try {
         if (fs.existsSync(CONFIG_PATH)) {
@@ -249,83 +395,26 @@ ipcMain.on('run-process', (event, filePaths) => {
         }
     } catch (e) { console.error("Config read error", e); }
 
-    const args = [PROCESS_SCRIPT];
-
-    // Pass Config and Prompt Paths
-    args.push('--config-path', CONFIG_PATH);
-    args.push('--system-prompt-path', SYSTEM_PROMPT_PATH);
-
+    const params = {
+        files: filePaths || [],
+        config_path: CONFIG_PATH,
+        system_prompt_path: SYSTEM_PROMPT_PATH,
+        open_result: true
+    };
     if (outputPath) {
-        args.push('--output-dir', outputPath);
+        params.output_dir = outputPath;
         event.reply('process-log', `Using Output Directory: ${outputPath}`);
     }
 
-    if (filePaths && filePaths.length > 0) {
-        args.push('--input-files', ...filePaths);
-    }
-
-    // 2. Spawn Python Script
-    const spawnPython = (retries = 3) => {
-        let cmd, cmdArgs;
-
-        if (app.isPackaged) {
-            // In production, use the bundled executable
-            // It should be in resources/python/process_pipeline (or .exe)
-            const ext = process.platform === 'win32' ? '.exe' : '';
-            cmd = path.join(process.resourcesPath, 'python', 'process_pipeline' + ext);
-            // Remove the first argument (script path) because the executable IS the script
-            cmdArgs = args.slice(1);
-        } else {
-            // In dev, use python (or python3 on macOS/Linux)
-            cmd = process.platform === 'win32' ? 'python' : 'python3';
-            cmdArgs = args; // args includes the script path as first arg
+    // 2. Submit to the worker; logs and stage events arrive as notifications
+    callWorker('submit-files', params, (err, result) => {
+        if (err) {
+            event.reply('process-log', `CRITICAL ERROR: ${err.message}`);
+            event.reply('process-done', false);
+            return;
         }
-
-        console.log(`Spawning: ${cmd} with args: ${cmdArgs}`);
-        const pythonProcess = spawn(cmd, cmdArgs, {
-            cwd: app.isPackaged ? path.dirname(cmd) : ROOT_DIR,
-            env: {
-                ...process.env,
-                OPENROUTER_API_KEY: DOT_ENV.OPENROUTER_API_KEY || '',
-                PYTHONIOENCODING: 'utf-8',
-                PYTHONUTF8: '1'
-            }
-        });
-
-        pythonProcess.stdout.on('data', (data) => {
-            event.reply('process-log', data.toString());
-        });
-
-        pythonProcess.stderr.on('data', (data) => {
-            event.reply('process-log', `ERROR: ${data.toString()}`);
-        });
-
-        pythonProcess.on('error', (err) => {
-            console.error("Spawn error:", err);
-            if (err.code === 'EAGAIN' && retries > 0) {
-                event.reply('process-log', `System busy (EAGAIN), retrying in 1s... (${retries} left)`);
-                setTimeout(() => spawnPython(retries - 1), 1000);
-            } else {
-                event.reply('process-log', `CRITICAL ERROR: Failed to start Python process. ${err.message}`);
-                event.reply('process-done', false);
-            }
-        });
-
-        pythonProcess.on('close', (code) => {
-            if (code === 0) {
-                event.reply('process-log', "Processing Complete!");
-                event.reply('process-done', true);
-            } else {
-                // If code is null, it might be due to error handled above, but close still fires?
-                if (code !== null) {
-                    event.reply('process-log', `Process exited with code ${code}`);
-                    event.reply('process-done', false);
-                }
-            }
-        });
-    };
-
-    spawnPython();
+        jobEvents.set(result.job, event);
+    });
 });
 
 // 5. Open Visualization
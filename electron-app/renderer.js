@@ -83,6 +83,8 @@ function startProcessing(files) {
     statusArea.classList.remove('hidden');
     spinner.classList.remove('hidden');
     logOutput.textContent = "Запуск обработки...\n";
+    stageTotals = {};
+    progressRow.classList.add('hidden');
 
     ipcRenderer.send('run-process', files);
 }
@@ -92,6 +94,35 @@ ipcRenderer.on('process-log', (event, msg) => {
     logOutput.scrollTop = logOutput.scrollHeight;
 });
 
+// Overall progress from stage events: documents finished / planned, over all stages
+const progressRow = document.getElementById('progress-row');
+const progressBar = document.getElementById('progress-bar');
+const progressText = document.getElementById('progress-text');
+let stageTotals = {};
+
+function formatEta(seconds) {
+    if (seconds >= 60) return `~${Math.floor(seconds / 60)} мин ${Math.round(seconds % 60)} сек`;
+    return `~${Math.round(seconds)} сек`;
+}
+
+ipcRenderer.on('process-progress', (event, evt) => {
+    if (evt.event === 'plan') {
+        stageTotals[evt.stage] = { done: stageTotals[evt.stage]?.done || 0, total: evt.total };
+    } else if (evt.event === 'stage' && evt.total !== undefined) {
+        stageTotals[evt.stage] = { done: evt.done, total: evt.total };
+    }
+    const stages = Object.values(stageTotals);
+    const total = stages.reduce((sum, s) => sum + s.total, 0);
+    const done = stages.reduce((sum, s) => sum + Math.min(s.done, s.total), 0);
+    if (!total) return;
+    progressRow.classList.remove('hidden');
+    progressBar.value = done / total;
+    let text = `${Math.round(100 * done / total)}%`;
+    if (evt.stage) text += ` · ${evt.stage}${evt.doc && evt.doc !== '*' ? ': ' + evt.doc : ''}`;
+    if (evt.eta) text += ` · осталось ${formatEta(evt.eta)}`;
+    progressText.textContent = text;
+});
+
 ipcRenderer.on('process-done', (event, success) => {
     spinner.classList.add('hidden');
     if (success) {
@@ -227,8 +258,13 @@ const saveSettings = async () => {
         (document.getElementById('timeout') || document.getElementById('timeout-local')).value
     ) || 600;
 
+    // Keep settings that have no UI field (e.g. max_concurrency)
+    const preserved = { ...(existingConfig.llm_settings || {}) };
+    delete preserved.api_base;
+
     if (currentMode === 'cloud') {
         newConfig.llm_settings = {
+            ...preserved,
             provider: document.getElementById('cloud-provider').value,
             api_key: document.getElementById('api-key').value,
             model: document.getElementById('cloud-model').value,
@@ -237,6 +273,7 @@ const saveSettings = async () => {
         };
     } else {
         newConfig.llm_settings = {
+            ...preserved,
             provider: 'ollama',
             model: document.getElementById('local-model-select').value,
             api_base: 'http://localhost:11434',
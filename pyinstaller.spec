@@ -13,7 +13,9 @@ datas = [
     ('.env', '.')
 ]
 binaries = []
-hiddenimports = ['pandas', 'litellm', 'yaml', 'docx', 'bs4', 'tiktoken_ext.openai_public', 'tiktoken_ext', 'certifi']
+# Only what the pipeline imports; every extra package is unpacked and
+# scanned on each start of the onefile build.
+hiddenimports = ['litellm', 'yaml', 'docx', 'tiktoken_ext.openai_public', 'tiktoken_ext', 'certifi']
 
 # Collect all tiktoken resources
 tmp_ret = collect_all('tiktoken')
@@ -21,8 +23,14 @@ datas += tmp_ret[0]
 binaries += tmp_ret[1]
 hiddenimports += tmp_ret[2]
 
-# Collect all litellm resources
-tmp_ret_lite = collect_all('litellm')
+# Collect litellm resources, minus the proxy server and its web UI bundle,
+# which the pipeline never uses. Proxy modules litellm itself imports
+# (litellm.proxy._types) are still found by the import analysis.
+def is_litellm_client_module(name):
+    return not name.startswith('litellm.proxy')
+
+tmp_ret_lite = collect_all('litellm', filter_submodules=is_litellm_client_module,
+                           exclude_datas=['**/proxy/_experimental/**', '**/proxy/swagger/**'])
 datas += tmp_ret_lite[0]
 binaries += tmp_ret_lite[1]
 hiddenimports += tmp_ret_lite[2]
@@ -95,7 +103,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['pandas', 'bs4', 'matplotlib', 'tkinter', 'IPython'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
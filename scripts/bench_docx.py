@@ -0,0 +1,162 @@
+"""Benchmark of the python-docx converter (docx_to_md.py) against pandoc:
+throughput of both and word-level fidelity of the native output relative to
+pandoc's, per document.
+
+    python scripts/bench_docx.py path/to/docx_folder --workers 8
+    python scripts/bench_docx.py --generate 200
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import difflib
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+import docx_to_md
+from dedup import normalize_text
+from bench_extraction import NAMES, WORDS, percentile
+
+
+def make_corpus(directory, count, seed):
+    # Letters and reports with headings, emphasis, lists and tables.
+    import docx
+    rng = random.Random(seed)
+
+    def sentence():
+        words = [rng.choice(NAMES) if rng.random() < 0.1 else rng.choice(WORDS) for _ in range(rng.randint(8, 25))]
+        return " ".join(words).capitalize() + "."
+
+    for i in range(count):
+        document = docx.Document()
+        document.add_heading(f"Документ {i}", 1)
+        for _ in range(rng.randint(3, 30)):
+            roll = rng.random()
+            if roll < 0.1:
+                document.add_heading(sentence()[:40], 2)
+            elif roll < 0.25:
+                style = rng.choice(["List Bullet", "List Number"])
+                for _ in range(rng.randint(2, 5)):
+                    document.add_paragraph(sentence(), style=style)
+            elif roll < 0.3:
+                rows, cols = rng.randint(2, 6), rng.randint(2, 4)
+                table = document.add_table(rows=rows, cols=cols)
+                for r in range(rows):
+                    for c in range(cols):
+                        table.cell(r, c).text = rng.choice(WORDS)
+            else:
+                paragraph = document.add_paragraph()
+                for _ in range(rng.randint(1, 4)):
+                    run = paragraph.add_run(sentence() + " ")
+                    run.bold = rng.random() < 0.1
+                    run.italic = rng.random() < 0.1
+        document.save(os.path.join(directory, f"doc_{i:05d}.docx"))
+
+
+def convert_native(path):
+    started = time.perf_counter()
+    try:
+        return docx_to_md.convert(path), time.perf_counter() - started, None
+    except Exception as e:
+        return None, time.perf_counter() - started, str(e)
+
+
+def convert_pandoc(pandoc, path):
+    started = time.perf_counter()
+    result = subprocess.run([pandoc, path, "-f", "docx", "-t", "markdown", "--wrap=none"],
+                            capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=120)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        return None, elapsed, result.stderr.strip()
+    return result.stdout, elapsed, None
+
+
+def fidelity(native, reference):
+    # Share of pandoc's words (in order) that the native output reproduces;
+    # markup differences (table syntax, list indent) do not count.
+    a, b = normalize_text(native), normalize_text(reference)
+    if not a and not b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def timed_map(func, items, workers):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(func, items))
+    return results, time.perf_counter() - started
+
+
+def main(args_list=None):
+    parser = argparse.ArgumentParser(description="Compare docx_to_md.py with pandoc on a corpus of .docx files.")
+    parser.add_argument("corpus", nargs="?", help="Folder with .docx files")
+    parser.add_argument("--generate", type=int, default=0, help="Generate a synthetic corpus of N documents instead")
+    parser.add_argument("--pandoc", default=shutil.which("pandoc"), help="pandoc executable (default: from PATH)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json-out", help="Write per-document results as JSON to this file")
+    args = parser.parse_args(args_list)
+
+    if not docx_to_md.available():
+        print("python-docx is not installed")
+        return 1
+    work_dir = None
+    if args.generate:
+        work_dir = tempfile.mkdtemp(prefix="hdp_docx_bench_")
+        make_corpus(work_dir, args.generate, args.seed)
+        corpus = work_dir
+    elif args.corpus:
+        corpus = args.corpus
+    else:
+        parser.error("give a corpus folder or --generate N")
+
+    try:
+        files = sorted(os.path.join(corpus, f) for f in os.listdir(corpus) if f.lower().endswith('.docx'))
+        print(f"Corpus: {len(files)} documents in {corpus}, {args.workers} workers")
+
+        native, native_wall = timed_map(convert_native, files, args.workers)
+        unsupported = [(f, r[2]) for f, r in zip(files, native) if r[2]]
+        print(f"python-docx: {len(files) / native_wall:.1f} docs/s (wall {native_wall:.2f} s), "
+              f"p50 {percentile([r[1] for r in native], 0.5) * 1000:.1f} ms, "
+              f"p95 {percentile([r[1] for r in native], 0.95) * 1000:.1f} ms, "
+              f"fallback to pandoc: {len(unsupported)}")
+
+        report = {"documents": len(files), "workers": args.workers, "native_wall": round(native_wall, 3),
+                  "fallbacks": [{"file": os.path.basename(f), "reason": reason} for f, reason in unsupported]}
+        if args.pandoc:
+            reference, pandoc_wall = timed_map(lambda f: convert_pandoc(args.pandoc, f), files, args.workers)
+            print(f"pandoc:      {len(files) / pandoc_wall:.1f} docs/s (wall {pandoc_wall:.2f} s), "
+                  f"p50 {percentile([r[1] for r in reference], 0.5) * 1000:.1f} ms, "
+                  f"speed-up x{pandoc_wall / native_wall:.1f}")
+            scores = []
+            for path, (text, _, _), (ref, _, error) in zip(files, native, reference):
+                if text is not None and ref is not None:
+                    scores.append((fidelity(text, ref), os.path.basename(path)))
+            if scores:
+                values = [s for s, _ in scores]
+                print(f"fidelity vs pandoc (word sequence): mean {sum(values) / len(values):.3f}, "
+                      f"min {min(values):.3f}, below 0.95: {sum(1 for v in values if v < 0.95)}")
+                for score, name in sorted(scores)[:5]:
+                    print(f"  {score:.3f}  {name}")
+            report.update(pandoc_wall=round(pandoc_wall, 3),
+                          fidelity={name: round(score, 4) for score, name in scores})
+        else:
+            print("pandoc not found: fidelity not measured")
+
+        if args.json_out:
+            with open(args.json_out, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Offline extraction benchmark: runs extract_data.main over a synthetic corpus
+against scripts/mock_llm_server.py and reports throughput, latency, retries
+and peak memory.
+
+    python scripts/bench_extraction.py --docs 200 --concurrency 8 --latency lognormal:0.5,0.6 --rate-limit-rate 0.05
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import contextlib
+import tracemalloc
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+import yaml
+import extract_data
+from mock_llm_server import MockLLMServer
+
+NAMES = ["Иванов", "Петров", "Сидорова", "Толстой", "Чехов", "Горький", "Блок", "Ахматова", "Цветаева", "Бунин"]
+WORDS = ["письмо", "встреча", "заседание", "рукопись", "редакция", "журнал", "поездка", "издательство",
+         "переписка", "договор", "выставка", "театр", "доклад", "архив", "собрание"]
+
+
+def make_corpus(directory, count, mean_words, seed):
+    # Document lengths are lognormal around mean_words, so the corpus mixes
+    # packable short letters with a few long documents that get chunked.
+    rng = random.Random(seed)
+    for i in range(count):
+        words = max(20, int(rng.lognormvariate(0, 0.8) * mean_words))
+        paragraphs = []
+        while words > 0:
+            n = min(words, rng.randint(30, 120))
+            sentence = " ".join(rng.choice(NAMES) if rng.random() < 0.1 else rng.choice(WORDS) for _ in range(n))
+            paragraphs.append(sentence.capitalize() + ".")
+            words -= n
+        with open(os.path.join(directory, f"doc_{i:05d}.md"), 'w', encoding='utf-8') as f:
+            f.write(f"# Документ {i}\n\n" + "\n\n".join(paragraphs) + "\n")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class DocTimer:
+    # Wraps process_file/process_batch to time each top-level unit of work;
+    # a batch's duration is attributed to every document in it.
+
+    def __init__(self):
+        self.latencies = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def wrap(self, func, count_docs):
+        def timed(*args, **kwargs):
+            if getattr(self._local, 'active', False):
+                return func(*args, **kwargs)
+            self._local.active = True
+            started = time.monotonic()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.monotonic() - started
+                self._local.active = False
+                with self._lock:
+                    self.latencies.extend([elapsed] * count_docs(args))
+        return timed
+
+
+def write_config(path, server_url, args):
+    config = {
+        "llm_settings": {
+            "provider": "openai_compatible",
+            "model": "mock",
+            "base_url": server_url,
+            "api_key": "mock",
+            "max_concurrency": args.concurrency,
+            "max_retries": args.max_retries,
+            "stream": not args.no_stream,
+            "packing": not args.no_packing,
+            "hedging": False,
+            "fallbacks": [],
+        },
+        "rate_limits": {"default": {"rpm": 0, "tpm": 0}},
+        "cache": {"enabled": not args.no_cache},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+
+
+def run_once(base_dir, config_path, server, verbose):
+    timer = DocTimer()
+    original = extract_data.process_file, extract_data.process_batch
+    extract_data.process_file = timer.wrap(original[0], lambda args: 1)
+    extract_data.process_batch = timer.wrap(original[1], lambda args: len(args[0]))
+    before = server.stats.snapshot()
+
+    tracemalloc.start()
+    started = time.monotonic()
+    try:
+        with open(os.devnull, 'w') as devnull:
+            with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(devnull):
+                extract_data.main(["--base-dir", base_dir, "--config-path", config_path])
+    finally:
+        wall = time.monotonic() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        extract_data.process_file, extract_data.process_batch = original
+
+    after = server.stats.snapshot()
+    outcomes = {k: after['outcomes'].get(k, 0) - before['outcomes'].get(k, 0) for k in after['outcomes']}
+    docs = len(timer.latencies)
+    return {
+        "documents": docs,
+        "wall_seconds": round(wall, 3),
+        "docs_per_second": round(docs / wall, 2) if wall else 0.0,
+        "latency_p50": round(percentile(timer.latencies, 0.5), 3),
+        "latency_p95": round(percentile(timer.latencies, 0.95), 3),
+        "requests": after['requests'] - before['requests'],
+        # identical request bodies seen again by the server
+        "retries": after['repeats'] - before['repeats'],
+        "rate_limited": outcomes.get('rate_limited', 0),
+        "errors": outcomes.get('error', 0),
+        "truncated": outcomes.get('truncated', 0),
+        "json_files": len([n for n in os.listdir(os.path.join(base_dir, "json")) if n.endswith('.json')]),
+        "peak_memory_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+def main(args_list=None):
+    parser = argparse.ArgumentParser(description="Benchmark extraction against the mock LLM server.")
+    parser.add_argument("--docs", type=int, default=100, help="Number of synthetic documents")
+    parser.add_argument("--words", type=int, default=400, help="Mean words per document")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", default="lognormal:0.3,0.5", help="Mock server latency distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=1, help="Repeat over the same corpus (later runs measure the cache)")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--no-stream", action="store_true")
+    parser.add_argument("--no-packing", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary corpus folder")
+    parser.add_argument("--json-out", help="Write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show extraction logs")
+    args = parser.parse_args(args_list)
+
+    server = MockLLMServer(latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                           truncate_rate=args.truncate_rate, seed=args.seed).start()
+    work_dir = tempfile.mkdtemp(prefix="hdp_bench_")
+    results = []
+    try:
+        make_corpus(work_dir, args.docs, args.words, args.seed)
+        config_path = os.path.join(work_dir, "bench_config.yml")
+        write_config(config_path, server.url, args)
+        print(f"Corpus: {args.docs} documents in {work_dir}; mock server {server.url}")
+        for run in range(1, args.runs + 1):
+            if run > 1:
+                # Later runs start from the cache only, not from existing JSON.
+                shutil.rmtree(os.path.join(work_dir, "json"), ignore_errors=True)
+            result = run_once(work_dir, config_path, server, args.verbose)
+            result["run"] = run
+            results.append(result)
+            print(f"run {run}: {result['documents']} docs in {result['wall_seconds']}s "
+                  f"({result['docs_per_second']} docs/s), p50 {result['latency_p50']}s, p95 {result['latency_p95']}s, "
+                  f"requests {result['requests']}, retries {result['retries']} "
+                  f"(429: {result['rate_limited']}, errors: {result['errors']}, truncated: {result['truncated']}), "
+                  f"JSON {result['json_files']}/{args.docs}, peak memory {result['peak_memory_mb']} MB")
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Split long markdown into token-budgeted chunks and merge per-chunk extractions."""
+import re
+
+HEADING_RE = re.compile(r'^#{1,6}\s')
+
+LIST_FIELDS = ('topics', 'entities', 'relationships', 'events')
+
+
+def approx_tokens(text):
+    # Rough estimate for Cyrillic prose: ~3 characters per token.
+    return len(text) // 3 + 1
+
+
+def _blocks(text):
+    # Paragraphs separated by blank lines; a heading always starts a new block.
+    blocks, current = [], []
+    for line in text.splitlines():
+        if not line.strip() or HEADING_RE.match(line):
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            if not line.strip():
+                continue
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _split_oversized(block, max_tokens, count_tokens):
+    # A single paragraph over budget: split on lines, then hard-split long lines.
+    pieces, current = [], ""
+    for line in block.splitlines():
+        while count_tokens(line) > max_tokens:
+            cut = max(1, len(line) * max_tokens // count_tokens(line))
+            space = line.rfind(" ", 0, cut)
+            if space > cut // 2:
+                cut = space
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:cut])
+            line = line[cut:].lstrip()
+        candidate = f"{current}\n{line}" if current else line
+        if current and count_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_markdown(text, max_tokens, count_tokens=approx_tokens):
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    chunks, current, current_tokens = [], [], 0
+    for block in _blocks(text):
+        block_tokens = count_tokens(block)
+        if block_tokens > max_tokens:
+            parts = _split_oversized(block, max_tokens, count_tokens)
+        else:
+            parts = [block]
+        for part in parts:
+            part_tokens = count_tokens(part)
+            starts_section = bool(HEADING_RE.match(part))
+            # Prefer to break before a heading once the chunk is half full.
+            if current and (current_tokens + part_tokens > max_tokens or
+                            (starts_section and current_tokens > max_tokens // 2)):
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _key(*values):
+    return tuple((v or "").strip().casefold() for v in values)
+
+
+def merge_extractions(results, topics_order=()):
+    # Deterministic reduce: chunk order decides which duplicate wins, scalar
+    # metadata comes from the first chunk that has it, topics follow the
+    # configured topic list.
+    merged_meta = {}
+    topics, entities, relationships, events = [], {}, {}, {}
+    analyses = []
+
+    for data in results:
+        meta = data.get('metadata') or {}
+        for k, v in meta.items():
+            if k in LIST_FIELDS:
+                continue
+            if v and not merged_meta.get(k):
+                merged_meta[k] = v
+
+        for t in meta.get('topics') or []:
+            if t not in topics:
+                topics.append(t)
+
+        for ent in meta.get('entities') or []:
+            key = _key(ent.get('name'))
+            if key not in entities:
+                entities[key] = dict(ent)
+            elif entities[key].get('group') in (None, '', 'Other') and ent.get('group'):
+                entities[key]['group'] = ent['group']
+
+        for rel in meta.get('relationships') or []:
+            relationships.setdefault(_key(rel.get('source'), rel.get('target'), rel.get('type')), rel)
+
+        for evt in meta.get('events') or []:
+            events.setdefault(_key(evt.get('date'), evt.get('actor'), evt.get('target'), evt.get('desc')), evt)
+
+        analysis = (data.get('analysis') or "").strip()
+        if analysis and analysis not in analyses:
+            analyses.append(analysis)
+
+    order = {t: i for i, t in enumerate(topics_order)}
+    merged_meta['topics'] = sorted(topics, key=lambda t: (order.get(t, len(order)), topics.index(t)))
+    merged_meta['entities'] = list(entities.values())
+    merged_meta['relationships'] = list(relationships.values())
+    merged_meta['events'] = list(events.values())
+
+    return {"metadata": merged_meta, "analysis": "\n\n".join(analyses)}
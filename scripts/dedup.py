@@ -0,0 +1,181 @@
+"""Near-duplicate detection for converted documents: MinHash signatures over word
+shingles with a banded LSH index, persisted next to the inputs."""
+import os
+import re
+import json
+import zlib
+import random
+
+from journal import atomic_write_json
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+INDEX_VERSION = 1
+NUM_PERM = 128
+SHINGLE_WORDS = 3
+_PRIME = 4294967311  # smallest prime above 2**32; a*x+b stays below 2**64
+
+_MARKUP = re.compile(r'[#*_>`~|\[\]()\\{}<>=+-]+')
+_NON_WORD = re.compile(r'[^\w\s]+')
+
+
+def normalize_text(text):
+    # Formatting and punctuation differ between a draft and its clean copy;
+    # the words do not.
+    text = text.lower().replace('ё', 'е')
+    text = _MARKUP.sub(' ', text)
+    text = _NON_WORD.sub(' ', text)
+    return text.split()
+
+
+def shingle_hashes(text, size=SHINGLE_WORDS):
+    words = normalize_text(text)
+    if len(words) <= size:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = (" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return {zlib.crc32(g.encode('utf-8')) for g in grams}
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.a = [rng.randrange(1, 2 ** 32) for _ in range(num_perm)]
+        self.b = [rng.randrange(0, 2 ** 32) for _ in range(num_perm)]
+        if np is not None:
+            self._a = np.array(self.a, dtype=np.uint64)[:, None]
+            self._b = np.array(self.b, dtype=np.uint64)[:, None]
+
+    def signature(self, hashes):
+        if not hashes:
+            return [_PRIME] * self.num_perm
+        if np is not None:
+            values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+            result = np.full(self.num_perm, _PRIME, dtype=np.uint64)
+            for start in range(0, len(values), 8192):
+                block = values[None, start:start + 8192]
+                result = np.minimum(result, ((self._a * block + self._b) % _PRIME).min(axis=1))
+            return [int(v) for v in result]
+        return [min((a * x + b) % _PRIME for x in hashes) for a, b in zip(self.a, self.b)]
+
+
+def similarity(sig1, sig2):
+    # Share of equal MinHash slots: an unbiased estimate of the Jaccard
+    # similarity of the two shingle sets.
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+
+def lsh_params(threshold, num_perm=NUM_PERM):
+    # Rows per band so that the LSH S-curve turns up a little below the
+    # threshold (few misses); candidates are then checked exactly.
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if bands < 1:
+            break
+        if (1 / bands) ** (1 / rows) <= max(0.05, threshold - 0.1):
+            best = (bands, rows)
+    return best
+
+
+class DedupIndex:
+    # Entries: name -> {"hash", "sig", "duplicate_of"}. Only originals are
+    # bucketed, so a duplicate always points at a document that has (or
+    # will get) its own extraction.
+
+    def __init__(self, path, threshold=0.85, num_perm=NUM_PERM):
+        self.path = path
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.entries = {}
+        self.buckets = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != INDEX_VERSION or data.get('num_perm') != self.hasher.num_perm:
+            return
+        for name, entry in data.get('entries', {}).items():
+            self.entries[name] = entry
+            if not entry.get('duplicate_of'):
+                self._bucket(name, entry['sig'])
+
+    def save(self):
+        atomic_write_json(self.path, {"version": INDEX_VERSION, "num_perm": self.hasher.num_perm,
+                                      "entries": self.entries})
+
+    def _band_keys(self, sig):
+        for band in range(self.bands):
+            yield band, tuple(sig[band * self.rows:(band + 1) * self.rows])
+
+    def _bucket(self, name, sig):
+        for key in self._band_keys(sig):
+            self.buckets.setdefault(key, set()).add(name)
+
+    def _unbucket(self, name, sig):
+        for key in self._band_keys(sig):
+            names = self.buckets.get(key)
+            if names:
+                names.discard(name)
+
+    def signature(self, text):
+        return self.hasher.signature(shingle_hashes(text))
+
+    def find(self, sig, exclude=None):
+        candidates = set()
+        for key in self._band_keys(sig):
+            candidates |= self.buckets.get(key, set())
+        candidates.discard(exclude)
+        best = None
+        for name in sorted(candidates):
+            score = similarity(sig, self.entries[name]['sig'])
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (name, score)
+        return best
+
+    def add(self, name, content_hash, sig, duplicate_of=None):
+        self.remove(name)
+        self.entries[name] = {"hash": content_hash, "sig": sig, "duplicate_of": duplicate_of}
+        if not duplicate_of:
+            self._bucket(name, sig)
+
+    def remove(self, name):
+        entry = self.entries.pop(name, None)
+        if entry and not entry.get('duplicate_of'):
+            self._unbucket(name, entry['sig'])
+
+    def prune(self, names):
+        for name in [n for n in self.entries if n not in names]:
+            self.remove(name)
+        for name, entry in self.entries.items():
+            if entry.get('duplicate_of') and entry['duplicate_of'] not in self.entries:
+                entry['duplicate_of'] = None
+                self._bucket(name, entry['sig'])
+
+    def classify(self, name, content_hash, text):
+        # Returns (original_name, similarity) for a near-duplicate, else None.
+        # A document already indexed as an original stays one.
+        entry = self.entries.get(name)
+        if entry and entry['hash'] == content_hash:
+            if not entry.get('duplicate_of'):
+                return None
+            original = self.entries.get(entry['duplicate_of'])
+            if original and not original.get('duplicate_of'):
+                return entry['duplicate_of'], similarity(entry['sig'], original['sig'])
+            sig = entry['sig']
+        else:
+            sig = self.signature(text)
+        match = self.find(sig, exclude=name)
+        self.add(name, content_hash, sig, match[0] if match else None)
+        return match
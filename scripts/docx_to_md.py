@@ -0,0 +1,301 @@
+"""In-process .docx -> Markdown with python-docx: paragraphs, headings, lists,
+footnotes and tables, in document order. Documents with content it cannot
+represent (equations, text boxes, embedded objects) raise UnsupportedDocument
+so the caller can fall back to pandoc."""
+import re
+
+try:
+    import docx
+    from docx.opc.constants import RELATIONSHIP_TYPE as RT
+    from docx.oxml import parse_xml
+    from docx.oxml.ns import qn
+except ImportError:
+    docx = None
+
+HEADING_STYLE = re.compile(r'^(?:heading|заголовок)\s*(\d)$', re.IGNORECASE)
+QUOTE_STYLES = {'quote', 'intense quote', 'цитата', 'выделенная цитата'}
+
+# Elements whose content would be lost or misplaced.
+UNSUPPORTED = {
+    'm:oMath': "формулы",
+    'm:oMathPara': "формулы",
+    'w:txbxContent': "надписи (text box)",
+    'w:object': "внедрённые объекты",
+    'w:altChunk': "вложенные документы",
+}
+
+
+class UnsupportedDocument(Exception):
+    pass
+
+
+def available():
+    return docx is not None
+
+
+def convert(path):
+    if docx is None:
+        raise UnsupportedDocument("python-docx не установлен")
+    return _Converter(docx.Document(path)).markdown()
+
+
+class _Converter:
+    def __init__(self, document):
+        self.document = document
+        self.part = document.part
+        self.styles = {}
+        self.style_numbering = {}
+        for style in document.styles:
+            self.styles[style.style_id] = (style.name or '').lower()
+            ppr = style.element.find(qn('w:pPr'))
+            num = ppr.find(qn('w:numPr')) if ppr is not None else None
+            if num is not None:
+                # "List Bullet" and friends number through the style
+                self.style_numbering[style.style_id] = num
+        self.numbering = self._numbering_formats()
+        self.counters = {}
+        self.notes = {}
+        self.note_order = []
+        self._check_supported(document.element.body)
+
+    def _check_supported(self, body):
+        for tag, what in UNSUPPORTED.items():
+            if body.find('.//' + qn(tag)) is not None:
+                raise UnsupportedDocument(f"в документе есть {what}")
+
+    def _numbering_formats(self):
+        # numId -> {ilvl: numFmt}
+        try:
+            numbering = self.part.numbering_part.element
+        except (KeyError, NotImplementedError):
+            return {}
+        abstract = {}
+        for node in numbering.findall(qn('w:abstractNum')):
+            levels = {}
+            for lvl in node.findall(qn('w:lvl')):
+                fmt = lvl.find(qn('w:numFmt'))
+                levels[lvl.get(qn('w:ilvl'))] = fmt.get(qn('w:val')) if fmt is not None else 'decimal'
+            abstract[node.get(qn('w:abstractNumId'))] = levels
+        formats = {}
+        for num in numbering.findall(qn('w:num')):
+            ref = num.find(qn('w:abstractNumId'))
+            if ref is not None:
+                formats[num.get(qn('w:numId'))] = abstract.get(ref.get(qn('w:val')), {})
+        return formats
+
+    def _notes_part(self, reltype):
+        for rel in self.part.rels.values():
+            if rel.reltype == reltype and not rel.is_external:
+                return parse_xml(rel.target_part.blob)
+        return None
+
+    def markdown(self):
+        blocks = list(self._blocks(self.document.element.body))
+        out = []
+        for i, (kind, text) in enumerate(blocks):
+            if i:
+                out.append("\n" if kind == 'item' and blocks[i - 1][0] == 'item' else "\n\n")
+            out.append(text)
+        notes = self._render_notes()
+        if notes:
+            out.append("\n\n" + notes)
+        return "".join(out).strip() + "\n"
+
+    # --- blocks ---
+
+    def _blocks(self, parent):
+        for child in parent:
+            if child.tag == qn('w:p'):
+                block = self._paragraph(child)
+                if block:
+                    yield block
+            elif child.tag == qn('w:tbl'):
+                yield 'table', self._table(child)
+            elif child.tag == qn('w:sdt'):
+                content = child.find(qn('w:sdtContent'))
+                if content is not None:
+                    yield from self._blocks(content)
+
+    def _paragraph(self, p):
+        text = self._inline(p).strip()
+        ppr = p.find(qn('w:pPr'))
+        style = ''
+        num = None
+        if ppr is not None:
+            pstyle = ppr.find(qn('w:pStyle'))
+            if pstyle is not None:
+                style = self.styles.get(pstyle.get(qn('w:val')), '')
+            num = ppr.find(qn('w:numPr'))
+            if num is None and pstyle is not None:
+                num = self.style_numbering.get(pstyle.get(qn('w:val')))
+        if not text:
+            return None
+        match = HEADING_STYLE.match(style)
+        if match:
+            return 'heading', "#" * min(6, int(match.group(1))) + " " + _plain(text)
+        if style == 'title':
+            return 'heading', "# " + _plain(text)
+        if num is not None:
+            return 'item', self._list_item(num, text)
+        if style in QUOTE_STYLES:
+            return 'quote', "> " + text.replace("\n", "\n> ")
+        self.counters.clear()
+        return 'para', text
+
+    def _list_item(self, num, text):
+        num_id = _val(num.find(qn('w:numId'))) or '0'
+        level = int(_val(num.find(qn('w:ilvl'))) or 0)
+        fmt = self.numbering.get(num_id, {}).get(str(level), 'bullet')
+        for key in [k for k in self.counters if k[0] == num_id and k[1] > level]:
+            del self.counters[key]
+        indent = "    " * level
+        if fmt in ('bullet', 'none'):
+            return f"{indent}- {text}"
+        self.counters[num_id, level] = self.counters.get((num_id, level), 0) + 1
+        return f"{indent}{self.counters[num_id, level]}. {text}"
+
+    def _table(self, tbl):
+        rows = []
+        for tr in tbl.findall(qn('w:tr')):
+            cells = []
+            for tc in tr.findall(qn('w:tc')):
+                text = " ".join(t for t in (self._inline(p).strip() for p in tc.iter(qn('w:p'))) if t)
+                tcpr = tc.find(qn('w:tcPr'))
+                span = 1
+                if tcpr is not None:
+                    if tcpr.find(qn('w:vMerge')) is not None and _val(tcpr.find(qn('w:vMerge'))) != 'restart':
+                        text = ""
+                    span = int(_val(tcpr.find(qn('w:gridSpan'))) or 1)
+                cells.append(text.replace("|", "\\|").replace("\n", " "))
+                cells.extend([""] * (span - 1))
+            rows.append(cells)
+        if not rows:
+            return ""
+        width = max(len(r) for r in rows)
+        rows = [r + [""] * (width - len(r)) for r in rows]
+        lines = ["| " + " | ".join(rows[0]) + " |", "|" + "---|" * width]
+        lines += ["| " + " | ".join(r) + " |" for r in rows[1:]]
+        return "\n".join(lines)
+
+    # --- inline ---
+
+    def _inline(self, element):
+        segments = []
+        self._collect(element, segments)
+        return _render_segments(segments)
+
+    def _collect(self, element, segments):
+        for child in element:
+            tag = child.tag
+            if tag == qn('w:r'):
+                self._run(child, segments)
+            elif tag == qn('w:hyperlink'):
+                inner = []
+                self._collect(child, inner)
+                text = _render_segments(inner)
+                target = self._link_target(child)
+                segments.append((f"[{text}]({target})" if target and text else text, False, False, True))
+            elif tag in (qn('w:ins'), qn('w:moveTo'), qn('w:smartTag'), qn('w:fldSimple'), qn('w:customXml')):
+                self._collect(child, segments)
+            elif tag == qn('w:sdt'):
+                content = child.find(qn('w:sdtContent'))
+                if content is not None:
+                    self._collect(content, segments)
+
+    def _run(self, r, segments):
+        rpr = r.find(qn('w:rPr'))
+        bold = _on(rpr, 'w:b')
+        italic = _on(rpr, 'w:i')
+        for child in r:
+            tag = child.tag
+            if tag == qn('w:t'):
+                segments.append((child.text or "", bold, italic, False))
+            elif tag == qn('w:tab'):
+                segments.append(("\t", bold, italic, False))
+            elif tag in (qn('w:br'), qn('w:cr')):
+                if child.get(qn('w:type')) != 'page':
+                    segments.append(("\\\n", False, False, True))
+            elif tag == qn('w:noBreakHyphen'):
+                segments.append(("-", bold, italic, False))
+            elif tag == qn('w:footnoteReference'):
+                segments.append((self._note_ref('footnote', child.get(qn('w:id'))), False, False, True))
+            elif tag == qn('w:endnoteReference'):
+                segments.append((self._note_ref('endnote', child.get(qn('w:id'))), False, False, True))
+
+    def _link_target(self, hyperlink):
+        rid = hyperlink.get(qn('r:id'))
+        if rid and rid in self.part.rels:
+            return self.part.rels[rid].target_ref
+        anchor = hyperlink.get(qn('w:anchor'))
+        return f"#{anchor}" if anchor else None
+
+    # --- footnotes ---
+
+    def _note_ref(self, kind, note_id):
+        key = (kind, note_id)
+        if key not in self.notes:
+            self.notes[key] = len(self.notes) + 1
+            self.note_order.append(key)
+        return f"[^{self.notes[key]}]"
+
+    def _render_notes(self):
+        if not self.note_order:
+            return ""
+        parts = {'footnote': self._notes_part(RT.FOOTNOTES), 'endnote': self._notes_part(RT.ENDNOTES)}
+        rendered = []
+        # Notes can reference further notes, so the list may grow while rendering.
+        i = 0
+        while i < len(self.note_order):
+            kind, note_id = self.note_order[i]
+            i += 1
+            root = parts.get(kind)
+            note = None
+            if root is not None:
+                for node in root.findall(qn(f'w:{kind}')):
+                    if node.get(qn('w:id')) == note_id:
+                        note = node
+                        break
+            paragraphs = [] if note is None else [t for t in (self._inline(p).strip() for p in note.iter(qn('w:p'))) if t]
+            body = "\n\n    ".join(paragraphs)
+            rendered.append(f"[^{self.notes[kind, note_id]}]: {body}")
+        return "\n\n".join(rendered)
+
+
+def _val(node):
+    return node.get(qn('w:val')) if node is not None else None
+
+
+def _on(rpr, tag):
+    if rpr is None:
+        return False
+    node = rpr.find(qn(tag))
+    return node is not None and _val(node) not in ('0', 'false', 'off')
+
+
+def _plain(text):
+    # Headings are emphasised already.
+    return re.sub(r'(\*\*|\*)(.+?)\1', r'\2', text)
+
+
+def _render_segments(segments):
+    # Adjacent runs with the same formatting are merged, so "**a****b**"
+    # becomes "**ab**"; spaces are kept outside the emphasis markers.
+    merged = []
+    for text, bold, italic, raw in segments:
+        if not text:
+            continue
+        if merged and not raw and not merged[-1][3] and merged[-1][1:3] == (bold, italic):
+            merged[-1] = (merged[-1][0] + text, bold, italic, False)
+        else:
+            merged.append((text, bold, italic, raw))
+    out = []
+    for text, bold, italic, raw in merged:
+        if raw or not (bold or italic) or not text.strip():
+            out.append(text)
+            continue
+        marker = "***" if bold and italic else "**" if bold else "*"
+        core = text.strip()
+        lead = text[:len(text) - len(text.lstrip())]
+        trail = text[len(text.rstrip()):]
+        out.append(f"{lead}{marker}{core}{marker}{trail}")
+    return "".join(out)
@@ -0,0 +1,298 @@
+"""Persistent alias index that maps name variants ("Стельмашенко",
+"о. Стельмашенко", "Stelmashenko") to one canonical entity."""
+import os
+import re
+import json
+import difflib
+import threading
+
+from journal import atomic_write_json
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
+
+INDEX_VERSION = 1
+
+# Titles and honorifics that precede a name but do not identify the person.
+HONORIFICS = {
+    'о', 'отец', 'отца', 'прот', 'протоиерей', 'иерей', 'свящ', 'священник', 'игумен', 'архим',
+    'г', 'гн', 'г-н', 'г-жа', 'гжа', 'госп', 'проф', 'профессор', 'д-р', 'др',
+    'mr', 'mrs', 'ms', 'dr', 'prof', 'fr', 'rev',
+}
+
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y',
+    'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya', 'і': 'i', 'ѣ': 'e', 'ѳ': 'f', 'ѵ': 'i',
+}
+
+# Spelling variants of the same sound across transliteration schemes.
+_SQUASH = [
+    (re.compile(r'(?:ii|iy|ij|yi|yj|y)$'), 'y'),
+    (re.compile(r'kh'), 'h'),
+    (re.compile(r'w'), 'v'),
+    (re.compile(r'ck'), 'k'),
+    (re.compile(r'tsch|tch'), 'ch'),
+    (re.compile(r'sch'), 'sh'),
+    (re.compile(r'^j'), 'y'),
+    (re.compile(r'(.)\1'), r'\1'),
+]
+
+_FEMININE = ('ova', 'eva', 'ina', 'aya', 'skaya', 'ska')
+_MASCULINE = ('ov', 'ev', 'in', 'sky', 'skoy', 'ski')
+
+# Given names that come with a surname in the sources; a token from this
+# list is never taken for the surname ("Ломако Николай", "Сергей Ванек").
+FIRST_NAMES = {
+    'александр', 'алексей', 'анатолий', 'андрей', 'антон', 'аркадий', 'борис', 'вадим', 'валентин',
+    'василий', 'виктор', 'владимир', 'всеволод', 'вячеслав', 'георгий', 'глеб', 'григорий', 'даниил',
+    'дмитрий', 'евгений', 'иван', 'игорь', 'илья', 'иосиф', 'кирилл', 'константин', 'лев', 'леонид',
+    'максим', 'михаил', 'николай', 'олег', 'павел', 'петр', 'роман', 'сергей', 'степан', 'федор',
+    'юрий', 'яков', 'вениамин', 'досифей', 'евлогий', 'сергий', 'савватий', 'горазд',
+    'анна', 'вера', 'екатерина', 'елена', 'мария', 'надежда', 'наталья', 'нина', 'ольга', 'софия',
+    'татьяна', 'людмила', 'любовь', 'ирина', 'ксения', 'зинаида',
+    'jan', 'josef', 'karel', 'frantisek', 'vaclav', 'jaroslav', 'jiri', 'milos', 'vladimir', 'tomas',
+    'ivan', 'nikolai', 'sergei', 'sergey', 'alexander', 'mikhail', 'marie', 'anna',
+}
+_PATRONYMIC = ('ovich', 'evich', 'ich', 'ovna', 'evna', 'ichna', 'inichna')
+
+# Words that make a mention an organisation rather than a person, matched
+# as prefixes of lower-cased words.
+ORGANIZATION_WORDS = (
+    'министерств', 'церк', 'общин', 'комитет', 'союз', 'обществ', 'совет', 'приход', 'управлени',
+    'епархи', 'братств', 'посольств', 'консульств', 'мисси', 'университет', 'академи', 'парти',
+    'правительств', 'собор', 'синод', 'канцеляри', 'отдел', 'организаци', 'комисси', 'редакци',
+    'ministry', 'church', 'committee', 'union', 'society', 'council', 'parish', 'embassy', 'office',
+    'ministerstvo', 'cirkev', 'spolek', 'urad',
+)
+ORGANIZATION_THRESHOLD = 96
+
+
+def strip_parenthetical(name):
+    # The old normalize_name rule: "Иванов (редактор)" -> "Иванов".
+    if not name:
+        return ""
+    if "(" in name:
+        name = name.split("(")[0]
+    return " ".join(name.split())
+
+
+def translit(token):
+    return "".join(TRANSLIT.get(ch, ch) for ch in token.lower())
+
+
+def squash(token):
+    token = re.sub(r'[^a-z0-9]', '', translit(token))
+    for pattern, replacement in _SQUASH:
+        token = pattern.sub(replacement, token)
+    return token
+
+
+_GIVEN = {squash(name) for name in FIRST_NAMES}
+
+
+def _tokens(name):
+    tokens = [t for t in re.split(r'[\s.,]+', strip_parenthetical(name).lower().replace('ё', 'е')) if t]
+    while len(tokens) > 1 and tokens[0] in HONORIFICS:
+        tokens = tokens[1:]
+    return tokens
+
+
+def parse_name(name):
+    # -> (surname key, set of first-name initials, full key). The surname is
+    # the last word that is not an initial, a known given name or a
+    # patronymic; failing that, the last full word.
+    keys = [k for k in (squash(t) for t in _tokens(name)) if k]
+    if not keys:
+        return "", set(), ""
+    words = [k for k in keys if len(k) > 1]
+    surnames = [k for k in words if k not in _GIVEN and not k.endswith(_PATRONYMIC)]
+    surname = (surnames or words or keys)[-1]
+    rest = list(keys)
+    rest.remove(surname)
+    initials = {k[0] for k in rest}
+    return surname, initials, " ".join(sorted(keys))
+
+
+def _phrase(name):
+    # Whole name in word order, for names that are not people.
+    return " ".join(k for k in (squash(t) for t in _tokens(name)) if k)
+
+
+def is_person(name, kind=None):
+    # kind: the entity type from extraction ("Person", "Organization", ...)
+    # when known; otherwise decided from the name: up to four capitalised
+    # words, none of them an organisation word.
+    if kind:
+        return str(kind).strip().lower() in ('person', 'персона', 'человек', 'лицо')
+    words = strip_parenthetical(name).split()
+    while len(words) > 1 and words[0].lower().strip('.') in HONORIFICS:
+        words = words[1:]
+    if not words or len(words) > 4:
+        return False
+    for word in words:
+        lower = word.lower()
+        if lower.startswith(ORGANIZATION_WORDS):
+            return False
+        if word[0].isalpha() and not word[0].isupper():
+            return False
+    return True
+
+
+def _gender(surname):
+    if surname.endswith(_FEMININE):
+        return 'f'
+    if surname.endswith(_MASCULINE):
+        return 'm'
+    return None
+
+
+def _compatible(a, b):
+    # a, b: (surname, initials). Different first initials or a male/female
+    # surname pair (Петров / Петрова) are different people.
+    if a[1] and b[1] and not (a[1] & b[1]):
+        return False
+    ga, gb = _gender(a[0]), _gender(b[0])
+    return not (ga and gb and ga != gb)
+
+
+def _best_match(query, choices, threshold):
+    # choices: list of surname keys; returns index of the best one >= threshold.
+    if not choices:
+        return None
+    if process is not None:
+        found = process.extractOne(query, choices, scorer=fuzz.ratio, score_cutoff=threshold)
+        return found[2] if found else None
+    best, best_score = None, threshold
+    for i, choice in enumerate(choices):
+        score = difflib.SequenceMatcher(None, query, choice).ratio() * 100
+        if score >= best_score:
+            best, best_score = i, score
+    return best
+
+
+class EntityIndex:
+    # Clusters of name forms. Exact keys resolve in O(1); unseen names are
+    # compared only against clusters sharing a blocking key, so adding
+    # mentions never scans the whole index. People block on surname stem and
+    # initial + stem; anything else (organisations, places) on the start of
+    # the whole name, and must match it almost exactly.
+
+    def __init__(self, path=None, threshold=88, organization_threshold=ORGANIZATION_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.organization_threshold = organization_threshold
+        self.clusters = {}
+        self.keys = {}
+        self.blocks = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != INDEX_VERSION:
+            return
+        for cid, cluster in data.get('clusters', {}).items():
+            person = cluster.get('person')
+            if person is None:
+                person = is_person(cluster['name'])
+            self.clusters[cid] = {"name": cluster['name'], "forms": dict(cluster['forms']), "person": person}
+            for form in cluster['forms']:
+                self._register(cid, form, person)
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            data = {"version": INDEX_VERSION, "clusters": self.clusters}
+            atomic_write_json(self.path, data)
+            self._dirty = False
+
+    def _blocking_keys(self, surname, initials):
+        yield "s:" + surname[:5]
+        for initial in initials:
+            yield f"i:{initial}:{surname[:3]}"
+
+    def _register(self, cid, form, person):
+        surname, initials, key = parse_name(form)
+        if not key:
+            return
+        self.keys[key] = cid
+        if person:
+            for block in self._blocking_keys(surname, initials):
+                self.blocks.setdefault(block, {})[surname, frozenset(initials)] = cid
+        else:
+            phrase = _phrase(form)
+            self.blocks.setdefault("o:" + phrase[:4], {})[phrase] = cid
+
+    def _match(self, surname, initials):
+        candidates = {}
+        for block in self._blocking_keys(surname, initials):
+            candidates.update(self.blocks.get(block, {}))
+        pairs = [(s, i, cid) for (s, i), cid in candidates.items() if _compatible((surname, initials), (s, i))]
+        found = _best_match(surname, [s for s, _, _ in pairs], self.threshold)
+        return pairs[found][2] if found is not None else None
+
+    def _match_other(self, phrase):
+        candidates = list(self.blocks.get("o:" + phrase[:4], {}).items())
+        found = _best_match(phrase, [p for p, _ in candidates], self.organization_threshold)
+        return candidates[found][1] if found is not None else None
+
+    def resolve(self, name, add=True, count=True, kind=None):
+        # Canonical display name for `name` (cleaned, if it is new and add=False).
+        # kind: the entity type, when extraction gave one (see is_person).
+        # count=False registers new forms without counting repeat readings
+        # of the same results (the visualization).
+        clean = strip_parenthetical(name)
+        if not clean:
+            return ""
+        surname, initials, key = parse_name(clean)
+        if not key:
+            return clean
+        person = is_person(clean, kind)
+        with self._lock:
+            cid = self.keys.get(key)
+            if cid is None:
+                cid = self._match(surname, initials) if person else self._match_other(_phrase(clean))
+                if not add:
+                    return self.clusters[cid]['name'] if cid else clean
+                if cid is None:
+                    cid = key
+                    self.clusters[cid] = {"name": clean, "forms": {}, "person": person}
+            cluster = self.clusters[cid]
+            if add:
+                forms = cluster['forms']
+                if clean not in forms:
+                    forms[clean] = 1
+                    self._register(cid, clean, cluster.get('person', person))
+                elif count:
+                    forms[clean] += 1
+                else:
+                    return cluster['name']
+                cluster['name'] = self._display(forms)
+                self._dirty = True
+            return cluster['name']
+
+    def _display(self, forms):
+        # Most frequent form; ties go to a form without a title and with more
+        # full words ("Иван Петров" over "Петров И." over "о. Петров").
+        def rank(item):
+            form, count = item
+            words = [w.strip('.').lower() for w in form.split()]
+            titled = bool(words) and words[0] in HONORIFICS and len(words) > 1
+            full = sum(1 for w in words if len(w) > 1 and w not in HONORIFICS)
+            return count, not titled, full, -len(words), form
+        return max(forms.items(), key=rank)[0]
+
+
+def open_index(directory, threshold=88):
+    return EntityIndex(os.path.join(directory, "entity_index.json"), threshold)
@@ -2,12 +2,29 @@ import os
 import sys
 import json
 import time
-import requests
+import queue
+import threading
+import contextlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import glob
-import yaml
 import argparse
-from pathlib import Path
-from litellm import completion
+
+import profiling
+
+from chunking import merge_extractions, split_markdown
+from dedup import DedupIndex
+from entity_index import open_index, strip_parenthetical
+from llm_cache import LLMCache, cache_key
+from journal import atomic_write, atomic_write_json, get_journal
+from json_stream import IncrementalJSONValidator
+from ordered_log import emit, log, log_live, map_ordered, map_streaming, run_captured
+import progress
+import scheduler
+from providers import available_chain, get_health, hedge_delay, provider_label
+from rate_limit import backoff_delay, classify_error, get_limiter, retry_after
+from schema import parse_llm_json, validate_extraction, validate_packed
+from store import ExtractionStore, content_hash
+from token_budget import count_tokens, plan_batches, projected_usage
 
 # Load .env (single source of truth for API key — local dev + CI)
 try:
@@ -46,6 +63,7 @@ DEFAULT_CONFIG_PATH = os.path.join(BASE_DIR, "config.yml")
 DEFAULT_PROMPT_PATH = os.path.join(BASE_DIR, "system_prompt.txt")
 
 def load_config(config_path=None):
+    import yaml
     use_path = config_path if config_path else DEFAULT_CONFIG_PATH
     
     # Defaults
@@ -56,6 +74,44 @@ def load_config(config_path=None):
             "temperature": 0.1,
             "timeout": 600,
             "base_url": "https://openrouter.ai/api/v1",
+            "max_concurrency": 4,
+            "chunk_tokens": 5000,
+            "context_tokens": 32000,
+            "packing": True,
+            "pack_max_docs": 6,
+            "pack_doc_tokens": 1500,
+            "output_tokens_per_doc": 1500,
+            "max_retries": 5,
+            "fallbacks": [],
+            "hedging": True,
+            "hedge_default_delay": 90,
+            "hedge_min_delay": 10,
+            "health_failures": 3,
+            "health_cooldown": 300,
+            "stream": True,
+            "stream_progress_interval": 10,
+        },
+        "rate_limits": {
+            "openrouter": {"rpm": 20, "tpm": 0},
+            "default": {"rpm": 0, "tpm": 0},
+        },
+        "cache": {
+            "enabled": True,
+            "dir": "",
+            "max_size_mb": 500,
+        },
+        "store": {
+            "enabled": False,
+            "path": "",
+        },
+        "entities": {
+            "index": True,
+            "threshold": 88,
+        },
+        "dedup": {
+            "enabled": True,
+            "threshold": 0.85,
+            "action": "link",
         }
     }
     
@@ -67,13 +123,17 @@ def load_config(config_path=None):
                     if 'llm_settings' in user_config:
                         default_config['llm_settings'].update(user_config['llm_settings'])
                     for k, v in user_config.items():
-                        if k != 'llm_settings':
+                        if k == 'llm_settings':
+                            continue
+                        if isinstance(v, dict) and isinstance(default_config.get(k), dict):
+                            default_config[k].update(v)
+                        else:
                             default_config[k] = v
         else:
-            print(f"Config not found at {use_path}, using defaults.")
+            log(f"Config not found at {use_path}, using defaults.")
             
     except Exception as e:
-        print(f"Warning: Could not load config.yml: {e}")
+        log(f"Warning: Could not load config.yml: {e}")
     
     # Inject API key from env var (single source of truth)
     env_key = os.environ.get('OPENROUTER_API_KEY', '') or ''
@@ -114,7 +174,7 @@ def load_system_prompt(prompt_path=None):
         with open(use_path, 'r', encoding='utf-8') as f:
             return f.read()
     else:
-        print(f"Warning: system_prompt.txt not found at {use_path}. Using default.")
+        log(f"Warning: system_prompt.txt not found at {use_path}. Using default.")
         return """Ты — историк-архивист. Твоя задача — провести комплексный критический анализ исторического источника и извлечь из него структурированные данные.
 
 1. ВЕРНИ ОТВЕТ В ФОРМАТЕ JSON.
@@ -154,19 +214,42 @@ def load_system_prompt(prompt_path=None):
 # We'll reload it in main if path is provided.
 SYSTEM_PROMPT = load_system_prompt()
 
+# Caps in-flight LLM requests across documents and their chunks; set in main().
+REQUEST_SLOTS = threading.BoundedSemaphore(1)
+
+# Alias index shared with the visualization; set in main().
+ENTITY_INDEX = None
+
+def get_max_concurrency(config):
+    try:
+        return max(1, int(config.get('llm_settings', {}).get('max_concurrency', 1)))
+    except (TypeError, ValueError):
+        return 1
+
 def normalize_name(name):
-    if not name: return ""
-    if "(" in name:
-        return name.split("(")[0].strip()
-    return name.strip()
+    return strip_parenthetical(name)
 
-def process_text_with_llm(text, config):
-    llm_settings = config.get('llm_settings', {})
+_litellm_completion = None
+
+def preload():
+    # litellm takes seconds to import; only runs that actually call the
+    # LLM pay for it (cache hits, resume and --help do not). The --serve
+    # worker calls this once in the background instead.
+    global _litellm_completion
+    if _litellm_completion is None:
+        started = time.perf_counter()
+        from litellm import completion as litellm_completion
+        profiling.record_import('litellm', time.perf_counter() - started)
+        _litellm_completion = litellm_completion
+    return _litellm_completion
+
+def completion(**request):
+    return preload()(**request)
+
+def resolve_model(llm_settings):
     provider = llm_settings.get('provider', 'openai')
     model = llm_settings.get('model', 'gpt-4o')
-    temperature = llm_settings.get('temperature', 0.1)
-    timeout = llm_settings.get('timeout', 600)
-    
+
     # Construct model string for litellm
     if provider == 'ollama':
         model_name = f"ollama/{model}"
@@ -174,82 +257,405 @@ def process_text_with_llm(text, config):
     elif provider == 'openrouter':
         model_name = f"openrouter/{model}"
         api_base = llm_settings.get('base_url', "https://openrouter.ai/api/v1")
+    elif provider == 'openai_compatible':
+        # Any server speaking the OpenAI chat-completions protocol
+        # (LM Studio, vLLM, scripts/mock_llm_server.py)
+        model_name = f"openai/{model}"
+        api_base = llm_settings.get('base_url', "http://127.0.0.1:8765/v1")
     else:
         model_name = model
         api_base = None
+    return provider, model_name, api_base
 
-    if not llm_settings.get('api_key') and provider != 'ollama':
-        print(f"ОШИБКА: API key не найден для провайдера {provider}.")
-        print("Пожалуйста, укажите ключ в настройках приложения.")
-        return None
+_formatted_prompt = (None, None)
+
+def format_system_prompt():
+    # Formatted once per prompt text, not for every request and cache key.
+    global _formatted_prompt
+    if _formatted_prompt[0] != SYSTEM_PROMPT:
+        _formatted_prompt = (SYSTEM_PROMPT, SYSTEM_PROMPT.format(
+            topics_list=json.dumps(TOPICS_LIST, ensure_ascii=False, indent=2)))
+    return _formatted_prompt[1]
+
+def document_message(text):
+    return f"Текст документа:\n\n{text}"
+
+def request_cache_key(user_content, config):
+    # Keyed on the configured model: an answer from a fallback provider is
+    # stored under the same key, since that is the one the next run reads.
+    llm_settings = config.get('llm_settings', {})
+    _, model_name, _ = resolve_model(llm_settings)
+    return cache_key(user_content, format_system_prompt(), model_name,
+                     llm_settings.get('temperature', 0.1), TOPICS_LIST)
 
-    print(f"Calling LLM ({model_name})...")
+def normalize_extraction(data):
+    # Expects schema-validated data: every field below is present.
+    meta = data['metadata']
+    meta['author'] = normalize_name(meta['author'])
+    
+    # Normalize entities list
+    for ent in meta['entities']:
+        ent['name'] = normalize_name(ent['name'])
+    
+    # Normalize relationships
+    for rel in meta['relationships']:
+        rel['source'] = normalize_name(rel['source'])
+        rel['target'] = normalize_name(rel['target'])
     
+    # Normalize events
+    for evt in meta['events']:
+        evt['actor'] = normalize_name(evt['actor'])
+        evt['target'] = normalize_name(evt['target'])
+    return data
+
+def canonicalize_names(data, index):
+    # Alias index pass at save time, so cached and fresh results alike end
+    # up with the canonical names ("о. Стельмашенко" -> "Стельмашенко").
+    if index is None:
+        return data
+    # People and organisations are matched differently; relationships and
+    # events take the type of the entity of the same name.
+    meta = data.get('metadata', {})
+    kinds = {ent.get('name'): ent.get('type') for ent in meta.get('entities', [])}
+    if meta.get('author'):
+        meta['author'] = index.resolve(meta['author'], kind=kinds.get(meta['author']))
+    for ent in meta.get('entities', []):
+        ent['name'] = index.resolve(ent['name'], kind=ent.get('type'))
+    for rel in meta.get('relationships', []):
+        rel['source'] = index.resolve(rel['source'], kind=kinds.get(rel['source']))
+        rel['target'] = index.resolve(rel['target'], kind=kinds.get(rel['target']))
+    for evt in meta.get('events', []):
+        evt['actor'] = index.resolve(evt['actor'], kind=kinds.get(evt['actor']))
+        evt['target'] = index.resolve(evt['target'], kind=kinds.get(evt['target']))
+    return data
+
+def extraction_messages(text, config):
+    # The user messages a document is extracted with: the whole text, or one
+    # per token-budgeted chunk of a long document. Each is a cache key.
+    chunk_tokens = int(config.get('llm_settings', {}).get('chunk_tokens', 5000))
+    chunks = split_markdown(text, chunk_tokens, count_tokens)
+    if len(chunks) == 1:
+        return [document_message(text)]
+    total = len(chunks)
+    return [f"Текст документа (фрагмент {i} из {total}):\n\n{chunk}" for i, chunk in enumerate(chunks, 1)]
+
+def process_text_with_llm(text, config, cache=None, refresh=False):
+    # Long documents are split into token-budgeted chunks that are extracted
+    # in parallel and merged, instead of truncating everything past the limit.
+    messages = extraction_messages(text, config)
+    if len(messages) == 1:
+        return request_extraction(messages[0], config, cache, refresh)
+
+    if cache is not None and not refresh:
+        # Answered whole before, in a packed request.
+        cached = cache.get(request_cache_key(document_message(text), config))
+        if cached is not None:
+            log("Ответ взят из кэша (весь документ)")
+            return cached
+    total = len(messages)
+    chunk_tokens = int(config.get('llm_settings', {}).get('chunk_tokens', 5000))
+    log(f"Длинный документ: {total} фрагментов по ~{chunk_tokens} токенов")
+    counters = progress.counters()
+
+    def run_chunk(message):
+        progress.use_counters(counters)
+        return request_extraction(message, config, cache, refresh)
+
+    results = map_ordered(
+        run_chunk,
+        messages,
+        max_workers=get_max_concurrency(config),
+    )
+    failed = [i for i, r in enumerate(results, 1) if not r]
+    if failed:
+        log(f"Не удалось обработать фрагменты {failed} — документ пропущен (успешные фрагменты сохранены в кэше)")
+        return None
+    return merge_extractions(results, TOPICS_LIST)
+
+def request_extraction(user_content, config, cache=None, refresh=False):
+    key = None
+    if cache is not None:
+        key = request_cache_key(user_content, config)
+        if not refresh:
+            cached = cache.get(key)
+            if cached is not None:
+                log(f"Ответ взят из кэша ({key[:12]})")
+                return cached
+
+    messages = [
+        {"role": "system", "content": format_system_prompt()},
+        {"role": "user", "content": user_content}
+    ]
+    data, _ = call_llm_json(messages, config,
+                            validate=lambda d, w: normalize_extraction(validate_extraction(d, w)))
+
+    if data is not None and cache is not None:
+        cache_put(cache, key, data)
+    return data
+
+PACKED_INSTRUCTIONS = """
+
+В ЭТОМ ЗАПРОСЕ НЕСКОЛЬКО НЕЗАВИСИМЫХ ДОКУМЕНТОВ. Каждый начинается строкой "=== ДОКУМЕНТ <id> ===".
+Проанализируй каждый документ отдельно и верни один JSON вида
+{"documents": [{"id": "<id>", "metadata": {...}, "analysis": "..."}]}
+где metadata и analysis имеют описанную выше структуру — ровно один элемент на каждый документ, в том же порядке."""
+
+def request_packed_extraction(texts, config, cache=None):
+    # One request for several small documents; returns one result slot per
+    # text (None where the model skipped or mangled that document).
+    ids = [str(i) for i in range(1, len(texts) + 1)]
+    user_content = "\n\n".join(f"=== ДОКУМЕНТ {doc_id} ===\n{text}" for doc_id, text in zip(ids, texts))
     messages = [
-        {"role": "system", "content": SYSTEM_PROMPT.format(topics_list=json.dumps(TOPICS_LIST, ensure_ascii=False, indent=2))},
-        {"role": "user", "content": f"Текст документа:\n\n{text[:15000]}"}
+        {"role": "system", "content": format_system_prompt() + PACKED_INSTRUCTIONS},
+        {"role": "user", "content": user_content}
     ]
+    data, _ = call_llm_json(messages, config, validate=validate_packed)
+    slots = [None] * len(texts)
+    if not data:
+        return slots
 
-    max_retries = 5
+    for item in data['documents']:
+        if item['id'] not in ids or slots[ids.index(item['id'])] is not None:
+            continue
+        index = ids.index(item['id'])
+        result = normalize_extraction({"metadata": item['metadata'], "analysis": item['analysis']})
+        slots[index] = result
+        if cache is not None:
+            cache_put(cache, request_cache_key(document_message(texts[index]), config), result)
+    return slots
+
+def cache_put(cache, key, data):
+    try:
+        cache.put(key, data)
+    except OSError as e:
+        log(f"Не удалось записать кэш: {e}")
+
+def call_llm_json(messages, config, validate=None):
+    # Walks the provider chain (llm_settings + llm_settings.fallbacks). With
+    # hedging on, a backup request is fired once the primary has been slower
+    # than its p95 latency, and the first valid JSON wins.
+    # Returns (data, model_name of the provider that answered).
+    llm_settings = config.get('llm_settings', {})
+    chain = available_chain(llm_settings)
+    if llm_settings.get('hedging', True) and len(chain) > 1:
+        return hedged_call(messages, chain, config, validate)
+
+    for i, settings in enumerate(chain):
+        data = call_provider_json(messages, settings, config, validate)
+        if data is not None:
+            return data, resolve_model(settings)[1]
+        if i + 1 < len(chain):
+            log(f"Переключение на резервного провайдера {provider_label(chain[i + 1])}...")
+    return None, None
+
+def hedged_call(messages, chain, config, validate):
+    primary, backups = chain[0], list(chain[1:])
+    delay = hedge_delay(config.get('llm_settings', {}), primary)
+    counters = progress.counters()
+
+    def call(racer):
+        settings, stop, hedge = racer
+        progress.use_counters(counters)
+        return call_provider_json(messages, settings, config, validate, stop=stop, hedge=hedge)
+
+    # Both racers log into their own buffers; only the winner's lines (and
+    # those of finished losers) reach the document log. The loser is told
+    # to stop, which frees its request slot at the next streamed chunk.
+    pool = ThreadPoolExecutor(max_workers=len(chain))
+    stops = []
+    try:
+        def launch(settings, hedge=False):
+            stop = threading.Event()
+            stops.append(stop)
+            running[pool.submit(run_captured, call, (settings, stop, hedge))] = settings
+
+        running = {}
+        launch(primary)
+        done, _ = wait(running, timeout=delay)
+        if not done:
+            log(f"{provider_label(primary)} не ответил за {delay:.0f} сек (p95) — резервный запрос к {provider_label(backups[0])}")
+            # Not queued behind the slow primary for a request slot.
+            launch(backups.pop(0), hedge=True)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                settings = running.pop(future)
+                data, lines, error = future.result()
+                emit(lines)
+                if error is None and data is not None:
+                    if running:
+                        log(f"Ответ получен от {provider_label(settings)}, второй запрос отброшен")
+                    return data, resolve_model(settings)[1]
+                # A racer failed: its slot goes to the next backup, if any.
+                if backups:
+                    log(f"Переключение на резервного провайдера {provider_label(backups[0])}...")
+                    launch(backups.pop(0))
+        return None, None
+    finally:
+        for stop in stops:
+            stop.set()
+        pool.shutdown(wait=False)
+
+class StreamAborted(Exception):
+    # Streamed output can no longer become valid JSON, even repaired; retryable.
+    pass
+
+class RequestCancelled(Exception):
+    # The other racer of a hedged call already answered.
+    pass
+
+def stream_content(label, progress_interval, stop=None, **request):
+    # Streams the completion through the incremental validator. Aborts as
+    # soon as the object turns unrepairable and stops reading once the top-level
+    # object is closed, or when `stop` is set. Returns the text and timing
+    # stats.
+    validator = IncrementalJSONValidator()
+    started = time.monotonic()
+    first_byte = None
+    pieces = 0
+    last_report = started
+    response = completion(stream=True, **request)
+    try:
+        for chunk in response:
+            choices = getattr(chunk, 'choices', None)
+            if stop is not None and stop.is_set():
+                raise RequestCancelled()
+            delta = choices[0].delta.content if choices else None
+            if not delta:
+                continue
+            now = time.monotonic()
+            if first_byte is None:
+                first_byte = now - started
+            pieces += 1
+            if not validator.feed(delta):
+                raise StreamAborted(f"поток прерван после ~{pieces} токенов: {validator.error}")
+            if validator.complete:
+                break
+            if progress_interval and now - last_report >= progress_interval:
+                log_live(f"  {label}: получено ~{pieces} токенов за {now - started:.0f} сек")
+                last_report = now
+    finally:
+        close = getattr(response, 'close', None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+    stats = {
+        "ttfb": first_byte,
+        "duration": time.monotonic() - started,
+        "tokens": pieces,
+    }
+    # Once the object is closed, anything after it (closing fence, chatter) is dropped.
+    return validator.json_text() if validator.complete else validator.text, stats
+
+def call_provider_json(messages, llm_settings, config, validate=None, stop=None, hedge=False):
+    # stop: an Event that ends the attempts early (returns None); hedge: a
+    # backup request of a hedged call, sent without waiting for a slot.
+    provider, model_name, api_base = resolve_model(llm_settings)
+    label = provider_label(llm_settings)
+    health = get_health(config.get('llm_settings', {}))
+    temperature = llm_settings.get('temperature', 0.1)
+    timeout = llm_settings.get('timeout', 600)
+
+    if not llm_settings.get('api_key') and provider not in ('ollama', 'openai_compatible'):
+        log(f"ОШИБКА: API key не найден для провайдера {provider}.")
+        log("Пожалуйста, укажите ключ в настройках приложения.")
+        return None
+
+    log(f"Calling LLM ({model_name})...")
+
+    limiter = get_limiter(provider, config)
+    prompt_tokens = [count_tokens(m['content']) for m in messages]
+    estimated_tokens = sum(prompt_tokens) + int(llm_settings.get('output_tokens_per_doc', 1500))
+
+    streaming = llm_settings.get('stream', True)
+    progress_interval = float(llm_settings.get('stream_progress_interval', 10))
+    request = dict(
+        model=model_name,
+        messages=messages,
+        temperature=temperature,
+        api_base=api_base,
+        api_key=llm_settings.get('api_key') or ("none" if provider == 'openai_compatible' else None),
+        timeout=timeout,
+        response_format={"type": "json_object"}
+    )
+
+    stop = stop or threading.Event()
+    slot = contextlib.nullcontext() if hedge else REQUEST_SLOTS
+    max_retries = int(llm_settings.get('max_retries', 5))
     for attempt in range(max_retries):
+        if stop.is_set():
+            return None
         try:
-            response = completion(
-                model=model_name,
-                messages=messages,
-                temperature=temperature,
-                api_base=api_base,
-                api_key=llm_settings.get('api_key'),
-                timeout=timeout,
-                response_format={"type": "json_object"}
-            )
-            content = response.choices[0].message.content
-            # Clean up potential markdown code blocks
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-                
-            data = json.loads(content)
-            
-            # Normalize entities
-            if 'metadata' in data:
-                meta = data['metadata']
-                if 'author' in meta: meta['author'] = normalize_name(meta['author'])
-                
-                # Normalize entities list
-                if 'entities' in meta:
-                    for ent in meta['entities']:
-                        ent['name'] = normalize_name(ent['name'])
-                
-                # Normalize relationships
-                if 'relationships' in meta:
-                    for rel in meta['relationships']:
-                        rel['source'] = normalize_name(rel['source'])
-                        rel['target'] = normalize_name(rel['target'])
-                
-                # Normalize events
-                if 'events' in meta:
-                    for evt in meta['events']:
-                        evt['actor'] = normalize_name(evt['actor'])
-                        evt['target'] = normalize_name(evt['target'])
-                        
+            with profiling.section('rate_limit_wait'):
+                limiter.acquire(estimated_tokens)
+            started = time.monotonic()
+            with profiling.section('llm_wait'), slot:
+                if stop.is_set():
+                    return None
+                if streaming:
+                    content, stats = stream_content(label, progress_interval, stop, **request)
+                    used_tokens = None
+                else:
+                    response = completion(**request)
+                    content = response.choices[0].message.content
+                    used_tokens = getattr(getattr(response, 'usage', None), 'total_tokens', None)
+                    if stop.is_set():
+                        return None
+            elapsed = time.monotonic() - started
+            health.record_success(label, elapsed)
+            # Latency history of this provider:model, sized by the document
+            # text like the plans that read it (scheduler.py).
+            scheduler.open_model().record('extract', label, prompt_tokens[-1], elapsed)
+            limiter.succeeded(estimated_tokens, used_tokens)
+            progress.add(tokens=used_tokens or (stats['tokens'] if streaming else estimated_tokens))
+            if streaming:
+                ttfb = f"{stats['ttfb']:.1f}" if stats['ttfb'] is not None else "—"
+                log(f"Ответ {label}: первый байт через {ttfb} сек, всего {stats['duration']:.1f} сек, ~{stats['tokens']} токенов")
+            # Repair what can be repaired (fences, truncation, missing optional
+            # fields, malformed list items); only unusable output is re-requested.
+            warnings = []
+            with profiling.section('parse_validate'):
+                data = parse_llm_json(content, warnings)
+                if validate is not None:
+                    data = validate(data, warnings)
+            for warning in warnings:
+                log(f"  Исправлено в ответе: {warning}")
             return data
+        except RequestCancelled:
+            return None
         except Exception as e:
-            print(f"Ошибка вызова LLM (Попытка {attempt+1}/{max_retries}): {e}")
+            log(f"Ошибка вызова LLM (Попытка {attempt+1}/{max_retries}): {e}")
+            kind = classify_error(e)
+            if kind == 'fatal':
+                log("Ошибка не исправится повтором (ключ, модель или запрос) — прекращаем попытки.")
+                health.record_failure(label)
+                return None
             if attempt < max_retries - 1:
-                # Exponential backoff: 5, 10, 20, 40 seconds
-                wait_time = 5 * (2 ** attempt)
-                print(f"Повтор через {wait_time} сек...")
-                time.sleep(wait_time)
+                hinted = retry_after(e)
+                if kind == 'rate_limit':
+                    # Pause every worker on this provider, not just this one
+                    limiter.rate_limited(hinted if hinted is not None else backoff_delay(attempt))
+                wait_time = backoff_delay(attempt, hinted)
+                progress.add(retries=1)
+                log(f"Повтор через {wait_time:.1f} сек...")
+                if stop.wait(wait_time):
+                    return None
             else:
-                print("Не удалось получить ответ от LLM после всех попыток.")
+                log("Не удалось получить ответ от LLM после всех попыток.")
+                if health.record_failure(label):
+                    log(f"{label} временно исключён из цепочки провайдеров")
                 return None
 
-def save_json(data, filename, output_dir):
+def save_json(data, filename, output_dir, store=None, doc_hash=None):
     path = os.path.join(output_dir, filename)
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"Сохранен JSON: {path}")
+    if doc_hash:
+        data['source_hash'] = doc_hash  # what existing_extraction() compares against
+    atomic_write_json(path, data)
+    log(f"Сохранен JSON: {path}")
+    if store is not None:
+        store.save(os.path.splitext(filename)[0], data, doc_hash)
 
 def save_processed_md(original_content, data, filename, output_dir):
     # Construct YAML frontmatter
@@ -275,15 +681,341 @@ def save_processed_md(original_content, data, filename, output_dir):
     content = yaml_front + analysis + mentions + "\n\n# Оригинальный текст\n\n" + original_content
     
     path = os.path.join(output_dir, filename)
-    with open(path, 'w', encoding='utf-8') as f:
-        f.write(content)
-    print(f"Сохранен обработанный MD: {path}")
+    atomic_write(path, content)
+    log(f"Сохранен обработанный MD: {path}")
+
+def render_md(content, data, filename, output_dir, journal=None):
+    # Keyed by the extraction as well as the source: a re-extracted document
+    # (--refresh, a later job of the --serve worker) is rendered again.
+    doc = os.path.splitext(filename)[0]
+    key = content_hash(content + "\0" + json.dumps(data, ensure_ascii=False, sort_keys=True))
+    if journal is not None:
+        if journal.is_done(doc, 'render', key) and os.path.exists(os.path.join(output_dir, filename)):
+            log(f"Пропуск {filename}: Markdown уже сгенерирован")
+            progress.stage_event(doc, 'render', 'skipped')
+            return
+        journal.start(doc, 'render', key)
+    save_processed_md(content, data, filename, output_dir)
+    if journal is not None:
+        journal.done(doc, 'render', key, bytes=os.path.getsize(os.path.join(output_dir, filename)))
+
+def save_result(data, content, filename, json_output_dir, processed_md_dir, store=None, journal=None):
+    doc_hash = content_hash(content)
+    canonicalize_names(data, ENTITY_INDEX)
+    save_json(data, filename.replace('.md', '.json'), json_output_dir, store, doc_hash)
+    if journal is not None:
+        journal.done(os.path.splitext(filename)[0], 'extract', doc_hash, bytes=len(content.encode('utf-8')))
+    render_md(content, data, filename, processed_md_dir, journal)
+
+_caches = {}
+
+def open_cache(config, input_dir):
+    # One instance per folder and process, so a long-lived worker keeps the
+    # cache's size accounting between runs.
+    cache_settings = config.get('cache', {})
+    if not cache_settings.get('enabled', True):
+        return None
+    cache_dir = os.path.abspath(cache_settings.get('dir') or os.path.join(input_dir, ".llm_cache"))
+    max_bytes = int(float(cache_settings.get('max_size_mb', 500)) * 1024 * 1024)
+    if (cache_dir, max_bytes) not in _caches:
+        _caches[cache_dir, max_bytes] = LLMCache(cache_dir, max_bytes)
+    return _caches[cache_dir, max_bytes]
 
-def main(args_list=None):
+def store_path(config, input_dir):
+    store_settings = config.get('store', {})
+    if not store_settings.get('enabled', False):
+        return None
+    return store_settings.get('path') or os.path.join(input_dir, "extraction.sqlite")
+
+def open_store(config, input_dir):
+    path = store_path(config, input_dir)
+    return ExtractionStore(path) if path else None
+
+def open_entity_index(config, input_dir):
+    entity_settings = config.get('entities', {})
+    if not entity_settings.get('index', True):
+        return None
+    return open_index(input_dir, float(entity_settings.get('threshold', 88)))
+
+def open_dedup(config, input_dir):
+    dedup_settings = config.get('dedup', {})
+    if not dedup_settings.get('enabled', True):
+        return None
+    return DedupIndex(os.path.join(input_dir, ".dedup_index.json"), float(dedup_settings.get('threshold', 0.85)))
+
+def find_duplicates(files, index):
+    # Returns {file_path: (original_name, similarity)}. Files are visited in
+    # name order, so the first copy of a document stays the original.
+    index.prune({os.path.splitext(os.path.basename(p))[0] for p in files})
+    duplicates = {}
+    for file_path in sorted(files):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        match = index.classify(name, content_hash(content), content)
+        if match:
+            duplicates[file_path] = match
+            log(f"Почти дубликат: {os.path.basename(file_path)} ≈ {match[0]} (сходство {match[1]:.0%})")
+    index.save()
+    return duplicates
+
+def link_duplicates(duplicates, action, json_output_dir, processed_md_dir, store=None, journal=None):
+    # link: the duplicate gets a copy of the original's extraction;
+    # flag: its own extraction is kept. Both are marked duplicate_of, which
+    # the visualization skips.
+    for file_path, (original, score) in sorted(duplicates.items()):
+        filename = os.path.basename(file_path)
+        json_filename = filename.replace('.md', '.json')
+        source = original + ".json" if action == 'link' else json_filename
+        data = load_full_json(os.path.join(json_output_dir, source))
+        if data is None:
+            log(f"{filename}: нет результата для {source} — дубликат не связан")
+            continue
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        data = dict(data, duplicate_of=original, duplicate_similarity=round(score, 3))
+        save_json(data, json_filename, json_output_dir, store, content_hash(content))
+        if action == 'link':
+            render_md(content, data, filename, processed_md_dir, journal)
+
+def load_full_json(json_path):
+    if not os.path.exists(json_path):
+        return None
+    # Try to load full data from JSON
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            existing_data = json.load(f)
+        
+        # Check if it is full data (has 'metadata' and 'analysis')
+        if 'metadata' in existing_data and 'analysis' in existing_data:
+            return existing_data
+    except Exception as e:
+        log(f"Ошибка чтения JSON {json_path}: {e}")
+    return None
+
+def resumed_extraction(journal, filename, doc_hash, json_path):
+    # JSON the journal recorded as complete for exactly this content.
+    if journal is None or not journal.is_done(os.path.splitext(filename)[0], 'extract', doc_hash):
+        return None
+    return load_full_json(json_path)
+
+def existing_extraction(json_path, doc_hash, store=None):
+    # JSON on disk for this content: the source hash recorded with it (or by
+    # the store) matches. JSON written before hashes were recorded is
+    # trusted, as it was before the cache existed.
+    data = load_full_json(json_path)
+    if data is None:
+        return None
+    recorded = data.get('source_hash')
+    if recorded is None and store is not None:
+        recorded = store.document_hash(os.path.splitext(os.path.basename(json_path))[0])
+    return data if recorded in (None, doc_hash) else None
+
+def cached_extraction(content, config, cache):
+    # A packed request stores each document under its whole-text key; a long
+    # document is cached chunk by chunk and needs every chunk.
+    if cache is None:
+        return False
+    if cache.get(request_cache_key(document_message(content), config)) is not None:
+        return True
+    messages = extraction_messages(content, config)
+    return len(messages) > 1 and all(cache.get(request_cache_key(m, config)) is not None for m in messages)
+
+def needs_llm(content, json_path, config, cache=None, refresh=False, journal=None, store=None):
+    if refresh:
+        return True
+    doc_hash = content_hash(content)
+    if resumed_extraction(journal, os.path.basename(json_path), doc_hash, json_path):
+        return False
+    if cached_extraction(content, config, cache):
+        return False
+    return existing_extraction(json_path, doc_hash, store) is None
+
+def process_file(file_path, config, json_output_dir, processed_md_dir, cache=None, refresh=False, store=None,
+                 journal=None):
+    filename = os.path.basename(file_path)
+    
+    # Skip already processed if needed, or just overwrite?
+    # Logic: Check if json exists and has metadata
+    json_filename = filename.replace('.md', '.json')
+    json_path = os.path.join(json_output_dir, json_filename)
+    
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    doc_hash = content_hash(content)
+
+    # A resumed run trusts the journal for documents it finished. A cached
+    # answer for the current model/prompt wins over the JSON on disk; without
+    # one (cache cleared or evicted, first run with the cache) the JSON for
+    # the same content is reused. Only --refresh asks the LLM again.
+    existing_data = None if refresh else resumed_extraction(journal, filename, doc_hash, json_path)
+    if existing_data is None and not refresh and not cached_extraction(content, config, cache):
+        existing_data = existing_extraction(json_path, doc_hash, store)
+    if existing_data:
+        progress.stage_event(os.path.splitext(filename)[0], 'extract', 'skipped')
+        log(f"Генерация Markdown из существующего JSON для {filename}...")
+        render_md(content, existing_data, filename, processed_md_dir, journal)
+        if store is not None and store.document_hash(os.path.splitext(json_filename)[0]) != doc_hash:
+            store.save(os.path.splitext(json_filename)[0], existing_data, doc_hash)
+        return True
+
+    log(f"Обработка {filename} с помощью ИИ...")
+    if journal is not None:
+        journal.start(os.path.splitext(filename)[0], 'extract', doc_hash)
+    full_data = process_text_with_llm(content, config, cache=cache, refresh=refresh)
+        
+    if full_data:
+        save_result(full_data, content, filename, json_output_dir, processed_md_dir, store, journal)
+        return True
+    else:
+        if journal is not None:
+            journal.failed(os.path.splitext(filename)[0], 'extract')
+        log(f"Skipping {filename}")
+        return False
+
+def process_batch(file_paths, config, json_output_dir, processed_md_dir, cache=None, refresh=False, store=None,
+                  journal=None):
+    contents = []
+    for file_path in file_paths:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            contents.append(f.read())
+
+    names = [os.path.basename(p) for p in file_paths]
+    log(f"Пакетная обработка {len(names)} документов с помощью ИИ: {', '.join(names)}")
+    if journal is not None:
+        for name, content in zip(names, contents):
+            journal.start(os.path.splitext(name)[0], 'extract', content_hash(content))
+    slots = request_packed_extraction(contents, config, cache)
+
+    ok = True
+    for file_path, content, data in zip(file_paths, contents, slots):
+        filename = os.path.basename(file_path)
+        if data:
+            save_result(data, content, filename, json_output_dir, processed_md_dir, store, journal)
+        else:
+            log(f"{filename}: нет результата в пакетном ответе, отдельный запрос...")
+            ok = process_file(file_path, config, json_output_dir, processed_md_dir, cache, refresh, store,
+                              journal) and ok
+    return ok
+
+def doc_name(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+def schedule_batches(batches, doc_tokens, config):
+    # Predicts each request from its token count and the history of the
+    # configured model; with parallel requests the longest go first.
+    # Returns (batches, predicted seconds for all of them).
+    llm_settings = config.get('llm_settings', {})
+    model = scheduler.open_model()
+    key = provider_label(llm_settings)
+    workers = get_max_concurrency(config)
+    costs, predicted, request_tokens = {}, {}, {}
+    for batch in batches:
+        tokens = sum(doc_tokens[p] for p in batch)
+        request_tokens[tuple(batch)] = tokens
+        seconds = model.predict('extract', key, tokens)
+        if seconds is None:
+            seconds = progress.seconds_per_doc('extract') * len(batch)
+        predicted[tuple(batch)] = seconds
+        for file_path in batch:
+            costs[doc_name(file_path)] = seconds / len(batch)
+    progress.expect('extract', costs, workers)
+    if workers > 1:
+        batches = scheduler.longest_first(batches, lambda b: (predicted[tuple(b)], request_tokens[tuple(b)]))
+    return batches, sum(predicted.values())
+
+def plan_work(files, config, json_output_dir, cache=None, refresh=False, journal=None, store=None):
+    # Counts tokens for every document that actually needs the LLM and packs
+    # the small ones into shared requests. Returns batches of file paths.
+    ready, pending = [], []
+    for file_path in files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        json_path = os.path.join(json_output_dir, os.path.basename(file_path).replace('.md', '.json'))
+        if needs_llm(content, json_path, config, cache, refresh, journal, store):
+            pending.append((file_path, count_tokens(content)))
+        else:
+            ready.append([file_path])
+    # Nothing to ask the LLM: these only cost rendering.
+    progress.expect('extract', {doc_name(batch[0]): 0.0 for batch in ready})
+
+    if not pending:
+        return ready
+
+    system_tokens = count_tokens(format_system_prompt())
+    doc_tokens = dict(pending)
+    batches = plan_batches(pending, system_tokens, config.get('llm_settings', {}))
+    usage = projected_usage(batches, doc_tokens, system_tokens, count_tokens(PACKED_INSTRUCTIONS))
+    batches, seconds = schedule_batches(batches, doc_tokens, config)
+    seconds = round(seconds / get_max_concurrency(config))
+    log(f"План: {usage['documents']} документов для ИИ → {usage['requests']} запросов; "
+        f"промпт ~{usage['prompt_tokens']} токенов (без упаковки ~{usage['prompt_tokens_unpacked']}); "
+        f"оценка ~{seconds // 60} мин {seconds % 60} сек")
+    return ready + batches
+
+def stream_work(source, config, json_output_dir, cache=None, refresh=False, journal=None, dedup=None,
+                duplicates=None, store=None):
+    # Batches for documents arriving on `source` (a queue of .md paths ended
+    # by None) while conversion is still running; a path that comes again
+    # (changed under --watch) is looked at again. Documents already waiting
+    # are packed together; one that arrives alone is sent alone rather than
+    # held back for company.
+    llm_settings = config.get('llm_settings', {})
+    skip_duplicates = config.get('dedup', {}).get('action', 'link') != 'flag'
+    window = max(1, int(llm_settings.get('pack_max_docs', 6)))
+    system_tokens = None
+    finished = False
+    while not finished:
+        arrived = [source.get()]
+        while arrived[-1] is not None and len(arrived) < window:
+            try:
+                arrived.append(source.get_nowait())
+            except queue.Empty:
+                break
+        pending = []
+        for file_path in arrived:
+            if file_path is None:
+                finished = True
+                break
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            name = os.path.splitext(os.path.basename(file_path))[0]
+            match = dedup.classify(name, content_hash(content), content) if dedup is not None else None
+            if match:
+                duplicates[file_path] = match
+                log(f"Почти дубликат: {os.path.basename(file_path)} ≈ {match[0]} (сходство {match[1]:.0%})")
+                if skip_duplicates:
+                    progress.stage_event(name, 'extract', 'skipped')
+                    continue
+            json_path = os.path.join(json_output_dir, os.path.basename(file_path).replace('.md', '.json'))
+            if needs_llm(content, json_path, config, cache, refresh, journal, store):
+                pending.append((file_path, count_tokens(content)))
+            else:
+                progress.expect('extract', {name: 0.0})
+                yield [file_path]
+        if pending:
+            if system_tokens is None:
+                system_tokens = count_tokens(format_system_prompt())
+            batches = plan_batches(pending, system_tokens, llm_settings)
+            yield from schedule_batches(batches, dict(pending), config)[0]
+    if dedup is not None:
+        dedup.save()
+
+def main(args_list=None, source=None):
+    # source: a queue of .md paths (ended by None) filled by a running
+    # conversion; documents are then extracted as they arrive instead of
+    # after globbing the input folder.
     parser = argparse.ArgumentParser(description="Extract data from Markdown files using LLM.")
     parser.add_argument("--base-dir", help="Base directory for input/output files. If provided, overrides default paths.")
     parser.add_argument("--config-path", help="Path to config.yml")
     parser.add_argument("--system-prompt-path", help="Path to system_prompt.txt")
+    parser.add_argument("--max-concurrency", type=int, help="Max parallel LLM requests (overrides llm_settings.max_concurrency)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the LLM response cache")
+    parser.add_argument("--refresh", action="store_true", help="Ignore existing JSON and cached responses, re-request everything")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run from its job journal")
+    parser.add_argument("--progress-format", choices=["text", "jsonl"], default="text",
+                        help="jsonl: also print one JSON event per stage transition")
+    profiling.add_profile_argument(parser)
     
     if args_list:
         args = parser.parse_args(args_list)
@@ -291,7 +1023,7 @@ def main(args_list=None):
         args = parser.parse_args()
 
     # Reload Globals with args if provided
-    global SYSTEM_PROMPT
+    global SYSTEM_PROMPT, REQUEST_SLOTS, ENTITY_INDEX
     if args.system_prompt_path:
         SYSTEM_PROMPT = load_system_prompt(args.system_prompt_path)
     
@@ -312,50 +1044,75 @@ def main(args_list=None):
     os.makedirs(json_output_dir, exist_ok=True)
     os.makedirs(processed_md_dir, exist_ok=True)
 
-    # Get files
-    files = glob.glob(os.path.join(input_dir, "*.md"))
-    # Also support docx if converted in pipeline, but here we look for MDs usually.
-    # If pipeline converts docx -> md in same folder, we find them.
-    
-    print(f"Найдено {len(files)} markdown файлов в {input_dir}")
+    progress.configure(args.progress_format)
+    profile_owner = profiling.enable(profiling.parse_modes(args.profile))
+    files = []
+    if source is None:
+        # Get files
+        files = glob.glob(os.path.join(input_dir, "*.md"))
+        # Also support docx if converted in pipeline, but here we look for MDs usually.
+        # If pipeline converts docx -> md in same folder, we find them.
+
+        log(f"Найдено {len(files)} markdown файлов в {input_dir}")
+        progress.plan('extract', len(files))
+        progress.plan('render', len(files))
 
     config = load_config(config_path)
+    cache = None if args.no_cache else open_cache(config, input_dir)
+    store = open_store(config, input_dir)
+    journal = get_journal(input_dir, args.resume)
+    ENTITY_INDEX = open_entity_index(config, input_dir)
 
-    for file_path in files:
-        filename = os.path.basename(file_path)
-        
-        # Skip already processed if needed, or just overwrite?
-        # Logic: Check if json exists and has metadata
-        json_filename = filename.replace('.md', '.json')
-        json_path = os.path.join(json_output_dir, json_filename)
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+    dedup = open_dedup(config, input_dir)
+    duplicates = {}
+    if dedup is not None and source is None:
+        with profiling.section('dedup'):
+            duplicates = find_duplicates(files, dedup)
+    dedup_action = config.get('dedup', {}).get('action', 'link')
+    llm_files = files
+    if duplicates and dedup_action != 'flag':
+        llm_files = [f for f in files if f not in duplicates]
+        log(f"Дубликаты не отправляются в ИИ: {len(duplicates)} ({dedup_action})")
+        for file_path in duplicates:
+            progress.stage_event(os.path.splitext(os.path.basename(file_path))[0], 'extract', 'skipped')
 
-        if os.path.exists(json_path):
-            # Try to load full data from JSON
-            try:
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                
-                # Check if it is full data (has 'metadata' and 'analysis')
-                if 'metadata' in existing_data and 'analysis' in existing_data:
-                    print(f"Генерация Markdown из существующего JSON для {filename}...")
-                    save_processed_md(content, existing_data, filename, processed_md_dir)
-                    continue
-                else:
-                    pass
-            except Exception as e:
-                print(f"Ошибка чтения JSON {json_path}: {e}")
+    if args.max_concurrency:
+        config['llm_settings']['max_concurrency'] = args.max_concurrency
+    max_concurrency = get_max_concurrency(config)
+    REQUEST_SLOTS = threading.BoundedSemaphore(max_concurrency)
+    if max_concurrency > 1 and (len(files) > 1 or source is not None):
+        log(f"Параллельная обработка: до {max_concurrency} запросов одновременно")
 
-        print(f"Обработка {filename} с помощью ИИ...")
-        full_data = process_text_with_llm(content, config)
-            
-        if full_data:
-            save_json(full_data, json_filename, json_output_dir)
-            save_processed_md(content, full_data, filename, processed_md_dir)
+    if source is not None:
+        work = stream_work(source, config, json_output_dir, cache, args.refresh, journal, dedup, duplicates, store)
+    else:
+        with profiling.section('plan_work'):
+            work = plan_work(llm_files, config, json_output_dir, cache, args.refresh, journal, store)
+
+    def run(batch):
+        if progress.cancelled():
+            return None
+        if len(batch) > 1:
+            return process_batch(batch, config, json_output_dir, processed_md_dir, cache, args.refresh, store, journal)
+        return process_file(batch[0], config, json_output_dir, processed_md_dir,
+                            cache=cache, refresh=args.refresh, store=store, journal=journal)
+
+    try:
+        if source is not None:
+            # Each document's log block is printed when it finishes.
+            map_streaming(run, work, max_workers=max_concurrency)
         else:
-            print(f"Skipping {filename}")
+            map_ordered(run, work, max_workers=max_concurrency)
+        if duplicates and dedup_action != 'skip':
+            link_duplicates(duplicates, dedup_action, json_output_dir, processed_md_dir, store, journal)
+    finally:
+        scheduler.open_model().save()
+        if ENTITY_INDEX is not None:
+            ENTITY_INDEX.save()
+        if store is not None:
+            store.close()
+        if profile_owner:
+            log(f"Отчёт профилирования: {profiling.write_report(input_dir, 'extract_data')}")
 
 if __name__ == "__main__":
     main()
@@ -4,26 +4,29 @@ import datetime
 import glob
 import argparse
 
+import profiling
+from journal import atomic_write
+from entity_index import EntityIndex, open_index
+
 # --- CONFIGURATION ---
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DEFAULT_JSON_DIR = os.path.join(BASE_DIR, "md", "json")
 DEFAULT_OUTPUT_FILE = os.path.join(BASE_DIR, "md", "tufte_timeline.html")
 
-def generate_tufte_html(all_entities, all_events, all_topics, output_path):
+def generate_tufte_html(all_entities, all_events, all_topics, output_path, entity_index=None):
     # 1. Prepare Data for Client-Side
     events = sorted(all_events, key=lambda x: x["date"])
     
-    # Helper to normalize names
-    def normalize_name(name):
-        if not name: return ""
-        if "(" in name:
-            return name.split("(")[0].strip()
-        return name.strip()
+    # Name variants -> canonical name, from the alias index shared with extraction
+    index = entity_index if entity_index is not None else EntityIndex()
+    kinds = {e.get('name'): e.get('type') for e in all_entities}
+    def normalize_name(name, kind=None):
+        return index.resolve(name, count=False, kind=kind or kinds.get(name))
 
     # Deduplicate entities and assign groups
     unique_entities = {}
     for e in all_entities:
-        norm_name = normalize_name(e['name'])
+        norm_name = normalize_name(e['name'], e.get('type'))
         if norm_name:
             if norm_name not in unique_entities or unique_entities[norm_name] == 'Other':
                 unique_entities[norm_name] = e.get('group', 'Other')
@@ -60,6 +63,12 @@ def generate_tufte_html(all_entities, all_events, all_topics, output_path):
     )
 
     # Serialize Data
+    canonical = {}
+    for e in valid_events:
+        for name in (e.get("actor"), e.get("target")):
+            if name and name not in canonical:
+                canonical[name] = normalize_name(name)
+    json_canonical = json.dumps(canonical, ensure_ascii=False)
     json_events = json.dumps(valid_events, ensure_ascii=False)
     json_entities = json.dumps([{"name": k, "group": v} for k, v in sorted_entities], ensure_ascii=False)
     json_topics = json.dumps(sorted(list(all_topics)), ensure_ascii=False)
@@ -173,6 +182,7 @@ def generate_tufte_html(all_entities, all_events, all_topics, output_path):
             const RAW_EVENTS = {json_events};
             const RAW_ENTITIES = {json_entities};
             const TOPICS = {json_topics};
+            const CANONICAL = {json_canonical};
             
             // --- STATE ---
             let state = {{
@@ -344,8 +354,7 @@ def generate_tufte_html(all_entities, all_events, all_topics, output_path):
             
             function normalize(name) {{
                 if (!name) return "";
-                if (name.includes("(")) return name.split("(")[0].trim();
-                return name.trim();
+                return CANONICAL[name] || name.trim();
             }}
 
             // --- RENDERING ---
@@ -626,50 +635,100 @@ def generate_tufte_html(all_entities, all_events, all_topics, output_path):
     </html>
     """
     
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(html_template)
+    atomic_write(output_path, html_template)
     print(f"Generated visualization: {output_path}")
 
+def load_document(file_path):
+    # -> (entities, events, topics) of one result file, or None for a
+    # duplicate or an unreadable file.
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            if data.get('duplicate_of'):
+                return None
+            if 'metadata' in data: source = data['metadata']
+            else: source = data
+
+            doc_topics = source.get('topics', [])
+            events = source.get('events', [])
+            for e in events:
+                if 'topics' not in e: e['topics'] = doc_topics
+
+            return source.get('entities', []), events, set(doc_topics)
+    except Exception as e:
+        print(f"Error reading {file_path}: {e}")
+        return None
+
+class Timeline:
+    # Results kept in memory per document, for the --watch loop: a changed
+    # document re-reads only its own JSON before the page is regenerated.
+
+    def __init__(self):
+        self.documents = {}
+
+    def load(self, file_path):
+        doc = os.path.splitext(os.path.basename(file_path))[0]
+        loaded = load_document(file_path) if os.path.exists(file_path) else None
+        if loaded:
+            self.documents[doc] = loaded
+        else:
+            self.documents.pop(doc, None)
+
+    def render(self, output_path, entity_index=None):
+        all_entities, all_events, all_topics = [], [], set()
+        for entities, events, topics in self.documents.values():
+            all_entities.extend(entities)
+            all_events.extend(events)
+            all_topics.update(topics)
+        if not all_events:
+            print("No events found to visualize.")
+            return False
+        generate_tufte_html(all_entities, all_events, all_topics, output_path, entity_index)
+        if entity_index is not None:
+            entity_index.save()
+        return True
+
 def main(args_list=None):
     parser = argparse.ArgumentParser(description="Generate Tufte Timeline from JSON files.")
     parser.add_argument("input_path", nargs="?", default=DEFAULT_JSON_DIR, help="Path to folder with JSON files or specific JSON file")
     parser.add_argument("--output-file", help="Path to save the generated HTML file")
+    parser.add_argument("--db", help="Read results from the SQLite store (extraction.sqlite) instead of JSON files")
+    parser.add_argument("--entity-index", help="Alias index for name variants (default: entity_index.json next to the json folder)")
+    profiling.add_profile_argument(parser)
     
     if args_list:
         args = parser.parse_args(args_list)
     else:
         args = parser.parse_args()
 
-    all_events = []
-    all_entities = []
-    all_topics = set()
+    profile_owner = profiling.enable(profiling.parse_modes(args.profile))
 
-    if os.path.isdir(args.input_path):
-        files = glob.glob(os.path.join(args.input_path, "*.json"))
-    else:
-        files = [args.input_path]
+    with profiling.section('load results'):
+        all_events = []
+        all_entities = []
+        all_topics = set()
 
-    print(f"Found {len(files)} JSON files in {args.input_path}")
+        if args.db:
+            from store import ExtractionStore
+            store = ExtractionStore(args.db)
+            all_entities, all_events, all_topics = store.load_timeline()
+            store.close()
+            files = []
+            print(f"Loaded {len(all_events)} events from {args.db}")
+        elif os.path.isdir(args.input_path):
+            files = glob.glob(os.path.join(args.input_path, "*.json"))
+        else:
+            files = [args.input_path]
 
-    for file_path in files:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if 'metadata' in data: source = data['metadata']
-                else: source = data
-                
-                if 'topics' in source:
-                    for t in source['topics']: all_topics.add(t)
-                
-                doc_topics = source.get('topics', [])
-                events = source.get('events', [])
-                for e in events:
-                    if 'topics' not in e: e['topics'] = doc_topics
-                
-                all_events.extend(events)
-                all_entities.extend(source.get('entities', []))
-        except Exception as e:
-            print(f"Error reading {file_path}: {e}")
+        if not args.db:
+            print(f"Found {len(files)} JSON files in {args.input_path}")
+
+        for file_path in files:
+            loaded = load_document(file_path)
+            if loaded:
+                all_entities.extend(loaded[0])
+                all_events.extend(loaded[1])
+                all_topics.update(loaded[2])
 
     # Determine output path
     if args.output_file:
@@ -682,10 +741,24 @@ def main(args_list=None):
         else:
             output_path = DEFAULT_OUTPUT_FILE
 
+    if args.entity_index:
+        entity_index = EntityIndex(args.entity_index)
+    elif args.db:
+        entity_index = open_index(os.path.dirname(os.path.abspath(args.db)))
+    elif os.path.isdir(args.input_path):
+        entity_index = open_index(os.path.dirname(os.path.normpath(os.path.abspath(args.input_path))))
+    else:
+        entity_index = open_index(os.path.dirname(os.path.dirname(os.path.abspath(args.input_path))))
+
     if all_events:
-        generate_tufte_html(all_entities, all_events, all_topics, output_path)
+        with profiling.section('generate_tufte_html'):
+            generate_tufte_html(all_entities, all_events, all_topics, output_path, entity_index)
+        entity_index.save()
     else:
         print("No events found to visualize.")
 
+    if profile_owner:
+        print(f"Profile report: {profiling.write_report(os.path.dirname(os.path.abspath(output_path)), 'generate_tufte_viz')}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,156 @@
+"""Write-ahead job journal for pipeline runs, and atomic file writes."""
+import os
+import json
+import stat
+import shutil
+import hashlib
+import tempfile
+import threading
+import datetime
+
+import progress
+
+JOURNAL_NAME = ".pipeline_journal.jsonl"
+
+# Per-document stages in pipeline order; "viz" is recorded for doc "*".
+STAGES = ('copy', 'convert', 'extract', 'render', 'viz')
+
+# Read once: os.umask() can only be queried by setting it, which is not
+# safe while other threads create files.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _temp_path(path):
+    # mkstemp creates the file 0600 and os.replace keeps that, so the file
+    # gets the mode a plain open() would have given it: the replaced file's,
+    # or 0666 minus the umask for a new one.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        mode = 0o666 & ~_UMASK
+    try:
+        os.chmod(tmp, mode)
+    finally:
+        os.close(fd)
+    return tmp
+
+
+def replace_from_temp(path, produce):
+    # produce(tmp_path) writes the new content; the target is only replaced
+    # once it succeeded, so a crash never leaves a half-written file behind.
+    tmp = _temp_path(path)
+    try:
+        produce(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def atomic_write(path, text):
+    def produce(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+    replace_from_temp(path, produce)
+
+
+def atomic_write_json(path, data):
+    atomic_write(path, json.dumps(data, ensure_ascii=False, indent=2))
+
+
+def atomic_copy(src, dst):
+    replace_from_temp(dst, lambda tmp: shutil.copy2(src, tmp))
+
+
+def file_key(path):
+    # Cheap identity of an input file for stages whose output only depends on it.
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def files_key(paths):
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(f"{os.path.basename(path)}={file_key(path)};".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class Journal:
+    # Append-only JSONL: a "start" record is written before a stage runs and
+    # a "done" record after its outputs are in place, each fsync'ed. On
+    # resume the last record per (doc, stage) wins; a torn final line from a
+    # crash is ignored. Without resume the previous journal is discarded.
+    # Every record is also reported as a progress stage event.
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = {}
+        if resume:
+            self._replay()
+            self._compact()
+        else:
+            atomic_write(path, "")
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    self._state[(record['doc'], record['stage'])] = record
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def _compact(self):
+        done = [r for r in self._state.values() if r.get('status') == 'done']
+        atomic_write(self.path, "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in done))
+
+    def _append(self, doc, stage, status, key=None, **info):
+        record = {"doc": doc, "stage": stage, "status": status, "key": key,
+                  "time": datetime.datetime.now().isoformat(timespec='seconds')}
+        record.update(info)
+        with self._lock:
+            self._state[(doc, stage)] = record
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        progress.stage_event(doc, stage, status, **info)
+
+    def is_done(self, doc, stage, key=None):
+        with self._lock:
+            record = self._state.get((doc, stage))
+        return bool(record) and record.get('status') == 'done' and record.get('key') == key
+
+    def start(self, doc, stage, key=None):
+        self._append(doc, stage, 'start', key)
+
+    def done(self, doc, stage, key=None, **info):
+        self._append(doc, stage, 'done', key, **info)
+
+    def failed(self, doc, stage, error=None):
+        self._append(doc, stage, 'failed', error=str(error) if error else None)
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(directory, resume=False):
+    # One journal per working folder and process: the pipeline and the
+    # extraction step it calls append to the same instance, and only the
+    # first open decides whether earlier records are kept.
+    path = os.path.abspath(os.path.join(directory, JOURNAL_NAME))
+    with _journals_lock:
+        if path not in _journals:
+            os.makedirs(directory, exist_ok=True)
+            _journals[path] = Journal(path, resume)
+        return _journals[path]
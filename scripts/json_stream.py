@@ -0,0 +1,197 @@
+"""Incremental JSON validator for streamed LLM output."""
+
+_LITERALS = ('true', 'false', 'null', 'NaN', 'Infinity')  # json.loads takes the last two
+_NUMBER_CHARS = set('0123456789+-.eE')
+_WHITESPACE = set(' \t\r\n')
+
+# Parser states
+VALUE = 'value'                  # a value must follow
+FIRST_KEY = 'first_key'          # just after '{': key or '}'
+KEY = 'key'                      # after ',' in an object
+COLON = 'colon'
+AFTER_VALUE = 'after_value'      # ',' or the closing bracket
+FIRST_ITEM = 'first_item'        # just after '[': value or ']'
+
+
+class IncrementalJSONValidator:
+    # Feed it text as it streams in. `error` is set as soon as the object can
+    # no longer become valid JSON (a syntax error inside it) - the outputs
+    # schema.parse_llm_json could not repair either; `complete` once the
+    # top-level object closes. Text before the first '{' (a fence, a
+    # preamble) is skipped, and keys are not checked: both are left to
+    # parse_llm_json and the schema validation.
+
+    def __init__(self):
+        self.text = ""
+        self.error = None
+        self.complete = False
+        self.top_level_keys = []
+        self.stack = []
+        self.state = None
+        self.in_string = False
+        self.escape = False
+        self.string_is_key = False
+        self.key_chars = []
+        self.scalar = ""
+        self.start = None
+        self.end = None
+
+    def feed(self, chunk):
+        base = len(self.text)
+        self.text += chunk
+        for i, ch in enumerate(chunk):
+            if self.error or self.complete:
+                break
+            self._step(ch, base + i)
+        return self.error is None
+
+    def json_text(self):
+        if self.start is None:
+            return ""
+        return self.text[self.start:self.end]
+
+    def _fail(self, message):
+        self.error = message
+
+    def _step(self, ch, pos):
+        if self.start is None:
+            self._preamble(ch, pos)
+            return
+        self.pos = pos
+        if self.in_string:
+            self._string_char(ch)
+            return
+        if self.scalar:
+            if ch in _NUMBER_CHARS or ch.isalpha():
+                self.scalar += ch
+                self._check_scalar(final=False)
+                return
+            if not self._check_scalar(final=True):
+                return
+            self.scalar = ""
+            self.state = AFTER_VALUE
+        if ch in _WHITESPACE:
+            return
+        self._token(ch)
+
+    def _preamble(self, ch, pos):
+        if ch == '{':
+            self.start = pos
+            self.stack.append('{')
+            self.state = FIRST_KEY
+
+    def _string_char(self, ch):
+        if self.escape:
+            self.escape = False
+        elif ch == '\\':
+            self.escape = True
+        elif ch == '"':
+            self.in_string = False
+            if self.string_is_key:
+                self._key_done("".join(self.key_chars))
+                self.state = COLON
+            else:
+                self.state = AFTER_VALUE
+            return
+        if self.string_is_key:
+            self.key_chars.append(ch)
+
+    def _key_done(self, key):
+        if len(self.stack) == 1:
+            self.top_level_keys.append(key)
+
+    def _check_scalar(self, final):
+        s = self.scalar
+        word = s[1:] if s[0] == '-' and s[1:2].isalpha() else s  # -Infinity
+        if word[0].isalpha():
+            ok = any(lit == word for lit in _LITERALS) if final else any(lit.startswith(word) for lit in _LITERALS)
+        else:
+            ok = all(c in _NUMBER_CHARS for c in s)
+            if final:
+                try:
+                    float(s)
+                except ValueError:
+                    ok = False
+        if not ok:
+            self._fail(f"некорректное значение {s!r}")
+        return ok
+
+    def _token(self, ch):
+        state = self.state
+        if state in (FIRST_KEY, KEY):
+            if ch == '"':
+                self.in_string, self.string_is_key, self.key_chars = True, True, []
+            elif ch == '}' and state == FIRST_KEY:
+                self._close('{')
+            else:
+                self._fail(f"ожидался ключ, получено {ch!r}")
+        elif state == COLON:
+            if ch == ':':
+                self.state = VALUE
+            else:
+                self._fail(f"ожидалось ':', получено {ch!r}")
+        elif state in (VALUE, FIRST_ITEM):
+            if ch == ']' and state == FIRST_ITEM:
+                self._close('[')
+            elif ch in '{[':
+                self.stack.append(ch)
+                self.state = FIRST_KEY if ch == '{' else FIRST_ITEM
+            elif ch == '"':
+                self.in_string, self.string_is_key = True, False
+            elif ch in _NUMBER_CHARS or ch.isalpha():
+                self.scalar = ch
+                self._check_scalar(final=False)
+            else:
+                self._fail(f"ожидалось значение, получено {ch!r}")
+        elif state == AFTER_VALUE:
+            if ch == ',':
+                self.state = KEY if self.stack[-1] == '{' else VALUE
+            elif ch in '}]':
+                self._close('{' if ch == '}' else '[')
+            else:
+                self._fail(f"ожидалось ',' или закрывающая скобка, получено {ch!r}")
+
+    def _close(self, opener):
+        if not self.stack or self.stack[-1] != opener:
+            self._fail("несогласованные скобки")
+            return
+        self.stack.pop()
+        self.state = AFTER_VALUE
+        if not self.stack:
+            self.complete = True
+            self.end = self.pos + 1
+
+
+def close_truncated(text):
+    # Best-effort completion of JSON cut off mid-generation (max tokens,
+    # dropped stream): an open string value is closed where it stops,
+    # anything else half-written is cut back to the last complete value,
+    # then the open brackets are closed.
+    v = IncrementalJSONValidator()
+    safe_end, safe_stack = None, None
+    for i, ch in enumerate(text):
+        v._step(ch, i)
+        if v.error:
+            return None
+        if v.complete:
+            return text[v.start:i + 1]
+        # A ',' ends a value too: a number is only finished by what follows.
+        if v.start is not None and not v.in_string and not v.scalar and \
+                (v.state in (AFTER_VALUE, FIRST_KEY, FIRST_ITEM) or ch == ','):
+            safe_end, safe_stack = i + 1, list(v.stack)
+    if v.start is None:
+        return None
+
+    if v.in_string and not v.string_is_key:
+        body = text[v.start:]
+        if v.escape:
+            body = body[:-1]
+        body += '"'
+        stack = v.stack
+    elif safe_end is not None:
+        body = text[v.start:safe_end]
+        stack = safe_stack
+    else:
+        return None
+    body = body.rstrip().rstrip(',')
+    return body + "".join('}' if opener == '{' else ']' for opener in reversed(stack))
@@ -0,0 +1,90 @@
+"""Content-addressed on-disk cache for LLM extraction results."""
+import os
+import json
+import hashlib
+import threading
+
+# Bump when the shape of cached results changes so old entries stop matching.
+CACHE_VERSION = 1
+
+
+def cache_key(text, system_prompt, model_name, temperature, topics):
+    payload = json.dumps({
+        "v": CACHE_VERSION,
+        "text": text,
+        "system_prompt": system_prompt,
+        "model": model_name,
+        "temperature": temperature,
+        "topics": list(topics),
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    # Entries live in <cache_dir>/<key[:2]>/<key>.json. A hit touches the file,
+    # so mtime order is LRU order and eviction drops the oldest entries first.
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.json'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            os.utime(path)
+            return data
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            try:
+                previous = os.path.getsize(path)  # an overwritten entry (--refresh)
+            except OSError:
+                previous = 0
+            os.replace(tmp_path, path)
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._entries())
+            else:
+                self._total += size - previous
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total = total
@@ -0,0 +1,284 @@
+"""Offline stand-in for an OpenAI/OpenRouter-compatible chat-completions API.
+
+Answers POST /v1/chat/completions with schema-valid extraction JSON built from
+the request text (single or packed "=== ДОКУМЕНТ <id> ===" requests), with
+configurable latency, error and 429 rates and truncated outputs. Supports
+"stream": true (SSE). GET /stats returns request counters.
+
+    python scripts/mock_llm_server.py --port 8765 --latency lognormal:0.8,0.5 --rate-limit-rate 0.05
+
+and in config.yml:
+
+    llm_settings:
+      provider: "openai_compatible"
+      base_url: "http://127.0.0.1:8765/v1"
+      model: "mock"
+"""
+import re
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DOC_MARKER = re.compile(r'^=== ДОКУМЕНТ (\S+) ===$', re.M)
+WORD = re.compile(r'[А-ЯЁA-Z][а-яёa-z]{3,}')
+
+
+def parse_latency(spec):
+    # "fixed:0.5", "uniform:0.2,1.5", "lognormal:<median>,<sigma>", "exp:<mean>"
+    kind, _, params = spec.partition(':')
+    values = [float(v) for v in params.split(',') if v]
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    if kind == 'exp':
+        return lambda rng: rng.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def extraction_for(text, rng):
+    words = WORD.findall(text)
+    names = list(dict.fromkeys(words))[:4] or ["Неизвестный"]
+    year = 1900 + sum(map(ord, text[:50])) % 100
+    first_line = text.strip().splitlines()[0][:60] if text.strip() else ""
+    events = [
+        {"date": f"{year}-{(i % 12) + 1:02d}-{(i * 7) % 28 + 1:02d}", "desc": f"Событие {i + 1}",
+         "actor": names[i % len(names)], "target": names[(i + 1) % len(names)], "type": "Letter"}
+        for i in range(rng.randint(1, 3))
+    ]
+    return {
+        "metadata": {
+            "date": f"{year}-01-01",
+            "type": "Письмо",
+            "title": first_line,
+            "summary": "Синтетический ответ тестового сервера.",
+            "author": names[0],
+            "location": "Москва",
+            "topics": [],
+            "entities": [{"name": n, "type": "Person", "group": "Other"} for n in names],
+            "relationships": [{"source": names[0], "target": names[-1], "type": "mentions", "desc": ""}],
+            "events": events,
+        },
+        "analysis": "Анализ: " + " ".join(names),
+    }
+
+
+def completion_content(messages, rng):
+    user = next((m.get('content') or "" for m in reversed(messages) if m.get('role') == 'user'), "")
+    if isinstance(user, list):
+        user = " ".join(part.get('text', '') for part in user if isinstance(part, dict))
+    ids = DOC_MARKER.findall(user)
+    if not ids:
+        return json.dumps(extraction_for(user, rng), ensure_ascii=False)
+    parts = DOC_MARKER.split(user)[1:]
+    documents = []
+    for doc_id, text in zip(parts[0::2], parts[1::2]):
+        item = extraction_for(text, rng)
+        item["id"] = doc_id
+        documents.append(item)
+    return json.dumps({"documents": documents}, ensure_ascii=False)
+
+
+class MockStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.outcomes = {}
+        self.latencies = []
+        self._seen = set()
+        self.repeats = 0
+
+    def record(self, body, outcome, latency):
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            self.requests += 1
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            self.latencies.append(latency)
+            if digest in self._seen:
+                self.repeats += 1
+            self._seen.add(digest)
+
+    def snapshot(self):
+        with self._lock:
+            return {"requests": self.requests, "repeats": self.repeats,
+                    "outcomes": dict(self.outcomes), "latencies": list(self.latencies)}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.options.get('verbose'):
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            self._send_json(200, self.server.stats.snapshot())
+        elif self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        started = time.monotonic()
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        try:
+            request = json.loads(body)
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+            return
+
+        options = self.server.options
+        with self.server.rng_lock:
+            roll = self.server.rng.random()
+            latency = max(0.0, self.server.latency(self.server.rng))
+            truncate_at = self.server.rng.uniform(0.3, 0.9)
+            content = completion_content(request.get('messages') or [], self.server.rng)
+
+        if roll < options['rate_limit_rate']:
+            self.server.stats.record(body, 'rate_limited', time.monotonic() - started)
+            self._send_json(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+                            {"Retry-After": str(options['retry_after'])})
+            return
+        roll -= options['rate_limit_rate']
+        if roll < options['error_rate']:
+            time.sleep(latency / 2)
+            self.server.stats.record(body, 'error', time.monotonic() - started)
+            self._send_json(503, {"error": {"message": "Upstream unavailable", "type": "server_error"}})
+            return
+        roll -= options['error_rate']
+        finish_reason = "stop"
+        outcome = 'ok'
+        if roll < options['truncate_rate']:
+            content = content[:int(len(content) * truncate_at)]
+            finish_reason = "length"
+            outcome = 'truncated'
+
+        model = request.get('model', 'mock')
+        usage = {"prompt_tokens": len(body) // 3, "completion_tokens": len(content) // 3,
+                 "total_tokens": (len(body) + len(content)) // 3}
+        if request.get('stream'):
+            self._stream(content, model, finish_reason, usage, latency)
+        else:
+            time.sleep(latency)
+            self._send_json(200, {
+                "id": "mock-" + hashlib.sha256(body).hexdigest()[:12],
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": finish_reason,
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+        self.server.stats.record(body, outcome, time.monotonic() - started)
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, content, model, finish_reason, usage, latency):
+        # A third of the latency before the first token, the rest spread
+        # over the chunks.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        chunks = [content[i:i + 64] for i in range(0, len(content), 64)] or [""]
+        time.sleep(latency / 3)
+        delay = latency * 2 / 3 / len(chunks)
+
+        def event(delta, reason=None, extra=None):
+            payload = {"id": "mock-stream", "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": reason}]}
+            payload.update(extra or {})
+            self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            event({"role": "assistant", "content": ""})
+            for chunk in chunks:
+                event({"content": chunk})
+                time.sleep(delay)
+            event({}, finish_reason, {"usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client aborted the stream (e.g. early JSON validation failure).
+            pass
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency='fixed:0.2', error_rate=0.0, rate_limit_rate=0.0,
+                 truncate_rate=0.0, retry_after=1, seed=None, verbose=False):
+        super().__init__((host, port), MockHandler)
+        self.options = {'error_rate': error_rate, 'rate_limit_rate': rate_limit_rate,
+                        'truncate_rate': truncate_rate, 'retry_after': retry_after, 'verbose': verbose}
+        self.latency = parse_latency(latency)
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stats = MockStats()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(args_list=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM server for offline tests and benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="fixed:0.2",
+                        help="fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA | exp:MEAN (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="Share of responses cut off mid-JSON")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible runs")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args(args_list)
+
+    server = MockLLMServer(args.host, args.port, args.latency, args.error_rate, args.rate_limit_rate,
+                           args.truncate_rate, args.retry_after, args.seed, args.verbose)
+    print(f"Mock LLM server on {server.url}")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
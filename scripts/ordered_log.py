@@ -0,0 +1,101 @@
+"""Thread-aware logging that keeps each document's output in one contiguous block."""
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_local = threading.local()
+_print_lock = threading.Lock()
+
+
+def log(message=""):
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is not None:
+        buffer.append(str(message))
+        return
+    with _print_lock:
+        print(message)
+        sys.stdout.flush()
+
+
+def log_live(message):
+    # Progress lines bypass per-document buffering so long requests show
+    # activity in the UI while they run.
+    with _print_lock:
+        print(message)
+        sys.stdout.flush()
+
+
+def emit(lines):
+    # Nested pools (e.g. chunks of one document) hand their lines to the
+    # enclosing worker's buffer instead of printing past it.
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is not None:
+        buffer.extend(lines)
+        return
+    with _print_lock:
+        for line in lines:
+            print(line)
+        sys.stdout.flush()
+
+
+def run_captured(func, item):
+    _local.buffer = []
+    try:
+        return func(item), _local.buffer, None
+    except Exception as e:
+        return None, _local.buffer, e
+    finally:
+        _local.buffer = None
+
+
+def map_ordered(func, items, max_workers=1):
+    # Runs func over items on a bounded thread pool. Lines logged by a worker are
+    # buffered and printed once its item is done, strictly in input order, so the
+    # Electron log reads the same as a sequential run.
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(run_captured, func, item) for item in items]
+        for future in futures:
+            result, lines, error = future.result()
+            emit(lines)
+            if error is not None:
+                for f in futures:
+                    f.cancel()
+                raise error
+            results.append(result)
+    return results
+
+
+def map_streaming(func, items, max_workers=1):
+    # Like map_ordered, for items that arrive over time (a generator fed by an
+    # earlier stage). At most 2 * max_workers items are taken ahead, so a slow
+    # consumer holds back the producer; each item's lines are printed as one
+    # block as soon as it finishes. Results come back in completion order.
+    slots = threading.BoundedSemaphore(max(1, max_workers) * 2)
+    results, errors = [], []
+    lock = threading.Lock()
+
+    def finished(future):
+        result, lines, error = future.result()
+        emit(lines)
+        with lock:
+            if error is not None:
+                errors.append(error)
+            else:
+                results.append(result)
+        slots.release()
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for item in items:
+            slots.acquire()
+            if errors:
+                slots.release()
+                break
+            pool.submit(run_captured, func, item).add_done_callback(finished)
+    if errors:
+        raise errors[0]
+    return results
@@ -0,0 +1,254 @@
+"""A small pool of `pandoc server` processes on localhost.
+
+Starting pandoc costs more than converting a short letter, so instead of one
+process per file the pipeline keeps a few servers running and posts documents
+to them over HTTP. A server that dies is restarted; when server mode does not
+work at all (pandoc built without it, or crashing on requests) the pool
+reports ServerUnavailable and the caller converts with a subprocess as before.
+"""
+import sys
+import json
+import time
+import queue
+import atexit
+import base64
+import socket
+import threading
+import subprocess
+import collections
+import http.client
+
+from ordered_log import log
+
+START_TIMEOUT = 10      # seconds for a server to answer /version
+REQUEST_TIMEOUT = 120   # seconds per document, like the subprocess path
+TRANSIENT_RETRY = 60    # seconds before a pool that failed transiently is tried again
+
+
+class ServerUnavailable(Exception):
+    # transient: the server may work another time (it was only slow to start).
+    def __init__(self, message, transient=False):
+        super().__init__(message)
+        self.transient = transient
+
+
+class ConversionError(Exception):
+    # pandoc answered, but could not convert the document.
+    pass
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class PandocServer:
+    def __init__(self, pandoc_path):
+        self.pandoc_path = pandoc_path
+        self.process = None
+        self.port = None
+        self.version = None
+        self.errors = collections.deque(maxlen=20)
+
+    def start(self):
+        self.port = _free_port()
+        flags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+        try:
+            self.process = subprocess.Popen([self.pandoc_path, "server", "--port", str(self.port)],
+                                            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.PIPE, creationflags=flags)
+        except OSError as e:
+            raise ServerUnavailable(f"не удалось запустить pandoc server: {e}")
+        # stderr is read all the time, keeping the last lines for messages:
+        # a server that writes more than the pipe holds would block.
+        self.errors.clear()
+        drain = threading.Thread(target=self._drain, args=(self.process.stderr,), daemon=True)
+        drain.start()
+        deadline = time.monotonic() + START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                drain.join(timeout=1)
+                error = b"".join(self.errors).decode('utf-8', 'replace').strip()
+                raise ServerUnavailable(f"pandoc server завершился с кодом {self.process.returncode}: {error[-300:]}")
+            try:
+                self.version = self._request("GET", "/version", timeout=5).decode('utf-8', 'replace').strip()
+                return self
+            except ConnectionRefusedError:
+                time.sleep(0.05)  # not listening yet
+            except (OSError, http.client.HTTPException, ConversionError) as e:
+                # Listening, but cannot answer: some pandoc builds crash on
+                # every request in server mode.
+                self.stop()
+                raise ServerUnavailable(f"pandoc server не отвечает на запросы: {e}")
+        self.stop()
+        raise ServerUnavailable(f"pandoc server не ответил за {START_TIMEOUT} сек", transient=True)
+
+    def _drain(self, stream):
+        try:
+            for line in stream:
+                self.errors.append(line)
+        except (OSError, ValueError):
+            pass  # closed by stop()
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        self.process.stderr.close()
+        self.process = None
+
+    def _request(self, method, path, body=None, timeout=REQUEST_TIMEOUT):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=timeout)
+        try:
+            headers = {"Accept": "application/json"}
+            if body is not None:
+                headers["Content-Type"] = "application/json"
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise ConversionError(data.decode('utf-8', 'replace').strip() or f"HTTP {response.status}")
+        return data
+
+    def convert(self, data, source="docx", target="markdown"):
+        # -> (markdown, warnings). Binary inputs are sent base64-encoded.
+        text = base64.b64encode(data).decode('ascii')
+        body = json.dumps({"text": text, "from": source, "to": target, "wrap": "none"}).encode('utf-8')
+        reply = json.loads(self._request("POST", "/", body))
+        output = reply.get("output", "")
+        if reply.get("base64"):
+            output = base64.b64decode(output).decode('utf-8')
+        warnings = [m.get("message", "") for m in reply.get("messages", []) if m.get("verbosity") != "INFO"]
+        return output, warnings
+
+
+class ServerPool:
+    # Up to `size` servers, started on first demand; each conversion borrows
+    # one. A request that fails on the connection restarts that server and is
+    # tried once more.
+
+    def __init__(self, pandoc_path, size=2):
+        self.pandoc_path = pandoc_path
+        self.size = max(1, size)
+        self._idle = queue.Queue()
+        self._all = []
+        self._lock = threading.Lock()
+        self.unavailable = None
+        self.transient = False
+        self.failed_at = None
+
+    def _acquire(self):
+        while True:
+            if self.unavailable:
+                raise ServerUnavailable(self.unavailable)
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                start = len(self._all) < self.size
+                if start:
+                    server = PandocServer(self.pandoc_path)
+                    self._all.append(server)
+            if start:
+                try:
+                    server.start()
+                except ServerUnavailable as e:
+                    with self._lock:
+                        self._all.remove(server)
+                        self._mark_unavailable(e)
+                    raise
+                log(f"pandoc server {server.version} запущен на порту {server.port}")
+                return server
+            try:
+                return self._idle.get(timeout=0.5)
+            except queue.Empty:
+                pass
+
+    def _mark_unavailable(self, e):
+        self.unavailable, self.transient = str(e), e.transient
+        self.failed_at = time.monotonic()
+
+    def _discard(self, server):
+        server.stop()
+        with self._lock:
+            if server in self._all:
+                self._all.remove(server)
+
+    def convert(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        server = self._acquire()
+        try:
+            result = server.convert(data)
+            self._idle.put(server)
+            return result
+        except ConversionError:
+            self._idle.put(server)
+            raise
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            log(f"pandoc server на порту {server.port} не ответил ({e}), перезапуск...")
+        server.stop()
+        try:
+            server.start()
+        except ServerUnavailable as e:
+            # Cannot even be restarted: server mode does not work here.
+            self._discard(server)
+            with self._lock:
+                self._mark_unavailable(e)
+            raise
+        try:
+            result = server.convert(data)
+        except ConversionError:
+            self._idle.put(server)
+            raise
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            # This document brings the server down; it goes the subprocess way.
+            self._discard(server)
+            raise ServerUnavailable(f"pandoc server не смог обработать {path}: {e}")
+        self._idle.put(server)
+        return result
+
+    def close(self):
+        with self._lock:
+            servers, self._all = self._all, []
+        for server in servers:
+            server.stop()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(pandoc_path, size=2):
+    # One pool per pandoc binary for the life of the process, so the --serve
+    # worker keeps its servers between jobs. A transient failure (slow start)
+    # is forgotten after TRANSIENT_RETRY; within a run the caller has moved
+    # on to subprocesses by then.
+    with _pools_lock:
+        pool = _pools.get(pandoc_path)
+        if pool is None:
+            pool = _pools[pandoc_path] = ServerPool(pandoc_path, size)
+        elif pool.unavailable and pool.transient and time.monotonic() - pool.failed_at > TRANSIENT_RETRY:
+            pool.unavailable, pool.transient = None, False
+        pool.size = max(pool.size, size)
+        return pool
+
+
+def shutdown():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(shutdown)
@@ -0,0 +1,305 @@
+"""Long-lived pipeline worker (process_pipeline.py --serve) for the app.
+
+Line-delimited JSON-RPC 2.0 over stdin/stdout, one message per line, so a
+drop no longer pays for interpreter start-up, the litellm import and pandoc
+discovery. Config, prompt, caches and HTTP clients stay warm between jobs.
+
+Methods:
+    submit-files    {"files": [...], "output_dir", "config_path", "system_prompt_path",
+                     "no_cache", "refresh", "resume", "open_result"} -> {"job": id}
+    regenerate-viz  {"output_dir", "config_path"} -> {"job": id}
+    cancel          {"job": id} (default: the running job) -> {"cancelled": bool}
+    status          {} -> {"running", "queued", "warm"}
+    shutdown        {} -> {} (exits after the running job)
+
+Notifications from the worker (no "id"):
+    log       {"job", "text"}           every line the pipeline prints
+    progress  {"job", ...stage event}   see progress.py
+    job-done  {"job", "ok", "cancelled", "html", "seconds"}
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import traceback
+
+import progress
+import providers
+import process_pipeline
+from journal import get_journal
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+
+
+class RpcChannel:
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        message = dict(message, jsonrpc="2.0")
+        line = json.dumps(message, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def notify(self, method, params):
+        self.send({"method": method, "params": params})
+
+    def reply(self, request_id, result=None, error=None):
+        if error is not None:
+            self.send({"id": request_id, "error": {"code": error[0], "message": error[1]}})
+        else:
+            self.send({"id": request_id, "result": result})
+
+
+class LogStream:
+    # Stands in for sys.stdout while serving: every printed line becomes a
+    # "log" notification of the running job. Lines are assembled per thread,
+    # so print()'s separate writes of text and newline never interleave.
+
+    def __init__(self, channel, worker):
+        self.channel = channel
+        self.worker = worker
+        self._local = threading.local()
+        self.encoding = 'utf-8'
+
+    def write(self, text):
+        pending = getattr(self._local, 'pending', '') + text
+        *lines, self._local.pending = pending.split("\n")
+        for line in lines:
+            self.channel.notify("log", {"job": self.worker.current_id(), "text": line})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class PipelineWorker:
+    # Runs jobs one at a time on its own thread, in submission order.
+
+    def __init__(self, defaults, channel):
+        self.defaults = defaults
+        self.channel = channel
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._queued = []
+        self._running = None
+        self._next_id = 1
+        self.warm = {"litellm": False, "pandoc": None}
+        self.thread = threading.Thread(target=self._loop, name="pipeline-worker", daemon=True)
+
+    def current_id(self):
+        running = self._running
+        return running["job"] if running else None
+
+    def submit(self, kind, params):
+        # The job only starts on enqueue(), after its id has been replied,
+        # so the client knows the id before the first notification.
+        with self._lock:
+            job = {"job": self._next_id, "kind": kind, "params": params, "submitted": time.time(),
+                   "cancelled": False}
+            self._next_id += 1
+            self._queued.append(job)
+        return job
+
+    def enqueue(self, job):
+        self._queue.put(job)
+
+    def cancel(self, job_id=None):
+        with self._lock:
+            running = self._running
+            if running and job_id in (None, running["job"]):
+                running["cancelled"] = True
+                progress.cancel()
+                return True
+            for job in self._queued:
+                if job["job"] == job_id:
+                    job["cancelled"] = True
+                    return True
+        return False
+
+    def cancel_all(self):
+        with self._lock:
+            for job in self._queued:
+                job["cancelled"] = True
+        self.cancel()
+
+    def status(self):
+        with self._lock:
+            running = self._running
+            queued = [{"job": j["job"], "kind": j["kind"]} for j in self._queued if not j["cancelled"]]
+        info = None
+        if running:
+            info = {"job": running["job"], "kind": running["kind"],
+                    "seconds": round(time.time() - running["started"], 1)}
+            info.update(progress.snapshot())
+        return {"running": info, "queued": queued, "warm": dict(self.warm)}
+
+    def stop(self, wait=True):
+        self._queue.put(None)
+        if wait:
+            self.thread.join()
+
+    def _warm_up(self):
+        # Paid once per worker instead of once per drop.
+        try:
+            import extract_data
+            extract_data.preload()
+            self.warm["litellm"] = True
+        except Exception as e:
+            print(f"Не удалось заранее загрузить litellm: {e}")
+        try:
+            self.warm["pandoc"] = process_pipeline.find_pandoc()
+        except Exception as e:
+            print(f"Pandoc не найден: {e}")
+
+    def _loop(self):
+        self._warm_up()
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                self._queued.remove(job)
+                if not job["cancelled"]:
+                    progress.reset()
+                    providers.reset()
+                    job["started"] = time.time()
+                    self._running = job
+            if job["cancelled"]:
+                self.channel.notify("job-done", {"job": job["job"], "ok": False, "cancelled": True,
+                                                 "html": None, "seconds": 0})
+                continue
+            try:
+                ok, html = self._run(job)
+            finally:
+                with self._lock:
+                    self._running = None
+            self.channel.notify("job-done", {"job": job["job"], "ok": ok, "cancelled": job["cancelled"],
+                                             "html": html, "seconds": round(time.time() - job["started"], 1)})
+
+    def _run(self, job):
+        job_id = job["job"]
+
+        def forward(event):
+            self.channel.notify("progress", dict(event, job=job_id))
+
+        progress.add_listener(forward)
+        try:
+            process_pipeline.forget_missing_pandoc()
+            self.warm["pandoc"] = process_pipeline.find_pandoc()
+        except Exception as e:
+            print(f"Pandoc не найден: {e}")
+        try:
+            args = self._job_args(job["params"])
+            _, md_output_dir, extract_base_dir = process_pipeline.working_dirs(args.output_dir)
+            if job["kind"] == "regenerate-viz":
+                journal = get_journal(extract_base_dir or md_output_dir)
+                html = process_pipeline.generate_viz(args.config_path, extract_base_dir, md_output_dir, journal,
+                                                     force=True)
+                return True, html
+            code = process_pipeline.run_pipeline(args, open_result=bool(job["params"].get("open_result")))
+            html = os.path.join(extract_base_dir, "tufte_timeline.html") if extract_base_dir \
+                else process_pipeline.DEFAULT_OUTPUT_HTML
+            return code == 0, html if os.path.exists(html) else None
+        except SystemExit as e:
+            return e.code in (0, None), None
+        except Exception as e:
+            print(f"Ошибка задания {job_id}: {e}")
+            traceback.print_exc()
+            return False, None
+        finally:
+            progress.remove_listener(forward)
+
+    def _job_args(self, params):
+        # Per-job values override the ones the worker was started with.
+        args = argparse.Namespace(**vars(self.defaults))
+        args.input_files = params.get("files") or None
+        for key in ("output_dir", "config_path", "system_prompt_path"):
+            if params.get(key):
+                setattr(args, key, params[key])
+        for key in ("no_cache", "refresh", "resume"):
+            setattr(args, key, bool(params.get(key, getattr(args, key))))
+        args.progress_format = "text"
+        args.profile = None
+        args.serve = False
+        return args
+
+
+def handle(worker, method, params):
+    # -> (result, job to start once replied); raises ValueError for bad
+    # params, KeyError for unknown methods
+    if method == "submit-files":
+        files = params.get("files")
+        if not isinstance(files, list) or not all(isinstance(f, str) for f in files):
+            raise ValueError("files must be a list of paths")
+        job = worker.submit(method, params)
+        return {"job": job["job"]}, job
+    if method == "regenerate-viz":
+        job = worker.submit(method, params)
+        return {"job": job["job"]}, job
+    if method == "cancel":
+        return {"cancelled": worker.cancel(params.get("job"))}, None
+    if method == "status":
+        return worker.status(), None
+    raise KeyError(method)
+
+
+def serve(defaults, stdin=None, stdout=None):
+    stdin = stdin or sys.stdin
+    channel = RpcChannel(stdout or sys.stdout)
+    if hasattr(stdin, 'reconfigure'):
+        stdin.reconfigure(encoding='utf-8')
+    worker = PipelineWorker(defaults, channel)
+    saved_stdout = sys.stdout
+    sys.stdout = LogStream(channel, worker)
+    worker.thread.start()
+    channel.notify("ready", {"pid": os.getpid()})
+    try:
+        for line in stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                channel.reply(None, error=(PARSE_ERROR, f"Parse error: {e}"))
+                continue
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                channel.reply(request.get("id") if isinstance(request, dict) else None,
+                              error=(INVALID_REQUEST, "Invalid request"))
+                continue
+            request_id, method = request.get("id"), request["method"]
+            params = request.get("params") or {}
+            if method == "shutdown":
+                channel.reply(request_id, {})
+                break
+            try:
+                result, job = handle(worker, method, params)
+            except KeyError:
+                channel.reply(request_id, error=(METHOD_NOT_FOUND, f"Unknown method: {method}"))
+                continue
+            except (ValueError, TypeError, AttributeError) as e:
+                channel.reply(request_id, error=(INVALID_PARAMS, str(e)))
+                continue
+            if request_id is not None:
+                channel.reply(request_id, result)
+            if job is not None:
+                worker.enqueue(job)
+        else:
+            # stdin closed: the app is gone, nobody waits for the rest.
+            worker.cancel_all()
+    finally:
+        worker.stop()
+        sys.stdout = saved_stdout
+    return 0
@@ -2,12 +2,22 @@ import os
 import subprocess
 import sys
 import glob
+import queue
 import traceback
 import time
 import argparse
 import shutil
+import threading
 import webbrowser
 
+import profiling
+import progress
+import scheduler
+import toolchain
+from journal import files_key, get_journal, replace_from_temp
+from ordered_log import log as ordered_log, map_ordered
+from staging import get_manifest, place_file
+
 # Paths relative to this script
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
@@ -19,12 +29,13 @@ EXTRACT_SCRIPT = os.path.join(SCRIPT_DIR, "extract_data.py")
 VIZ_SCRIPT = os.path.join(SCRIPT_DIR, "generate_tufte_viz.py")
 
 def log(message):
-    print(f"[{time.strftime('%H:%M:%S')}] {message}")
-    sys.stdout.flush()
+    # Inside a conversion worker the line is buffered and printed with the
+    # rest of that file's output (see ordered_log.map_ordered).
+    ordered_log(f"[{time.strftime('%H:%M:%S')}] {message}")
 
 def run_command(command, check=True, timeout=120):
     try:
-        subprocess.run(command, check=check, capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=timeout)
+        return subprocess.run(command, check=check, capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=timeout)
     except subprocess.TimeoutExpired:
         log(f"ТАЙМАУТ: команда {' '.join(command)} не завершилась за {timeout} сек")
         if check:
@@ -46,191 +57,425 @@ def run_command(command, check=True, timeout=120):
             raise
 
 def verify_pandoc(pandoc_path):
+    # -> (version, capabilities), or None if pandoc does not run.
     log(f"Проверка Pandoc по пути: {pandoc_path}")
     if not os.path.exists(pandoc_path) and shutil.which(pandoc_path) is None:
          log(f"ОШИБКА: Файл pandoc не найден по пути: {pandoc_path}")
-         return False
+         return None
          
     try:
-        run_command([pandoc_path, "--version"])
-        log(f"Pandoc успешно запущен.")
-        return True
+        result = run_command([pandoc_path, "--version"])
+        log("Pandoc успешно запущен.")
+        lines = result.stdout.splitlines() if result is not None else []
+        return (lines[0].strip() if lines else None), {}
     except Exception as e:
         log(f"ОШИБКА: Не удалось запустить pandoc: {e}")
-        return False
+        return None
+
+_pandoc = {}
+_pandoc_lock = threading.Lock()
+
+def find_pandoc():
+    # Resolved once per process, on first use; the --serve worker reuses it
+    # for every request. Across launches the path, version and capabilities
+    # come from the toolchain cache, so the bundle search and the
+    # `pandoc --version` check only run after the app or pandoc changed.
+    with _pandoc_lock:
+        if "tool" not in _pandoc:
+            with profiling.section('find_pandoc'):
+                tool = toolchain.resolve('pandoc', locate_pandoc, verify_pandoc)
+            if tool is not None and tool["version"] is None:
+                log("ВНИМАНИЕ: Проверка Pandoc не удалась. Возможно, конвертация не сработает.")
+            elif tool is not None:
+                log(f"Pandoc: {tool['version']} ({tool['path']})")
+            _pandoc["tool"] = tool
+        return _pandoc["tool"]["path"] if _pandoc["tool"] else None
+
+def forget_missing_pandoc():
+    # A failed lookup is kept only for the current run: the --serve worker
+    # drops it before each job, so a pandoc installed meanwhile is found.
+    with _pandoc_lock:
+        tool = _pandoc.get("tool", False)
+        if tool is None or (tool and tool["version"] is None):
+            del _pandoc["tool"]
+
+def pandoc_capability(name):
+    # True/False once known, None if never checked.
+    find_pandoc()
+    tool = _pandoc.get("tool")
+    return tool["capabilities"].get(name) if tool else None
+
+def note_pandoc_capability(name, value):
+    tool = _pandoc.get("tool")
+    if tool:
+        tool["capabilities"][name] = value
+    toolchain.update('pandoc', **{name: value})
+
+def locate_pandoc():
+    if getattr(sys, 'frozen', False):
+        # Determine executable name based on OS
+        pandoc_name = "pandoc.exe" if sys.platform == "win32" else "pandoc"
+        
+        # Look in _MEIxxxx folder (OneFile)
+        if hasattr(sys, '_MEIPASS'):
+                mei_pandoc = os.path.join(sys._MEIPASS, pandoc_name)
+        else:
+                mei_pandoc = None
 
-def main():
+        # Look alongside exe (OneDir or fallback)
+        exe_pandoc = os.path.join(os.path.dirname(sys.executable), pandoc_name)
+        
+        # Try to find exactly where it is. OneDir puts it in root usually.
+        if mei_pandoc and os.path.exists(mei_pandoc):
+            pandoc_path = mei_pandoc
+            log(f"Используется встроенный Pandoc (OneFile): {pandoc_path}")
+        elif os.path.exists(exe_pandoc):
+            pandoc_path = exe_pandoc
+            log(f"Используется встроенный Pandoc (OneDir): {pandoc_path}")
+        else:
+            # DEEP SEARCH: Scan the directory
+            log("Стандартные пути не сработали. Поиск pandoc внутри сборки...")
+            search_roots = []
+            if hasattr(sys, '_MEIPASS'): search_roots.append(sys._MEIPASS)
+            search_roots.append(os.path.dirname(sys.executable))
+            
+            found_path = None
+            for root in search_roots:
+                for r, d, f in os.walk(root):
+                    for file in f:
+                        if file.lower() == pandoc_name.lower():
+                            found_path = os.path.join(r, file)
+                            break
+                    if found_path: break
+                if found_path: break
+            
+            if found_path:
+                pandoc_path = found_path
+                log(f"Найден Pandoc (Deep Search): {pandoc_path}")
+            else:
+                log(f"CRITICAL ERROR: Bundled Pandoc not found in {search_roots}")
+                # Debug: List root dir
+                try:
+                     log(f"Содержимое корня сборки: {os.listdir(os.path.dirname(sys.executable))}")
+                except: pass
+                log("Приложение повреждено: pandoc не найден внутри сборки. Проверьте pyinstaller.spec.")
+                # Keep strict exit as user implies "use internal", and if we can't find it, we can't use it.
+                # But failing clearly is better than random system path error.
+                return None
+    else:
+        pandoc_path = shutil.which("pandoc") or "pandoc"
+    return pandoc_path
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Process document pipeline.")
     parser.add_argument("--output-dir", help="Directory to save processed files.")
     parser.add_argument("--input-files", nargs="*", help="List of specific input files to process.")
     parser.add_argument("--config-path", help="Path to config.yml")
     parser.add_argument("--system-prompt-path", help="Path to system_prompt.txt")
-    args = parser.parse_args()
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the LLM response cache")
+    parser.add_argument("--refresh", action="store_true", help="Re-run LLM extraction even for cached/processed documents")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run without redoing finished stages")
+    parser.add_argument("--progress-format", choices=["text", "jsonl"], default="text",
+                        help="jsonl: also print one JSON event per stage transition (used by the app)")
+    parser.add_argument("--convert-workers", type=int, default=os.cpu_count() or 1,
+                        help="Parallel pandoc conversions (default: number of CPUs)")
+    parser.add_argument("--converter", choices=["auto", "native", "pandoc"], default="auto",
+                        help="docx -> md: auto = python-docx with pandoc fallback (default), native, pandoc")
+    parser.add_argument("--pandoc-servers", type=int, default=2,
+                        help="pandoc server processes kept running for conversions (0: one pandoc process per file)")
+    parser.add_argument("--phased", action="store_true",
+                        help="Convert everything before extraction starts (default: extract each document as soon as it is converted)")
+    parser.add_argument("--queue-size", type=int, default=16,
+                        help="Converted documents allowed to wait for extraction before conversion pauses")
+    parser.add_argument("--watch", metavar="DIR",
+                        help="Keep watching DIR and process .docx/.md files as they are added or changed")
+    parser.add_argument("--debounce", type=float, default=2.0,
+                        help="--watch: seconds a file must stay unchanged before it is processed")
+    parser.add_argument("--viz-interval", type=float, default=30.0,
+                        help="--watch: regenerate the visualization at most once per this many seconds")
+    parser.add_argument("--poll", action="store_true", help="--watch: list the folder periodically instead of inotify")
+    parser.add_argument("--no-open", action="store_true", help="Do not open the visualization when done")
+    parser.add_argument("--serve", action="store_true",
+                        help="Stay running and take jobs as line-delimited JSON-RPC on stdin/stdout (used by the app)")
+    profiling.add_profile_argument(parser)
+    return parser
 
-    # Force UTF-8 for Windows console
-    if sys.platform == 'win32':
-        sys.stdout.reconfigure(encoding='utf-8')
-        sys.stderr.reconfigure(encoding='utf-8')
+def copy_inputs(input_files, working_dir, journal):
+    # Inputs are matched by content hash (see staging.py): a document that is
+    # already in the folder, under this name or another, is not copied again.
+    log(f"Копирование {len(input_files)} файлов в {working_dir}...")
+    progress.plan('copy', len(input_files))
+    manifest = get_manifest(working_dir)
+    try:
+        for f in input_files:
+            if progress.cancelled():
+                return
+            if os.path.exists(f):
+                # Check if source and destination are the same
+                src = os.path.abspath(f)
+                dst = os.path.abspath(os.path.join(working_dir, os.path.basename(f)))
+                doc = os.path.splitext(os.path.basename(f))[0]
+                key = manifest.hash_of(src)
+                staged = manifest.existing(key, 'input')
 
-    log("--- Запуск конвейера обработки документов ---")
-    log(f"Платформа: {sys.platform}, frozen={getattr(sys, 'frozen', False)}")
-    
-    # Determine Working Directories
-    if args.output_dir:
-        # Custom Mode
-        working_dir = args.output_dir
-        if not os.path.exists(working_dir):
-            os.makedirs(working_dir)
-        
-        # Copy input files if provided
-        if args.input_files:
-            log(f"Копирование {len(args.input_files)} файлов в {working_dir}...")
-            for f in args.input_files:
-                if os.path.exists(f):
-                    # Check if source and destination are the same
-                    src = os.path.abspath(f)
-                    dst = os.path.abspath(os.path.join(working_dir, os.path.basename(f)))
-                    
-                    if src != dst:
-                        shutil.copy2(f, working_dir)
-                    else:
-                        log(f"Файл уже в целевой папке, копирование не требуется: {f}")
+                if src == dst:
+                    log(f"Файл уже в целевой папке, копирование не требуется: {f}")
+                    manifest.record(key, input=dst)
+                elif staged and os.path.abspath(staged) == dst:
+                    log(f"Пропуск копирования {os.path.basename(f)} (не изменился)")
+                    progress.stage_event(doc, 'copy', 'skipped')
+                elif staged:
+                    log(f"Пропуск {os.path.basename(f)}: тот же документ уже загружен как {os.path.basename(staged)}")
+                    progress.stage_event(doc, 'copy', 'skipped')
                 else:
-                    log(f"Внимание: Файл не найден: {f}")
-        
-        docx_source_dir = working_dir
-        md_output_dir = working_dir 
-        extract_base_dir = working_dir 
-        
+                    journal.start(doc, 'copy', key)
+                    method = place_file(src, dst)
+                    if dst.lower().endswith('.md'):
+                        manifest.record(key, input=dst, md=dst)
+                    else:
+                        manifest.record(key, input=dst)
+                    journal.done(doc, 'copy', key, bytes=os.path.getsize(dst), method=method)
+            else:
+                log(f"Внимание: Файл не найден: {f}")
+    finally:
+        manifest.save()
+
+def convert_documents(docx_source_dir, md_output_dir, journal, workers=1, converter='auto', on_ready=None,
+                      servers=0, docx_files=None):
+    # Returns False when the bundled pandoc is missing (broken build) and
+    # every file would need it. on_ready(md_path) is called for every .md
+    # that is up to date, as soon as it is. docx_files: convert just these
+    # instead of every .docx in docx_source_dir (the --watch loop).
+    listed = docx_files is None
+    if listed:
+        docx_files = sorted(glob.glob(os.path.join(docx_source_dir, "*.docx")))
+        if not docx_files:
+            log(f"Файлы .docx не найдены в {docx_source_dir}")
+            return True
+
+        progress.plan('convert', len(docx_files))
+    
+    # auto: python-docx in this process, pandoc only for documents it cannot
+    # handle (and only then is pandoc looked up and started).
+    import docx_to_md
+    native = converter != 'pandoc' and docx_to_md.available()
+    if converter == 'native' and not native:
+        log("python-docx не установлен — конвертация через pandoc")
+    if not native and find_pandoc() is None:
+        return False
+
+    total = len(docx_files)
+    workers = max(1, min(workers or 1, total))
+    costs = scheduler.open_model()
+    sizes = {path: os.path.getsize(path) for path in docx_files}
+    if native:
+        converter_key = 'python-docx'
+    elif servers and pandoc_capability('server') is not False:
+        converter_key = 'pandoc-server'
     else:
-        # Default Mode
-        docx_source_dir = DEFAULT_INPUT_DOCS_DIR
-        md_output_dir = DEFAULT_MD_INBOX_DIR
-        extract_base_dir = None 
+        converter_key = 'pandoc'
+    predicted = {}
+    for path, size in sizes.items():
+        seconds = costs.predict('convert', converter_key, size)
+        predicted[path] = progress.seconds_per_doc('convert') if seconds is None else seconds
+    progress.expect('convert', {os.path.splitext(os.path.basename(p))[0]: s for p, s in predicted.items()}, workers)
+    if listed:
+        est_time = round(sum(predicted.values()) / workers)
+        log(f"Найдено {total} файлов. Конвертация в Markdown... (Оценка: ~{est_time} сек)")
+    if workers > 1:
+        docx_files = scheduler.longest_first(docx_files, lambda p: (predicted[p], sizes[p]))
+
+    manifest = get_manifest(md_output_dir)
+    fallback = []
+    fallback_lock = threading.Lock()
+
+    def ready(md_path):
+        if on_ready is not None:
+            on_ready(md_path)
+
+    def convert_one(item):
+        i, docx_path = item
+        if progress.cancelled():
+            return
+        filename = os.path.basename(docx_path)
+        name_no_ext = os.path.splitext(filename)[0]
+        md_path = os.path.join(md_output_dir, name_no_ext + ".md")
+        # The .md is current when it was made from exactly these bytes;
+        # mtimes say nothing after a re-drop or a restored backup.
+        key = manifest.hash_of(docx_path)
+        converted = manifest.existing(key, 'md')
+
+        if converted and os.path.abspath(converted) == os.path.abspath(md_path):
+            log(f"[{i+1}/{total}] Пропуск {filename} (уже обработан)")
+            progress.stage_event(name_no_ext, 'convert', 'skipped')
+            ready(md_path)
+            return
         
-        if not os.path.exists(docx_source_dir):
-            os.makedirs(docx_source_dir)
-            log(f"Создана папка для входящих файлов: {docx_source_dir}")
+        log(f"[{i+1}/{total}] Конвертация {filename}...")
+        
+        # pandoc writes into a temp file; a killed conversion must not
+        # leave a partial .md that looks newer than its source.
+        used = []
+
+        def convert(tmp_path):
+            if native:
+                try:
+                    markdown = docx_to_md.convert(docx_path)
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        f.write(markdown)
+                    used.append('python-docx')
+                    return
+                except Exception as e:
+                    if converter == 'native':
+                        raise
+                    log(f"{filename}: {e} — конвертация через pandoc")
+            pandoc_path = find_pandoc()
+            if pandoc_path is None:
+                raise FileNotFoundError("pandoc")
+            if servers and not fallback and pandoc_capability('server') is not False:
+                import pandoc_server
+                pool = pandoc_server.get_pool(pandoc_path, min(servers, workers))
+                try:
+                    markdown, warnings = pool.convert(docx_path)
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        f.write(markdown)
+                    for warning in warnings:
+                        log(f"Pandoc ({filename}): {warning}")
+                    used.append('pandoc-server')
+                    return
+                except pandoc_server.ConversionError as e:
+                    # A wedged or overloaded server answers with an error for
+                    # documents pandoc itself converts; one more try the old way.
+                    log(f"pandoc server не конвертировал {filename} ({str(e)[:200]}) — повтор отдельным процессом pandoc")
+                except pandoc_server.ServerUnavailable as e:
+                    with fallback_lock:
+                        if not pool.unavailable:
+                            log(f"{e} — конвертация отдельным процессом pandoc")
+                        elif not fallback:
+                            fallback.append(pool.unavailable)
+                            log(f"{e} — отдельный процесс pandoc на каждый файл")
+                            if not pool.transient:
+                                # Not tried again until pandoc or the app changes.
+                                note_pandoc_capability('server', False)
+            result = run_command([pandoc_path, docx_path, "-f", "docx", "-t", "markdown", "--wrap=none", "-o", tmp_path])
+            if result is not None and result.stderr.strip():
+                log(f"Pandoc ({filename}): {result.stderr.strip()}")
+            used.append('pandoc')
+
+        journal.start(name_no_ext, 'convert', key)
+        started = time.monotonic()
+        try:
+            replace_from_temp(md_path, convert)
+            costs.record('convert', used[-1], sizes[docx_path], time.monotonic() - started)
+            manifest.record(key, md=md_path)
+            journal.done(name_no_ext, 'convert', key, bytes=os.path.getsize(md_path))
+        except Exception as e:
+            journal.failed(name_no_ext, 'convert', e)
+            log(f"Не удалось конвертировать {filename}.")
             return
+        ready(md_path)
 
-        if not os.path.exists(md_output_dir):
-            os.makedirs(md_output_dir)
+    # Each file is its own pandoc process; a failure only affects that file.
+    # Output of every file is printed as one block, in dispatch order
+    # (largest first when there are several workers).
+    if workers > 1:
+        log(f"Параллельная конвертация: {workers} потоков")
+    try:
+        map_ordered(convert_one, list(enumerate(docx_files)), max_workers=workers)
+    finally:
+        manifest.save()
+        costs.save()
+    if progress.cancelled():
+        log("Конвертация остановлена")
+    return True
 
-    # 1. Convert DOCX to MD
-    docx_files = glob.glob(os.path.join(docx_source_dir, "*.docx"))
-    if not docx_files:
-        log(f"Файлы .docx не найдены в {docx_source_dir}")
-    else:
-        # Estimate time: ~2 sec per conversion
-        est_time = len(docx_files) * 2
-        log(f"Найдено {len(docx_files)} файлов. Конвертация в Markdown... (Оценка: ~{est_time} сек)")
-        
-        # Detect Pandoc once
-        if getattr(sys, 'frozen', False):
-            # Determine executable name based on OS
-            pandoc_name = "pandoc.exe" if sys.platform == "win32" else "pandoc"
-            
-            # Look in _MEIxxxx folder (OneFile)
-            if hasattr(sys, '_MEIPASS'):
-                    mei_pandoc = os.path.join(sys._MEIPASS, pandoc_name)
-            else:
-                    mei_pandoc = None
+def markdown_inputs(md_output_dir):
+    md_files = glob.glob(os.path.join(md_output_dir, "*.md"))
+    # Exclude processed
+    return [f for f in md_files if "Processed" not in f and "Обработанные" not in f]
 
-            # Look alongside exe (OneDir or fallback)
-            exe_pandoc = os.path.join(os.path.dirname(sys.executable), pandoc_name)
-            
-            # Try to find exactly where it is. OneDir puts it in root usually.
-            if mei_pandoc and os.path.exists(mei_pandoc):
-                pandoc_path = mei_pandoc
-                log(f"Используется встроенный Pandoc (OneFile): {pandoc_path}")
-            elif os.path.exists(exe_pandoc):
-                pandoc_path = exe_pandoc
-                log(f"Используется встроенный Pandoc (OneDir): {pandoc_path}")
-            else:
-                # DEEP SEARCH: Scan the directory
-                log("Стандартные пути не сработали. Поиск pandoc внутри сборки...")
-                search_roots = []
-                if hasattr(sys, '_MEIPASS'): search_roots.append(sys._MEIPASS)
-                search_roots.append(os.path.dirname(sys.executable))
-                
-                found_path = None
-                for root in search_roots:
-                    for r, d, f in os.walk(root):
-                        for file in f:
-                            if file.lower() == pandoc_name.lower():
-                                found_path = os.path.join(r, file)
-                                break
-                        if found_path: break
-                    if found_path: break
-                
-                if found_path:
-                    pandoc_path = found_path
-                    log(f"Найден Pandoc (Deep Search): {pandoc_path}")
-                else:
-                    log(f"CRITICAL ERROR: Bundled Pandoc not found in {search_roots}")
-                    # Debug: List root dir
-                    try:
-                         log(f"Содержимое корня сборки: {os.listdir(os.path.dirname(sys.executable))}")
-                    except: pass
-                    log("Приложение повреждено: pandoc не найден внутри сборки. Проверьте pyinstaller.spec.")
-                    # Keep strict exit as user implies "use internal", and if we can't find it, we can't use it.
-                    # But failing clearly is better than random system path error.
-                    sys.exit(1)
-        else:
-            pandoc_path = "pandoc"
+def expected_documents(docx_source_dir, md_output_dir):
+    names = {os.path.splitext(os.path.basename(f))[0] for f in glob.glob(os.path.join(docx_source_dir, "*.docx"))}
+    names.update(os.path.splitext(os.path.basename(f))[0] for f in markdown_inputs(md_output_dir))
+    return len(names)
 
-        # Pre-flight check
-        if not verify_pandoc(pandoc_path):
-            log("ВНИМАНИЕ: Проверка Pandoc не удалась. Возможно, конвертация не сработает.")
+def stream_documents(args, docx_source_dir, md_output_dir, extract_base_dir, journal):
+    # Conversion and extraction overlap: each .md goes to extraction as soon
+    # as it is converted (or found up to date), and its processed Markdown is
+    # written as soon as its extraction is done. The bounded queue pauses
+    # conversion when it runs too far ahead of the LLM.
+    # Returns False when conversion could not run at all.
+    import extract_data
+    ready = queue.Queue(maxsize=max(1, args.queue_size))
+    handed = set()
+    status = {}
 
-        for i, docx_path in enumerate(docx_files):
-            filename = os.path.basename(docx_path)
-            name_no_ext = os.path.splitext(filename)[0]
-            md_path = os.path.join(md_output_dir, name_no_ext + ".md")
-            
-            if os.path.exists(md_path):
-                src_mtime = os.path.getmtime(docx_path)
-                dst_mtime = os.path.getmtime(md_path)
-                if src_mtime <= dst_mtime:
-                    log(f"[{i+1}/{len(docx_files)}] Пропуск {filename} (уже обработан)")
-                    continue
-            
-            log(f"[{i+1}/{len(docx_files)}] Конвертация {filename}...")
-            
-            # Pre-flight check for the first file or just rely on run_command error
-            # Let's do a robust check once if we haven't checked for this conversion session?
-            # Or just let run_command fail. With improved run_command, we get better logs.
+    def hand_over(md_path):
+        handed.add(md_path)
+        ready.put(md_path)
 
-            cmd = [pandoc_path, docx_path, "-f", "docx", "-t", "markdown", "--wrap=none", "-o", md_path]
-            
+    def produce():
+        try:
+            status['ok'] = convert_documents(docx_source_dir, md_output_dir, journal, args.convert_workers,
+                                             args.converter, on_ready=hand_over, servers=args.pandoc_servers)
+            if status['ok']:
+                # Markdown dropped in directly, or left over from an earlier run.
+                for md_path in sorted(markdown_inputs(md_output_dir)):
+                    if md_path not in handed and not progress.cancelled():
+                        hand_over(md_path)
+        finally:
+            ready.put(None)
+
+    producer = threading.Thread(target=produce, name="convert", daemon=True)
+    producer.start()
+    try:
+        extract_data.main(extraction_args(args, extract_base_dir), source=ready)
+    finally:
+        # Extraction stopped early: let the producer finish instead of
+        # blocking on a full queue.
+        while producer.is_alive():
             try:
-                run_command(cmd)
-            except Exception:
-                log(f"Не удалось конвертировать {filename}.")
+                ready.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    return status.get('ok', False)
 
-    # 2. Extract Data
-    # Estimate time: ~30 sec per file for LLM
-    # We count .md files in the target dir
-    md_files = glob.glob(os.path.join(md_output_dir, "*.md"))
-    # Exclude processed
-    files_to_process = []
-    processed_dir = os.path.join(md_output_dir, "Обработанные источники" if args.output_dir else "Processed")
-    
-    for f in md_files:
-        if "Processed" in f or "Обработанные" in f: continue
-        # Check if already in processed dir
-        fname = os.path.basename(f)
-        if os.path.exists(os.path.join(processed_dir, fname)):
-             # Check timestamps (simplified logic here, extract_data does real check)
-             pass
-        files_to_process.append(f)
+def extraction_estimate(config_path, md_output_dir, documents):
+    # Seconds for the LLM part from the latency history of the configured
+    # model: Markdown that is already there is sized by its tokens, the rest
+    # counts as typical documents. Also the prior for the extract ETA.
+    import extract_data
+    from providers import provider_label
+    from token_budget import count_tokens
+    config = extract_data.load_config(config_path)
+    key = provider_label(config.get('llm_settings', {}))
+    costs = scheduler.open_model()
+    typical = costs.typical('extract', key)
+    if typical is not None:
+        progress.set_prior('extract', typical)
+    fallback = progress.seconds_per_doc('extract')
+    md_files = markdown_inputs(md_output_dir)[:documents]
+    seconds = max(0, documents - len(md_files)) * fallback
+    for md_path in md_files:
+        with open(md_path, 'r', encoding='utf-8') as f:
+            predicted = costs.predict('extract', key, count_tokens(f.read()))
+        seconds += fallback if predicted is None else predicted
+    return round(seconds / extract_data.get_max_concurrency(config))
 
-    # 2. Extract Data & AI Analysis
-    est_llm_time = len(files_to_process) * 30
-    log(f"\n--- Запуск извлечения данных и AI-анализа ---")
-    log(f"Это может занять время (Оценка: ~{est_llm_time // 60} мин {est_llm_time % 60} сек)...")
-    
-    # Prepare args for extract_data
+def record_outputs(md_output_dir, extract_base_dir):
+    # Completes the manifest with what extraction made from each document.
+    manifest = get_manifest(md_output_dir)
+    base = extract_base_dir or md_output_dir
+    for digest, entry in manifest.entries().items():
+        if 'md' not in entry:
+            continue
+        stem = os.path.splitext(os.path.basename(entry['md']))[0]
+        outputs = {"json": os.path.join(base, "json", stem + ".json"),
+                   "processed": os.path.join(base, "Обработанные источники", stem + ".md")}
+        manifest.record(digest, **{kind: path for kind, path in outputs.items() if os.path.exists(path)})
+    manifest.save()
+
+def extraction_args(args, extract_base_dir):
     extract_args = []
     if extract_base_dir:
         extract_args.extend(["--base-dir", extract_base_dir])
@@ -240,18 +485,20 @@ def main():
     
     if args.system_prompt_path:
          extract_args.extend(["--system-prompt-path", args.system_prompt_path])
-        
-    try:
-        # Import and call directly
-        import extract_data
-        extract_data.main(extract_args)
-    except Exception as e:
-        log(f"Ошибка при извлечении данных: {e}")
-        traceback.print_exc()
-        sys.exit(1)
 
-    # 3. Generate Visualization
+    if args.no_cache:
+        extract_args.append("--no-cache")
+    if args.refresh:
+        extract_args.append("--refresh")
+    if args.resume:
+        extract_args.append("--resume")
+    extract_args.extend(["--progress-format", args.progress_format])
+    return extract_args
+
+def generate_viz(config_path, extract_base_dir, md_output_dir, journal, force=False):
+    # Returns the HTML path; raises when generation fails.
     log("\n--- Генерация визуализации ---")
+    import extract_data
     
     viz_args = []
     if extract_base_dir:
@@ -260,25 +507,151 @@ def main():
         # Explicitly set output file
         viz_output = os.path.join(extract_base_dir, "tufte_timeline.html")
         viz_args.extend(["--output-file", viz_output])
+
+    db_path = extract_data.store_path(extract_data.load_config(config_path),
+                                      extract_base_dir or extract_data.INPUT_DIR)
+    if db_path and os.path.exists(db_path):
+        viz_args.extend(["--db", db_path])
+
+    target_html = DEFAULT_OUTPUT_HTML
+    if extract_base_dir:
+        target_html = os.path.join(extract_base_dir, "tufte_timeline.html")
+    viz_inputs = glob.glob(os.path.join(extract_base_dir or md_output_dir, "json", "*.json"))
+    viz_key = files_key(viz_inputs)
         
+    if not force and journal.is_done('*', 'viz', viz_key) and os.path.exists(target_html):
+        log("Визуализация актуальна, пропуск")
+        progress.stage_event('*', 'viz', 'skipped')
+        return target_html
+    journal.start('*', 'viz', viz_key)
     try:
         import generate_tufte_viz
         generate_tufte_viz.main(viz_args)
+    except Exception as e:
+        journal.failed('*', 'viz', e)
+        raise
+    journal.done('*', 'viz', viz_key, bytes=os.path.getsize(target_html) if os.path.exists(target_html) else None)
+    return target_html
+
+def working_dirs(output_dir):
+    # -> (docx_source_dir, md_output_dir, extract_base_dir)
+    if output_dir:
+        return output_dir, output_dir, output_dir
+    return DEFAULT_INPUT_DOCS_DIR, DEFAULT_MD_INBOX_DIR, None
+
+def run_pipeline(args, open_result=True):
+    # One full run; returns the process exit code. Called once by main(),
+    # or once per submitted job by the --serve worker.
+    progress.configure(args.progress_format)
+    profile_owner = profiling.enable(profiling.parse_modes(args.profile))
+    # Until documents are sized, each counts as a typical one of the
+    # latency history.
+    typical = scheduler.open_model().typical('convert')
+    if typical is not None:
+        progress.set_prior('convert', typical)
+
+    log("--- Запуск конвейера обработки документов ---")
+    log(f"Платформа: {sys.platform}, frozen={getattr(sys, 'frozen', False)}")
+    
+    # Determine Working Directories
+    docx_source_dir, md_output_dir, extract_base_dir = working_dirs(args.output_dir)
+    if args.output_dir:
+        # Custom Mode
+        working_dir = args.output_dir
+        if not os.path.exists(working_dir):
+            os.makedirs(working_dir)
+        journal = get_journal(working_dir, args.resume)
+        
+        # Copy input files if provided
+        if args.input_files:
+            copy_inputs(args.input_files, working_dir, journal)
+    else:
+        # Default Mode
+        if not os.path.exists(docx_source_dir):
+            os.makedirs(docx_source_dir)
+            log(f"Создана папка для входящих файлов: {docx_source_dir}")
+            return 0
+
+        if not os.path.exists(md_output_dir):
+            os.makedirs(md_output_dir)
+        journal = get_journal(md_output_dir, args.resume)
+
+    if args.phased:
+        # 1. Convert DOCX to MD
+        if not convert_documents(docx_source_dir, md_output_dir, journal, args.convert_workers, args.converter,
+                                 servers=args.pandoc_servers):
+            return 1
+        documents = len(markdown_inputs(md_output_dir))
+    else:
+        # 1+2. Convert and extract at the same time
+        documents = expected_documents(docx_source_dir, md_output_dir)
+        progress.plan('extract', documents)
+        progress.plan('render', documents)
+
+    # 2. Extract Data & AI Analysis
+    progress.plan('viz', 1)
+    if args.phased:
+        log("\n--- Запуск извлечения данных и AI-анализа ---")
+    else:
+        log("\n--- Конвертация, извлечение данных и AI-анализ (по мере готовности документов) ---")
+        
+    try:
+        # Import and call directly
+        with profiling.section('import extract_data'):
+            import extract_data
+        est_llm_time = extraction_estimate(args.config_path, md_output_dir, documents)
+        log(f"Это может занять время (Оценка: ~{est_llm_time // 60} мин {est_llm_time % 60} сек)...")
+        if args.phased:
+            extract_data.main(extraction_args(args, extract_base_dir))
+        elif not stream_documents(args, docx_source_dir, md_output_dir, extract_base_dir, journal):
+            return 1
+    except Exception as e:
+        log(f"Ошибка при извлечении данных: {e}")
+        traceback.print_exc()
+        return 1
+
+    record_outputs(md_output_dir, extract_base_dir)
+    if progress.cancelled():
+        log("Обработка остановлена")
+        return 1
+
+    # 3. Generate Visualization
+    try:
+        target_html = generate_viz(args.config_path, extract_base_dir, md_output_dir, journal)
     except Exception as e:
         log(f"Ошибка при генерации визуализации: {e}")
         traceback.print_exc()
-        sys.exit(1)
+        return 1
         
+    if profile_owner:
+        log(f"Отчёт профилирования: {profiling.write_report(extract_base_dir or md_output_dir, 'process_pipeline')}")
+
     # 4. Open Result
-    target_html = DEFAULT_OUTPUT_HTML
-    if extract_base_dir:
-        target_html = os.path.join(extract_base_dir, "tufte_timeline.html")
+    if not open_result:
+        return 0
         
     log(f"\n--- Готово! Открываю {os.path.basename(target_html)} ---")
     if os.path.exists(target_html):
         webbrowser.open(target_html)
     else:
         log(f"Файл визуализации не найден: {target_html}")
+    return 0
+
+def main(args_list=None):
+    args = build_parser().parse_args(args_list)
+
+    # Force UTF-8 for Windows console
+    if sys.platform == 'win32':
+        sys.stdout.reconfigure(encoding='utf-8')
+        sys.stderr.reconfigure(encoding='utf-8')
+
+    if args.serve:
+        import pipeline_server
+        sys.exit(pipeline_server.serve(args))
+    if args.watch:
+        import watch_folder
+        sys.exit(watch_folder.watch(args))
+    sys.exit(run_pipeline(args, open_result=not args.no_open))
 
 if __name__ == "__main__":
     main()
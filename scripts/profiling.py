@@ -0,0 +1,225 @@
+"""Opt-in per-stage profiling (--profile): wall/CPU time per stage and document,
+optional cProfile and tracemalloc, and a report written next to the outputs."""
+import io
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+
+import progress
+
+MODES = ('times', 'python', 'memory')
+
+_lock = threading.Lock()
+_state = {"enabled": False, "modes": set(), "started": None, "cpu_started": None, "profilers": [],
+          "sections": {}, "docs": [], "open": {}, "imports": {}}
+
+
+def parse_modes(value):
+    # --profile            -> times
+    # --profile=python,memory / --profile=all
+    if not value:
+        return set()
+    modes = {m.strip() for m in value.split(',') if m.strip()}
+    if 'all' in modes:
+        return set(MODES)
+    unknown = modes - set(MODES)
+    if unknown:
+        raise ValueError(f"Unknown --profile mode: {', '.join(sorted(unknown))} (use {', '.join(MODES)} or all)")
+    return modes | {'times'}
+
+
+def _modes_argument(value):
+    import argparse
+    try:
+        parse_modes(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
+def add_profile_argument(parser):
+    parser.add_argument("--profile", nargs="?", const="times", metavar="MODES", type=_modes_argument,
+                        help="Write a timing report next to the outputs; add python (cProfile), "
+                             "memory (tracemalloc) or all, comma-separated")
+
+
+def record_import(name, seconds):
+    # Kept even when profiling is off: module imports happen before
+    # the command line is parsed.
+    with _lock:
+        _state["imports"][name] = seconds
+
+
+def enabled():
+    return _state["enabled"]
+
+
+def enable(modes):
+    # Returns True for the caller that switched profiling on; that caller
+    # writes the report. Nested entry points (the pipeline calling
+    # extract_data.main) just add to the running profile.
+    modes = set(modes)
+    if not modes:
+        return False
+    with _lock:
+        if _state["enabled"]:
+            return False
+        _state.update(enabled=True, modes=modes, started=time.perf_counter(), cpu_started=time.process_time())
+    progress.add_listener(_on_stage)
+    if 'memory' in modes:
+        import tracemalloc
+        tracemalloc.start(10)
+    if 'python' in modes:
+        _start_cprofile()
+    return True
+
+
+def _start_cprofile():
+    import cProfile
+    profiler = cProfile.Profile()
+    _state["profilers"].append(profiler)
+    profiler.enable()
+    if sys.version_info < (3, 12):
+        # Before 3.12 a profiler only sees the thread that enabled it; give
+        # every worker thread started from now on its own.
+        threading.setprofile(_thread_profiler)
+
+
+def _thread_profiler(frame, event, arg):
+    import cProfile
+    profiler = cProfile.Profile()
+    with _lock:
+        _state["profilers"].append(profiler)
+    profiler.enable()
+
+
+@contextlib.contextmanager
+def section(name, doc=None):
+    if not _state["enabled"]:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        _add_section(name, time.perf_counter() - wall, time.thread_time() - cpu, doc)
+
+
+def _add_section(name, wall, cpu, doc=None):
+    with _lock:
+        entry = _state["sections"].setdefault(name, {"count": 0, "wall": 0.0, "cpu": 0.0, "max_wall": 0.0})
+        entry["count"] += 1
+        entry["wall"] += wall
+        entry["cpu"] += cpu
+        entry["max_wall"] = max(entry["max_wall"], wall)
+        if doc is not None:
+            _state["docs"].append({"doc": doc, "stage": name, "wall": round(wall, 4), "cpu": round(cpu, 4)})
+
+
+def _on_stage(event):
+    # Stage transitions from the progress events: per-document wall time,
+    # and CPU time when start and end happened on the same thread.
+    if event.get("event") != "stage":
+        return
+    key = (event["doc"], event["stage"])
+    if event["status"] == "start":
+        with _lock:
+            _state["open"][key] = (time.perf_counter(), time.thread_time(), threading.get_ident())
+        return
+    with _lock:
+        opened = _state["open"].pop(key, None)
+    if opened is None:
+        return
+    wall = time.perf_counter() - opened[0]
+    cpu = time.thread_time() - opened[1] if opened[2] == threading.get_ident() else 0.0
+    _add_section(f"stage:{event['stage']}", wall, cpu, event["doc"])
+
+
+def _stop_cprofile(output_dir):
+    import pstats
+    profilers = _state["profilers"]
+    if not profilers:
+        return None, ""
+    threading.setprofile(None)
+    profilers[0].disable()
+    stats = pstats.Stats(profilers[0])
+    for profiler in profilers[1:]:
+        try:
+            stats.add(profiler)
+        except (TypeError, ValueError):
+            continue
+    path = os.path.join(output_dir, "profile.pstats")
+    stats.dump_stats(path)
+    text = io.StringIO()
+    stats.stream = text
+    stats.sort_stats("cumulative").print_stats(30)
+    return path, text.getvalue()
+
+
+def _stop_tracemalloc():
+    import tracemalloc
+    if not tracemalloc.is_tracing():
+        return None, []
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    top = [{"where": str(stat.traceback[0]), "kb": round(stat.size / 1024, 1), "count": stat.count}
+           for stat in snapshot.statistics("lineno")[:25]]
+    return peak, top
+
+
+def write_report(output_dir, title="pipeline"):
+    if not _state["enabled"]:
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+    wall = time.perf_counter() - _state["started"]
+    cpu = time.process_time() - _state["cpu_started"]
+    peak, top_memory = _stop_tracemalloc() if 'memory' in _state["modes"] else (None, [])
+    pstats_path, cprofile_text = _stop_cprofile(output_dir) if 'python' in _state["modes"] else (None, "")
+
+    with _lock:
+        sections = {name: dict(v) for name, v in _state["sections"].items()}
+        docs = list(_state["docs"])
+        imports = dict(_state["imports"])
+        _state["enabled"] = False
+
+    report = {
+        "title": title,
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "imports": {k: round(v, 3) for k, v in imports.items()},
+        "sections": {k: {"count": v["count"], "wall": round(v["wall"], 3), "cpu": round(v["cpu"], 3),
+                         "max_wall": round(v["max_wall"], 3)} for k, v in sections.items()},
+        "documents": docs,
+        "peak_memory_kb": round(peak / 1024, 1) if peak is not None else None,
+        "top_allocations": top_memory,
+        "pstats": pstats_path,
+    }
+    json_path = os.path.join(output_dir, "profile_report.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    lines = [f"Profile: {title}", f"Total: wall {wall:.2f} s, CPU {cpu:.2f} s", ""]
+    if imports:
+        lines.append("Imports:")
+        lines += [f"  {name:<30} {seconds:8.3f} s" for name, seconds in sorted(imports.items())]
+        lines.append("")
+    lines.append(f"{'Stage':<30} {'count':>6} {'wall s':>9} {'cpu s':>9} {'max s':>8}")
+    for name, v in sorted(sections.items(), key=lambda item: -item[1]["wall"]):
+        lines.append(f"{name:<30} {v['count']:>6} {v['wall']:>9.3f} {v['cpu']:>9.3f} {v['max_wall']:>8.3f}")
+    slowest = sorted(docs, key=lambda d: -d["wall"])[:15]
+    if slowest:
+        lines += ["", "Slowest documents:"]
+        lines += [f"  {d['doc']:<40} {d['stage']:<20} {d['wall']:8.3f} s (cpu {d['cpu']:.3f})" for d in slowest]
+    if peak is not None:
+        lines += ["", f"Peak traced memory: {peak / 1024 / 1024:.1f} MB"]
+        lines += [f"  {m['kb']:>10.1f} KB  {m['where']}" for m in top_memory[:10]]
+    if cprofile_text:
+        lines += ["", f"cProfile (full data: {pstats_path}):", cprofile_text]
+    text_path = os.path.join(output_dir, "profile_report.txt")
+    with open(text_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    return text_path
@@ -0,0 +1,194 @@
+"""Machine-readable stage events (--progress-format=jsonl) with a measured ETA.
+
+Documents whose cost was predicted (expect(), from scheduler.py) count with
+that prediction until they finish; the others with the seconds per document
+measured so far in the stage.
+"""
+import json
+import time
+import threading
+
+from ordered_log import log_live
+
+# Seconds per document assumed for a stage until one has been measured,
+# when neither an earlier run in the same process nor the latency history
+# (set_prior) knows better: ~2 s per pandoc conversion, ~30 s per LLM call.
+PRIOR_SECONDS = {'copy': 0.1, 'convert': 2.0, 'extract': 30.0, 'render': 0.1, 'viz': 2.0}
+
+_lock = threading.Lock()
+_local = threading.local()
+_listeners = []
+_cancel = threading.Event()
+_state = {"format": "text", "totals": {}, "stages": {}, "started": {}, "learned": {},
+          "priors": {}, "expected": {}, "workers": {}}
+
+
+def configure(progress_format="text"):
+    with _lock:
+        _state["format"] = progress_format or "text"
+
+
+def add_listener(func):
+    # func(event) is called for every stage event, whatever the format.
+    with _lock:
+        if func not in _listeners:
+            _listeners.append(func)
+
+
+def remove_listener(func):
+    with _lock:
+        if func in _listeners:
+            _listeners.remove(func)
+
+
+def reset():
+    # Start a new run in the same process (--serve). Measured speeds become
+    # the priors of the next run instead of being thrown away.
+    with _lock:
+        for stage, info in _state["stages"].items():
+            if info["measured"] and info["last_end"] is not None:
+                _state["learned"][stage] = max(0.0, info["last_end"] - info["first_start"]) / info["measured"]
+        _state["totals"] = {}
+        _state["stages"] = {}
+        _state["started"] = {}
+        _state["expected"] = {}
+        _state["workers"] = {}
+    _cancel.clear()
+
+
+def cancel():
+    _cancel.set()
+
+
+def cancelled():
+    # Checked between documents: work that has started is finished, the
+    # rest is skipped.
+    return _cancel.is_set()
+
+
+def snapshot():
+    with _lock:
+        totals = dict(_state["totals"])
+        done = {stage: info["done"] for stage, info in _state["stages"].items()}
+    return {"totals": totals, "done": done, "eta": eta(), "cancelled": cancelled()}
+
+
+def plan(stage, total):
+    with _lock:
+        _state["totals"][stage] = total
+    _emit({"event": "plan", "stage": stage, "total": total})
+
+
+def set_prior(stage, seconds):
+    # Seconds per document from the latency history, used until the stage
+    # has measured its own.
+    with _lock:
+        _state["priors"][stage] = seconds
+
+
+def expect(stage, costs, workers=1):
+    # costs: {doc: predicted seconds}; `workers` of them run at a time.
+    with _lock:
+        _state["expected"].setdefault(stage, {}).update(costs)
+        _state["workers"][stage] = max(1, workers)
+
+
+def counters():
+    # Token/retry counters of the stage running on this thread. Worker
+    # threads of the same document share them via use_counters().
+    current = getattr(_local, 'counters', None)
+    if current is None:
+        current = _local.counters = {}
+    return current
+
+
+def use_counters(current):
+    _local.counters = current
+
+
+def add(**amounts):
+    current = counters()
+    with _lock:
+        for name, value in amounts.items():
+            if value:
+                current[name] = current.get(name, 0) + value
+
+
+def _stage(stage):
+    return _state["stages"].setdefault(stage, {"done": 0, "measured": 0, "first_start": None, "last_end": None})
+
+
+def seconds_per_doc(stage):
+    # Wall time per processed document since the stage first started, so
+    # parallel workers are accounted for; skipped documents do not count.
+    # The prior until something has been measured.
+    with _lock:
+        info = _state["stages"].get(stage)
+        if not info or not info["measured"]:
+            if stage in _state["learned"]:
+                return _state["learned"][stage]
+            return _state["priors"].get(stage, PRIOR_SECONDS.get(stage, 1.0))
+        return max(0.0, info["last_end"] - info["first_start"]) / info["measured"]
+
+
+def eta():
+    remaining = 0.0
+    with _lock:
+        totals = dict(_state["totals"])
+        done = {stage: info["done"] for stage, info in _state["stages"].items()}
+        expected = {stage: (sum(costs.values()), len(costs), _state["workers"].get(stage, 1))
+                    for stage, costs in _state["expected"].items()}
+    for stage, total in totals.items():
+        left = max(0, total - done.get(stage, 0))
+        if not left:
+            continue
+        seconds, count, workers = expected.get(stage, (0.0, 0, 1))
+        count = min(count, left)
+        if count:
+            remaining += seconds / workers
+        remaining += (left - count) * seconds_per_doc(stage)
+    return round(remaining, 1)
+
+
+def stage_event(doc, stage, status, **info):
+    now = time.monotonic()
+    event = {"event": "stage", "doc": doc, "stage": stage, "status": status}
+    with _lock:
+        stats = _stage(stage)
+        if status == 'start':
+            _state["started"][(doc, stage)] = now
+            if stats["first_start"] is None:
+                stats["first_start"] = now
+        else:
+            began = _state["started"].pop((doc, stage), None)
+            _state["expected"].get(stage, {}).pop(doc, None)
+            if began is not None:
+                event["duration"] = round(now - began, 3)
+            stats["done"] += 1
+            if status != 'skipped' and stats["first_start"] is not None:
+                stats["measured"] += 1
+                stats["last_end"] = now
+        total = _state["totals"].get(stage)
+        finished = stats["done"]
+    if status == 'start':
+        _local.counters = {}
+    elif stage == 'extract':
+        event.update(getattr(_local, 'counters', None) or {})
+        _local.counters = {}
+    event.update({k: v for k, v in info.items() if v is not None})
+    event["done"] = finished
+    if total is not None:
+        event["total"] = total
+    event["eta"] = eta()
+    _emit(event)
+
+
+def _emit(event):
+    event["time"] = round(time.time(), 3)
+    with _lock:
+        progress_format = _state["format"]
+        listeners = list(_listeners)
+    for func in listeners:
+        func(event)
+    if progress_format == "jsonl":
+        log_live(json.dumps(event, ensure_ascii=False))
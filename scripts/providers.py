@@ -0,0 +1,111 @@
+"""Ordered provider chain with health tracking and latency-based request hedging."""
+import time
+import threading
+from collections import deque
+
+# Keys a fallback entry inherits from the primary llm_settings; connection
+# details (provider, model, base_url, api_key) must be given per entry.
+INHERITED_KEYS = ('temperature', 'timeout', 'max_retries', 'output_tokens_per_doc')
+
+
+def provider_label(settings):
+    return f"{settings.get('provider', 'openai')}:{settings.get('model', '')}"
+
+
+def provider_chain(llm_settings):
+    chain = [llm_settings]
+    for entry in llm_settings.get('fallbacks') or []:
+        settings = {k: llm_settings[k] for k in INHERITED_KEYS if k in llm_settings}
+        if entry.get('provider') == llm_settings.get('provider') and llm_settings.get('api_key'):
+            settings['api_key'] = llm_settings['api_key']
+        settings.update(entry)
+        chain.append(settings)
+    return chain
+
+
+class ProviderHealth:
+    # Latency samples and consecutive-failure counts per provider label.
+    # A provider that fails `max_failures` calls in a row is skipped for
+    # `cooldown` seconds; p95 of recent latencies drives the hedge delay.
+
+    def __init__(self, max_failures=3, cooldown=300, window=50):
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.window = window
+        self._latencies = {}
+        self._failures = {}
+        self._skip_until = {}
+        self._lock = threading.Lock()
+
+    def record_success(self, label, latency):
+        with self._lock:
+            self._latencies.setdefault(label, deque(maxlen=self.window)).append(latency)
+            self._failures[label] = 0
+            self._skip_until.pop(label, None)
+
+    def record_failure(self, label):
+        with self._lock:
+            self._failures[label] = self._failures.get(label, 0) + 1
+            if self._failures[label] >= self.max_failures:
+                self._skip_until[label] = time.monotonic() + self.cooldown
+                return True
+            return False
+
+    def forget_failures(self):
+        with self._lock:
+            self._failures.clear()
+            self._skip_until.clear()
+
+    def is_healthy(self, label):
+        with self._lock:
+            return self._skip_until.get(label, 0) <= time.monotonic()
+
+    def p95(self, label, min_samples=5):
+        with self._lock:
+            samples = sorted(self._latencies.get(label, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+_health = None
+_health_lock = threading.Lock()
+
+
+def get_health(llm_settings):
+    # Rebuilt when health_failures/health_cooldown change; the latencies
+    # measured so far are kept.
+    global _health
+    max_failures = int(llm_settings.get('health_failures', 3))
+    cooldown = float(llm_settings.get('health_cooldown', 300))
+    with _health_lock:
+        if _health is None or (_health.max_failures, _health.cooldown) != (max_failures, cooldown):
+            previous = _health
+            _health = ProviderHealth(max_failures=max_failures, cooldown=cooldown)
+            if previous is not None:
+                _health._latencies = previous._latencies
+        return _health
+
+
+def reset():
+    # Start a new job in the same process (--serve): providers that failed
+    # in an earlier job get another chance.
+    with _health_lock:
+        if _health is not None:
+            _health.forget_failures()
+
+
+def available_chain(llm_settings):
+    # Healthy providers in configured order; if every one is cooling down,
+    # try them all anyway rather than failing the document outright.
+    chain = provider_chain(llm_settings)
+    health = get_health(llm_settings)
+    healthy = [s for s in chain if health.is_healthy(provider_label(s))]
+    return healthy or chain
+
+
+def hedge_delay(llm_settings, primary):
+    p95 = get_health(llm_settings).p95(provider_label(primary))
+    if p95 is None:
+        return float(llm_settings.get('hedge_default_delay', 90))
+    return max(float(llm_settings.get('hedge_min_delay', 10)), p95)
@@ -0,0 +1,177 @@
+"""Shared per-provider rate limiting, header-driven backoff and error classification."""
+import re
+import time
+import random
+import threading
+import email.utils
+
+# Errors that will not go away by asking again.
+FATAL_STATUS = {400, 401, 402, 403, 404, 413, 422}
+FATAL_ERRORS = {
+    'AuthenticationError', 'PermissionDeniedError', 'NotFoundError', 'BadRequestError',
+    'ContextWindowExceededError', 'ContentPolicyViolationError', 'UnsupportedParamsError',
+    'UnprocessableEntityError', 'BudgetExceededError', 'InvalidRequestError',
+}
+
+
+def _status_code(e):
+    status = getattr(e, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(e, 'response', None), 'status_code', None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(e):
+    # 'rate_limit', 'fatal' or 'retryable'. Anything unknown (timeouts,
+    # dropped connections, 5xx, unparsable JSON) is worth another try.
+    status = _status_code(e)
+    name = type(e).__name__
+    if status == 429 or name == 'RateLimitError':
+        return 'rate_limit'
+    if name in FATAL_ERRORS or status in FATAL_STATUS:
+        return 'fatal'
+    return 'retryable'
+
+
+def _headers(e):
+    for source in (getattr(e, 'response', None), e):
+        for attr in ('headers', 'litellm_response_headers'):
+            headers = getattr(source, attr, None)
+            if headers:
+                try:
+                    return {str(k).lower(): str(v) for k, v in dict(headers).items()}
+                except (TypeError, ValueError):
+                    continue
+    return {}
+
+
+def _parse_duration(value):
+    # "20", "1.5", "6m0s", "250ms" or an HTTP date.
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if parts and ''.join(n + u for n, u in parts) == value:
+        scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+        return sum(float(n) * scale[u] for n, u in parts)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def retry_after(e):
+    # Seconds the provider asked us to wait, if it said so.
+    headers = _headers(e)
+    if 'retry-after-ms' in headers:
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+    for name in ('retry-after', 'x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens'):
+        if name in headers:
+            seconds = _parse_duration(headers[name])
+            if seconds is not None:
+                return seconds
+    if 'x-ratelimit-reset' in headers:
+        # OpenRouter: epoch milliseconds of the window reset
+        try:
+            return max(0.0, float(headers['x-ratelimit-reset']) / 1000 - time.time())
+        except ValueError:
+            pass
+    return None
+
+
+def backoff_delay(attempt, hinted=None, base=2.0, cap=60.0):
+    if hinted is not None:
+        return min(cap, hinted) + random.uniform(0, 1)
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now, scale):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60 * scale)
+        self.updated = now
+
+    def wait_time(self, amount, now, scale):
+        self._refill(now, scale)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / (self.capacity * scale)
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    # One instance per provider, shared by every extraction worker. Requests
+    # and tokens are metered by token buckets; a 429 pauses all workers until
+    # the provider's reset time and lowers the refill rate, which then creeps
+    # back up on success (AIMD), so throughput settles just under the limit.
+
+    def __init__(self, rpm=0, tpm=0):
+        self.limits = (rpm, tpm)
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.scale = 1.0
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    waits = [b.wait_time(amount, now, self.scale)
+                             for b, amount in ((self.requests, 1), (self.tokens, tokens)) if b]
+                    wait = max(waits, default=0.0)
+                    if wait <= 0:
+                        if self.requests:
+                            self.requests.take(1)
+                        if self.tokens:
+                            self.tokens.take(tokens)
+                        return
+            time.sleep(min(wait, 5.0))
+
+    def rate_limited(self, delay):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            self.scale = max(0.1, self.scale * 0.75)
+
+    def succeeded(self, estimated_tokens=0, used_tokens=None):
+        with self._lock:
+            self.scale = min(1.0, self.scale + 0.05)
+            if self.tokens and used_tokens is not None:
+                # Settle the estimate against the real usage reported by the API.
+                self.tokens.take(used_tokens - estimated_tokens)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider, config):
+    # Rebuilt when the limits change, e.g. edited in Settings between jobs
+    # of the --serve worker.
+    limits = config.get('rate_limits', {}) or {}
+    settings = limits.get(provider) or limits.get('default') or {}
+    rpm = float(settings.get('rpm', 0) or 0)
+    tpm = float(settings.get('tpm', 0) or 0)
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None or limiter.limits != (rpm, tpm):
+            limiter = _limiters[provider] = RateLimiter(rpm=rpm, tpm=tpm)
+        return limiter
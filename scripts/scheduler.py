@@ -0,0 +1,130 @@
+"""Per-document cost estimates learned from earlier runs.
+
+Every conversion and LLM request that actually ran is recorded as a sample
+(size, seconds) under its stage and what did the work - the converter, or
+the provider:model of the request - and kept in the user cache folder, the
+last MAX_SAMPLES per key. A straight line seconds = a + b * size fitted to
+them predicts the next document: size is the .docx byte count for
+'convert' and the request's token count for 'extract'.
+
+    model = scheduler.open_model()
+    seconds = model.predict('extract', 'openrouter:some/model', tokens)
+    model.record('extract', 'openrouter:some/model', tokens, elapsed)
+    model.save()
+
+The predictions order work longest-first when it runs in parallel, and give
+progress.py the per-document costs its ETA is computed from.
+"""
+import os
+import json
+import threading
+
+import toolchain
+from journal import atomic_write_json
+
+HISTORY_NAME = "latency_history.json"
+HISTORY_VERSION = 1
+MAX_SAMPLES = 200
+MIN_FIT = 3  # fewer samples: the mean, whatever the size
+
+
+def _fit(samples):
+    # Least squares; -> (a, b), or None without samples. A line that would
+    # make larger documents cheaper is noise and falls back to the mean.
+    n = len(samples)
+    if not n:
+        return None
+    mean_x = sum(x for x, _ in samples) / n
+    mean_y = sum(y for _, y in samples) / n
+    sxx = sum((x - mean_x) ** 2 for x, _ in samples)
+    if n < MIN_FIT or sxx <= 0:
+        return mean_y, 0.0
+    b = sum((x - mean_x) * (y - mean_y) for x, y in samples) / sxx
+    if b < 0:
+        return mean_y, 0.0
+    return mean_y - b * mean_x, b
+
+
+class CostModel:
+    # {"samples": {stage: {key: [[size, seconds], ...]}}}
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.samples = {}
+        self._fits = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != HISTORY_VERSION:
+            return
+        self.samples = data.get('samples', {})
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": HISTORY_VERSION, "samples": self.samples}
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            atomic_write_json(self.path, data)
+        except OSError:
+            pass  # read-only profile: estimates just stay at what they were
+
+    def record(self, stage, key, size, seconds):
+        with self._lock:
+            history = self.samples.setdefault(stage, {}).setdefault(key, [])
+            history.append([size, round(seconds, 3)])
+            del history[:-MAX_SAMPLES]
+            self._fits.pop((stage, key), None)
+            self._dirty = True
+
+    def predict(self, stage, key, size):
+        # Seconds for one document (or packed request) of `size`; None while
+        # nothing has been measured for this key.
+        with self._lock:
+            if (stage, key) not in self._fits:
+                self._fits[(stage, key)] = _fit(self.samples.get(stage, {}).get(key, []))
+            fit = self._fits[(stage, key)]
+        if fit is None:
+            return None
+        a, b = fit
+        return max(0.0, a + b * size)
+
+    def typical(self, stage, key=None):
+        # Mean seconds per sample of `key` (every key of the stage if None),
+        # for estimates made before any size is known; None without history.
+        with self._lock:
+            histories = self.samples.get(stage, {})
+            if key is not None:
+                histories = {key: histories.get(key, [])}
+            values = [y for history in histories.values() for _, y in history]
+        if not values:
+            return None
+        return sum(values) / len(values)
+
+
+def longest_first(items, cost):
+    # LPT order: with several workers the big items start first and the
+    # small ones fill the gaps at the end, instead of one large straggler.
+    return sorted(items, key=cost, reverse=True)
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def open_model():
+    # One model per process, shared by conversion and extraction.
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = CostModel(os.path.join(toolchain.cache_dir(), HISTORY_NAME))
+        return _model
@@ -0,0 +1,170 @@
+"""Compiled validation and repair of the LLM metadata/analysis schema."""
+import json
+
+from json_stream import close_truncated
+
+
+class SchemaError(ValueError):
+    # The output cannot be salvaged; the caller should re-request.
+    pass
+
+
+# Field specs: (type, required, default). Lists of records drop items that
+# miss a required field; optional fields are filled with their default.
+ENTITY = {
+    "name": (str, True, ""),
+    "type": (str, False, "Person"),
+    "group": (str, False, "Other"),
+}
+RELATIONSHIP = {
+    "source": (str, True, ""),
+    "target": (str, True, ""),
+    "type": (str, False, "mentions"),
+    "desc": (str, False, ""),
+}
+EVENT = {
+    "date": (str, True, ""),
+    "desc": (str, False, ""),
+    "actor": (str, True, ""),
+    "target": (str, False, ""),
+    "type": (str, False, ""),
+}
+METADATA = {
+    "date": (str, False, ""),
+    "type": (str, False, ""),
+    "title": (str, False, ""),
+    "summary": (str, False, ""),
+    "author": (str, False, ""),
+    "location": (str, False, ""),
+    "topics": ([str], False, None),
+    "entities": ([ENTITY], False, None),
+    "relationships": ([RELATIONSHIP], False, None),
+    "events": ([EVENT], False, None),
+}
+
+
+def _compile_str(path):
+    def check(value, warnings):
+        if isinstance(value, str):
+            return value.strip()
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        raise SchemaError(f"{path}: ожидалась строка, получено {type(value).__name__}")
+    return check
+
+
+def _compile_record(spec, path):
+    fields = [(name, _compile(kind, f"{path}.{name}"), required, default)
+              for name, (kind, required, default) in spec.items()]
+
+    def check(value, warnings):
+        if not isinstance(value, dict):
+            raise SchemaError(f"{path}: ожидался объект")
+        out = dict(value)
+        for name, field_check, required, default in fields:
+            raw = value.get(name)
+            if raw is None or raw == "":
+                if required:
+                    raise SchemaError(f"{path}: нет поля {name!r}")
+                out[name] = list() if default is None else default
+                continue
+            try:
+                out[name] = field_check(raw, warnings)
+            except SchemaError:
+                if required:
+                    raise
+                warnings.append(f"{path}.{name}: некорректное значение заменено по умолчанию")
+                out[name] = list() if default is None else default
+        return out
+    return check
+
+
+def _compile_list(item_kind, path):
+    item_check = _compile(item_kind, f"{path}[]")
+
+    def check(value, warnings):
+        if not isinstance(value, list):
+            if isinstance(value, (dict, str)):
+                value = [value]
+            else:
+                raise SchemaError(f"{path}: ожидался список")
+        out = []
+        for i, item in enumerate(value):
+            try:
+                out.append(item_check(item, warnings))
+            except SchemaError as e:
+                warnings.append(f"{path}[{i}] отброшен: {e}")
+        return out
+    return check
+
+
+def _compile(kind, path):
+    if kind is str:
+        return _compile_str(path)
+    if isinstance(kind, list):
+        return _compile_list(kind[0], path)
+    return _compile_record(kind, path)
+
+
+_check_metadata = _compile(METADATA, "metadata")
+_check_analysis = _compile_str("analysis")
+
+
+def validate_extraction(data, warnings):
+    if not isinstance(data, dict) or not isinstance(data.get('metadata'), dict):
+        raise SchemaError("нет блока metadata")
+    out = dict(data)
+    out['metadata'] = _check_metadata(data['metadata'], warnings)
+    try:
+        out['analysis'] = _check_analysis(data.get('analysis') or "", warnings)
+    except SchemaError:
+        warnings.append("analysis: не строка, заменён пустым")
+        out['analysis'] = ""
+    return out
+
+
+def validate_packed(data, warnings):
+    # Multi-document response: invalid slots are dropped (the caller falls
+    # back to single requests for them); only a missing list is fatal.
+    if not isinstance(data, dict) or not isinstance(data.get('documents'), list):
+        raise SchemaError("нет списка documents")
+    documents = []
+    for i, item in enumerate(data['documents']):
+        if not isinstance(item, dict) or item.get('id') is None:
+            warnings.append(f"documents[{i}] отброшен: нет id")
+            continue
+        try:
+            checked = validate_extraction(item, warnings)
+        except SchemaError as e:
+            warnings.append(f"documents[{i}] отброшен: {e}")
+            continue
+        checked['id'] = str(item['id'])
+        documents.append(checked)
+    return {"documents": documents}
+
+
+def parse_llm_json(content, warnings):
+    # json.loads first; then strip fences/prose around the object and close
+    # a truncated tail. Raises SchemaError only when nothing usable is left.
+    text = (content or "").strip()
+    try:
+        return json.loads(text, strict=False)
+    except ValueError:
+        pass
+
+    start = text.find('{')
+    if start < 0:
+        raise SchemaError("в ответе нет JSON-объекта")
+    repaired = close_truncated(text[start:])
+    if repaired is None:
+        raise SchemaError("JSON не удалось восстановить")
+    try:
+        data = json.loads(repaired, strict=False)
+    except ValueError as e:
+        raise SchemaError(f"JSON не удалось восстановить: {e}")
+    tail = text[start:]
+    if not tail.startswith(repaired):
+        warnings.append("JSON был обрезан — недостающие скобки закрыты")
+    elif tail[len(repaired):].strip().strip('`').strip() or text[:start].strip().strip('`').strip().lower() not in ("", "json"):
+        warnings.append("вокруг JSON был лишний текст — отброшен")
+    return data
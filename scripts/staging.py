@@ -0,0 +1,175 @@
+"""Content-addressed staging of input documents.
+
+Inputs are identified by a SHA-256 of their bytes, read in chunks, and a
+manifest in the working folder maps each hash to what was derived from it
+(staged input, .md, JSON, processed .md). Hashes are remembered per file
+identity (device, inode, size, mtime), so an unchanged input - including one
+that was renamed or moved - is recognised from a stat() alone. Staging
+places a file with a reflink or hardlink when possible and copies only
+across filesystems.
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import threading
+
+from journal import atomic_write_json, replace_from_temp
+
+MANIFEST_NAME = ".staging_manifest.json"
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 1 << 20
+
+FICLONE = 0x40049409  # linux/fs.h
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _identity(st):
+    # st_ino is 0 on filesystems without stable ids; the caller then falls
+    # back to the path.
+    if not st.st_ino:
+        return None
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _reflink(src, dst):
+    # Linux only (btrfs, xfs, ...); elsewhere the ioctl fails and the
+    # caller moves on to a hardlink.
+    import fcntl
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def place_file(src, dst):
+    # Puts a copy of src at dst without copying bytes where the filesystem
+    # allows: reflink (copy-on-write), then hardlink, then a real copy.
+    # Returns the method used. dst is replaced atomically.
+    used = []
+
+    def produce(tmp):
+        os.remove(tmp)
+        if sys.platform.startswith('linux'):
+            try:
+                _reflink(src, tmp)
+                used.append('reflink')
+                return
+            except OSError:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        try:
+            os.link(src, tmp)
+            used.append('hardlink')
+            return
+        except OSError:
+            pass  # other filesystem, or links not supported
+        shutil.copy2(src, tmp)
+        used.append('copy')
+
+    replace_from_temp(dst, produce)
+    return used[0]
+
+
+class Manifest:
+    # {"hashes": {hash: {"input", "md", "json", "processed"}},
+    #  "files": {identity or path: hash}}; file names are relative to the
+    # working folder. A file name belongs to one hash at a time: when
+    # a.docx changes, a.md is re-recorded under the new hash.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self.hashes = {}
+        self.files = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != MANIFEST_VERSION:
+            return
+        self.hashes = data.get('hashes', {})
+        self.files = data.get('files', {})
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            # Identities of files whose content no longer has an entry.
+            self.files = {key: digest for key, digest in self.files.items() if digest in self.hashes}
+            atomic_write_json(self.path, {"version": MANIFEST_VERSION, "hashes": self.hashes, "files": self.files})
+            self._dirty = False
+
+    def hash_of(self, path):
+        # O(1) for a file seen before (same identity); otherwise the file is
+        # read once.
+        st = os.stat(path)
+        key = _identity(st) or f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+        with self._lock:
+            digest = self.files.get(key)
+        if digest is None:
+            digest = hash_file(path)
+            with self._lock:
+                self.files[key] = digest
+                self._dirty = True
+        return digest
+
+    def artifacts(self, digest):
+        with self._lock:
+            return dict(self.hashes.get(digest, {}))
+
+    def existing(self, digest, kind):
+        # Path of a recorded artifact that is still on disk, else None.
+        name = self.artifacts(digest).get(kind)
+        if not name:
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(path) else None
+
+    def record(self, digest, **artifacts):
+        with self._lock:
+            entry = self.hashes.setdefault(digest, {})
+            for kind, path in artifacts.items():
+                name = os.path.relpath(path, self.directory)
+                if entry.get(kind) == name:
+                    continue
+                for other in self.hashes.values():
+                    if other.get(kind) == name:
+                        del other[kind]
+                entry[kind] = name
+                self._dirty = True
+            for stale in [d for d, e in self.hashes.items() if not e]:
+                del self.hashes[stale]
+
+    def entries(self):
+        with self._lock:
+            return {digest: dict(entry) for digest, entry in self.hashes.items()}
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def get_manifest(directory):
+    # One manifest per working folder and process, like get_journal().
+    path = os.path.abspath(directory)
+    with _manifests_lock:
+        if path not in _manifests:
+            os.makedirs(directory, exist_ok=True)
+            _manifests[path] = Manifest(path)
+        return _manifests[path]
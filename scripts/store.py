@@ -0,0 +1,198 @@
+"""Optional SQLite store for extraction results (documents, entities, relationships, events, topics)."""
+import os
+import sys
+import json
+import glob
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    content_hash TEXT,
+    processed_at TEXT NOT NULL,
+    date TEXT,
+    type TEXT,
+    title TEXT,
+    author TEXT,
+    location TEXT,
+    duplicate_of TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entities (
+    doc_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    type TEXT,
+    grp TEXT
+);
+CREATE TABLE IF NOT EXISTS relationships (
+    doc_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    source TEXT,
+    target TEXT,
+    type TEXT,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    doc_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    date TEXT,
+    actor TEXT,
+    target TEXT,
+    type TEXT,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS topics (
+    doc_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    topic TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_date ON documents(date);
+CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(content_hash);
+CREATE INDEX IF NOT EXISTS idx_documents_processed ON documents(processed_at);
+CREATE INDEX IF NOT EXISTS idx_entities_name ON entities(name);
+CREATE INDEX IF NOT EXISTS idx_entities_doc ON entities(doc_id);
+CREATE INDEX IF NOT EXISTS idx_relationships_source ON relationships(source);
+CREATE INDEX IF NOT EXISTS idx_relationships_target ON relationships(target);
+CREATE INDEX IF NOT EXISTS idx_relationships_doc ON relationships(doc_id);
+CREATE INDEX IF NOT EXISTS idx_events_date ON events(date);
+CREATE INDEX IF NOT EXISTS idx_events_actor ON events(actor);
+CREATE INDEX IF NOT EXISTS idx_events_target ON events(target);
+CREATE INDEX IF NOT EXISTS idx_events_doc ON events(doc_id);
+CREATE INDEX IF NOT EXISTS idx_topics_topic ON topics(topic);
+CREATE INDEX IF NOT EXISTS idx_topics_doc ON topics(doc_id);
+"""
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ExtractionStore:
+    # One connection shared by the extraction workers, serialized by a lock;
+    # every document is replaced in a single transaction.
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(documents)")}
+        if 'duplicate_of' not in columns:
+            self.conn.execute("ALTER TABLE documents ADD COLUMN duplicate_of TEXT")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def save(self, name, data, doc_hash=None):
+        meta = data.get('metadata') or {}
+        processed_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM documents WHERE name = ?", (name,))
+            cur = self.conn.execute(
+                "INSERT INTO documents (name, content_hash, processed_at, date, type, title, author, location, "
+                "duplicate_of, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, doc_hash, processed_at, meta.get('date'), meta.get('type'), meta.get('title'),
+                 meta.get('author'), meta.get('location'), data.get('duplicate_of'),
+                 json.dumps(data, ensure_ascii=False)))
+            doc_id = cur.lastrowid
+            self.conn.executemany(
+                "INSERT INTO entities (doc_id, name, type, grp) VALUES (?, ?, ?, ?)",
+                [(doc_id, e.get('name'), e.get('type'), e.get('group')) for e in meta.get('entities') or []])
+            self.conn.executemany(
+                "INSERT INTO relationships (doc_id, source, target, type, description) VALUES (?, ?, ?, ?, ?)",
+                [(doc_id, r.get('source'), r.get('target'), r.get('type'), r.get('desc'))
+                 for r in meta.get('relationships') or []])
+            self.conn.executemany(
+                "INSERT INTO events (doc_id, seq, date, actor, target, type, description) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(doc_id, i, e.get('date'), e.get('actor'), e.get('target'), e.get('type'), e.get('desc'))
+                 for i, e in enumerate(meta.get('events') or [])])
+            self.conn.executemany(
+                "INSERT INTO topics (doc_id, topic) VALUES (?, ?)",
+                [(doc_id, t) for t in meta.get('topics') or []])
+
+    def document_hash(self, name):
+        with self._lock:
+            row = self.conn.execute("SELECT content_hash FROM documents WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def load_timeline(self):
+        # Rows in the shape generate_tufte_html expects, near-duplicates left
+        # out.
+        where, params = "WHERE d.duplicate_of IS NULL", ()
+        with self._lock:
+            doc_topics = {}
+            for doc_id, topic in self.conn.execute(
+                    f"SELECT t.doc_id, t.topic FROM topics t JOIN documents d ON d.id = t.doc_id {where} "
+                    "ORDER BY t.rowid", params):
+                doc_topics.setdefault(doc_id, []).append(topic)
+            events = [
+                {"date": date or "", "desc": desc or "", "actor": actor or "", "target": target or "",
+                 "type": etype or "", "topics": doc_topics.get(doc_id, [])}
+                for doc_id, date, actor, target, etype, desc in self.conn.execute(
+                    f"SELECT e.doc_id, e.date, e.actor, e.target, e.type, e.description FROM events e "
+                    f"JOIN documents d ON d.id = e.doc_id {where} ORDER BY d.name, e.seq", params)
+            ]
+            entities = [
+                {"name": name, "type": etype, "group": grp}
+                for name, etype, grp in self.conn.execute(
+                    f"SELECT e.name, e.type, e.grp FROM entities e JOIN documents d ON d.id = e.doc_id {where} "
+                    "ORDER BY e.rowid", params)
+            ]
+        topics = {t for ts in doc_topics.values() for t in ts}
+        return entities, events, topics
+
+    def export_json(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        with self._lock:
+            rows = self.conn.execute("SELECT name, data FROM documents ORDER BY name").fetchall()
+        for name, data in rows:
+            with open(os.path.join(output_dir, name + ".json"), 'w', encoding='utf-8') as f:
+                json.dump(json.loads(data), f, ensure_ascii=False, indent=2)
+        return len(rows)
+
+    def import_json(self, json_dir):
+        count = 0
+        for path in sorted(glob.glob(os.path.join(json_dir, "*.json"))):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ошибка чтения {path}: {e}")
+                continue
+            if 'metadata' not in data:
+                continue
+            self.save(os.path.splitext(os.path.basename(path))[0], data)
+            count += 1
+        return count
+
+
+def main(args_list=None):
+    parser = argparse.ArgumentParser(description="Export/import extraction results between SQLite and per-file JSON.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Write one JSON file per document from the store")
+    export.add_argument("db", help="Path to extraction.sqlite")
+    export.add_argument("output_dir", help="Folder for the JSON files")
+    imp = sub.add_parser("import", help="Load an existing json/ folder into the store")
+    imp.add_argument("json_dir", help="Folder with JSON files")
+    imp.add_argument("db", help="Path to extraction.sqlite")
+    args = parser.parse_args(args_list)
+
+    if args.command == "export":
+        if not os.path.exists(args.db):
+            print(f"База не найдена: {args.db}")
+            sys.exit(1)
+        store = ExtractionStore(args.db)
+        print(f"Экспортировано {store.export_json(args.output_dir)} документов в {args.output_dir}")
+    else:
+        store = ExtractionStore(args.db)
+        print(f"Импортировано {store.import_json(args.json_dir)} документов в {args.db}")
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Token-budgeted splitting and the deterministic merge (chunking.py).
+
+    python -m pytest scripts/test_chunking.py
+    python scripts/test_chunking.py
+"""
+import os
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+from chunking import approx_tokens, merge_extractions, split_markdown
+
+
+def words(text):
+    return text.split()
+
+
+def test_short_text_is_one_chunk():
+    text = "# Письмо\n\nКороткий текст."
+    assert split_markdown(text, 1000) == [text]
+
+
+def test_chunks_stay_in_budget_and_keep_every_word():
+    paragraphs = [f"Абзац {i}: " + "слово " * 40 for i in range(30)]
+    text = "\n\n".join(paragraphs)
+    chunks = split_markdown(text, 200)
+    assert len(chunks) > 1
+    assert all(approx_tokens(chunk) <= 200 for chunk in chunks)
+    assert words(" ".join(chunks)) == words(text)
+
+
+def test_breaks_before_a_heading_once_half_full():
+    section = "слово " * 100
+    text = f"# Первый\n\n{section}\n\n# Второй\n\n{section}"
+    chunks = split_markdown(text, 250)
+    assert [chunk.splitlines()[0] for chunk in chunks] == ["# Первый", "# Второй"]
+
+
+def test_oversized_line_is_hard_split():
+    line = "слово " * 500
+    chunks = split_markdown(line, 100)
+    assert len(chunks) > 1
+    assert all(approx_tokens(chunk) <= 100 for chunk in chunks)
+    assert words(" ".join(chunks)) == words(line)
+
+
+def test_merge_keeps_the_first_value_and_drops_duplicates():
+    first = {"metadata": {"date": "", "title": "Письмо", "topics": ["B"],
+                          "entities": [{"name": "Ломако", "group": "Other"}],
+                          "events": [{"date": "1921", "actor": "A", "target": "B", "desc": "d"}]},
+             "analysis": "Часть 1"}
+    second = {"metadata": {"date": "1921-01-15", "title": "Другое", "topics": ["A", "B"],
+                           "entities": [{"name": "ломако ", "group": "Clergy"}, {"name": "Ванек"}],
+                           "events": [{"date": "1921", "actor": "a", "target": "b", "desc": "D"}]},
+              "analysis": "Часть 1"}
+    merged = merge_extractions([first, second], topics_order=["A", "B"])
+    meta = merged["metadata"]
+    assert meta["title"] == "Письмо"
+    assert meta["date"] == "1921-01-15"
+    assert meta["topics"] == ["A", "B"]
+    assert [e["name"] for e in meta["entities"]] == ["Ломако", "Ванек"]
+    assert meta["entities"][0]["group"] == "Clergy"
+    assert len(meta["events"]) == 1
+    assert merged["analysis"] == "Часть 1"
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
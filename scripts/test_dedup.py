@@ -0,0 +1,83 @@
+"""MinHash/LSH near-duplicate detection (dedup.py).
+
+    python -m pytest scripts/test_dedup.py
+    python scripts/test_dedup.py
+"""
+import os
+import sys
+import random
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+from dedup import DedupIndex, MinHasher, lsh_params, normalize_text, shingle_hashes, similarity
+
+VOCABULARY = ("приход церковь письмо епископ община прага архив книга священник совет "
+              "собрание отчёт деньги храм год община министерство дело решение просьба").split()
+
+
+def letter(seed, words=400):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def edited(text, changes, seed=0):
+    rng = random.Random(seed)
+    words = text.split()
+    for _ in range(changes):
+        words[rng.randrange(len(words))] = "правка"
+    return " ".join(words)
+
+
+def test_formatting_does_not_change_the_shingles():
+    assert normalize_text("**Отчёт** прихода, 1921 г.") == ["отчет", "прихода", "1921", "г"]
+    assert shingle_hashes("# Отчёт прихода — за год") == shingle_hashes("отчет, прихода: за  ГОД")
+
+
+def test_signature_similarity_estimates_jaccard():
+    hasher = MinHasher()
+    a = shingle_hashes(letter(1))
+    b = shingle_hashes(edited(letter(1), 20))
+    jaccard = len(a & b) / len(a | b)
+    assert abs(similarity(hasher.signature(a), hasher.signature(b)) - jaccard) < 0.15
+    assert similarity(hasher.signature(a), hasher.signature(a)) == 1.0
+
+
+def test_lsh_bands_cover_all_slots():
+    for threshold in (0.5, 0.85, 0.95):
+        bands, rows = lsh_params(threshold)
+        assert bands * rows <= 128 and bands >= 1 and rows >= 1
+
+
+def test_near_duplicate_points_at_the_original():
+    with tempfile.TemporaryDirectory() as directory:
+        index = DedupIndex(os.path.join(directory, "dedup.json"))
+        original = letter(1)
+        assert index.classify("a.docx", "h1", original) is None
+        assert index.classify("b.docx", "h2", letter(2)) is None
+        match = index.classify("a_copy.docx", "h3", "# " + edited(original, 3))
+        assert match is not None and match[0] == "a.docx" and match[1] >= 0.85
+        assert index.classify("a.docx", "h1", original) is None
+
+
+def test_index_survives_reload_and_prune():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "dedup.json")
+        index = DedupIndex(path)
+        original = letter(1)
+        index.classify("a.docx", "h1", original)
+        index.classify("a_copy.docx", "h2", edited(original, 3))
+        index.save()
+        again = DedupIndex(path)
+        assert again.classify("a_copy.docx", "h2", "")[0] == "a.docx"
+        again.prune({"a_copy.docx"})
+        assert again.entries["a_copy.docx"]["duplicate_of"] is None
+        assert again.classify("a_copy.docx", "h2", "") is None
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
@@ -0,0 +1,88 @@
+"""Alias index (entity_index.py): name variants that must and must not merge.
+
+    python -m pytest scripts/test_entity_index.py
+    python scripts/test_entity_index.py
+"""
+import os
+import sys
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+from entity_index import EntityIndex, is_person, parse_name
+
+
+def resolve_pair(first, second, kind=None):
+    index = EntityIndex()
+    return index.resolve(first, kind=kind), index.resolve(second, kind=kind), index
+
+
+def test_surname_is_not_the_longest_word():
+    assert parse_name("Сергей Ванек")[0] == "vanek"
+    assert parse_name("Константин Рафальский")[0] == "rafalsky"
+    assert parse_name("Ломако Николай")[0] == "lomako"
+    assert parse_name("Иван Петрович Сидоров")[0] == "sidorov"
+    assert parse_name("Н. Ломако") == ("lomako", {"n"}, "lomako n")
+
+
+def test_full_name_merges_with_bare_surname():
+    first, second, index = resolve_pair("Николай Ломако", "Ломако")
+    assert first == second
+    assert len(index.clusters) == 1
+    first, second, index = resolve_pair("Константин Рафальский", "Рафальский")
+    assert first == second
+    assert len(index.clusters) == 1
+
+
+def test_titles_and_initials_merge():
+    index = EntityIndex()
+    names = {index.resolve(n) for n in ("Стельмашенко", "о. Стельмашенко", "Stelmashenko", "Стельмашенко (священник)")}
+    assert len(index.clusters) == 1, names
+    index.resolve("Николай Ломако")
+    assert index.resolve("Н. Ломако") == "Николай Ломако"
+
+
+def test_different_people_stay_apart():
+    _, _, index = resolve_pair("Петров", "Петрова")
+    assert len(index.clusters) == 2
+    _, _, index = resolve_pair("Иван Петров", "Сергей Петров")
+    assert len(index.clusters) == 2
+
+
+def test_organisations_are_not_merged_on_a_shared_word():
+    first, second, index = resolve_pair("Министерство иностранных дел", "Министерство внутренних дел")
+    assert first != second and len(index.clusters) == 2
+    first, second, index = resolve_pair("Чешская православная церковь", "Чешская православная община")
+    assert first != second and len(index.clusters) == 2
+    first, second, index = resolve_pair("Министерство иностранных дел", "Министерство иностранных дел (МИД)",
+                                        kind="Organization")
+    assert first == second
+
+
+def test_person_detection():
+    assert is_person("Сергей Ванек")
+    assert is_person("о. Стельмашенко")
+    assert not is_person("Министерство внутренних дел")
+    assert not is_person("Чешская православная община")
+    assert not is_person("Ванек", kind="Organization")
+    assert is_person("Русский приход", kind="Person")
+
+
+def test_index_survives_reload():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "entity_index.json")
+        index = EntityIndex(path)
+        index.resolve("Николай Ломако")
+        index.resolve("Министерство иностранных дел")
+        index.save()
+        again = EntityIndex(path)
+        assert again.resolve("Ломако", add=False) == "Николай Ломако"
+        assert again.resolve("Министерство внутренних дел", add=False) == "Министерство внутренних дел"
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
@@ -0,0 +1,70 @@
+"""Atomic writes and the job journal (journal.py).
+
+    python -m pytest scripts/test_journal.py
+    python scripts/test_journal.py
+"""
+import os
+import sys
+import stat
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+from journal import Journal, atomic_write, atomic_write_json
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_atomic_write_creates_files_like_open():
+    # Not the 0600 of the temp file it was written to.
+    if sys.platform == 'win32':
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "doc.json")
+        atomic_write_json(path, {"a": 1})
+        plain = os.path.join(directory, "plain.txt")
+        with open(plain, 'w') as f:
+            f.write("x")
+        assert mode(path) == mode(plain)
+
+
+def test_atomic_write_keeps_the_mode_of_the_replaced_file():
+    if sys.platform == 'win32':
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "doc.md")
+        atomic_write(path, "old")
+        os.chmod(path, 0o640)
+        atomic_write(path, "new")
+        assert mode(path) == 0o640
+        with open(path, encoding='utf-8') as f:
+            assert f.read() == "new"
+        assert os.listdir(directory) == ["doc.md"]
+
+
+def test_journal_resume_keeps_only_finished_stages():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "journal.jsonl")
+        journal = Journal(path)
+        journal.start("a", "convert", "k1")
+        journal.done("a", "convert", "k1")
+        journal.start("b", "convert", "k2")
+        journal._file.close()
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('{"doc": "c", "sta')  # torn last line of a crash
+        resumed = Journal(path, resume=True)
+        assert resumed.is_done("a", "convert", "k1")
+        assert not resumed.is_done("a", "convert", "other")
+        assert not resumed.is_done("b", "convert", "k2")
+        resumed._file.close()
+        assert not Journal(path).is_done("a", "convert", "k1")
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
@@ -0,0 +1,57 @@
+"""Streamed JSON validation (json_stream.py).
+
+    python -m pytest scripts/test_json_stream.py
+    python scripts/test_json_stream.py
+"""
+import os
+import sys
+import json
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+from json_stream import IncrementalJSONValidator
+
+
+def feed_in_pieces(text, size=5):
+    validator = IncrementalJSONValidator()
+    for i in range(0, len(text), size):
+        if not validator.feed(text[i:i + size]):
+            break
+    return validator
+
+
+def test_complete_object_in_pieces():
+    text = '{"metadata": {"topics": ["a", "b"], "n": -1.5e3, "ok": true, "x": null}, "analysis": "т \\"к\\""}'
+    validator = feed_in_pieces(text)
+    assert validator.error is None and validator.complete
+    assert json.loads(validator.json_text()) == json.loads(text)
+    assert validator.top_level_keys == ["metadata", "analysis"]
+
+
+def test_preamble_fence_and_unknown_keys_are_not_errors():
+    text = 'Конечно! Вот ответ:\n```json\n{"documents": [], "extra": NaN, "neg": -Infinity}\n```\nГотово.'
+    validator = feed_in_pieces(text)
+    assert validator.error is None and validator.complete
+    assert validator.json_text().startswith('{"documents"')
+    assert validator.json_text().endswith('}')
+
+
+def test_syntax_error_is_reported_where_it_happens():
+    text = '{"metadata": {"date": "1921",, "title": "x"}}' + " много текста" * 100
+    validator = feed_in_pieces(text)
+    assert validator.error
+    assert len(validator.text) < 60
+
+
+def test_bad_literal_and_mismatched_brackets():
+    assert feed_in_pieces('{"a": tru3}').error
+    assert feed_in_pieces('{"a": [1, 2}').error
+    assert feed_in_pieces('{"a": 1e}').error
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
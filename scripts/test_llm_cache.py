@@ -0,0 +1,95 @@
+"""LLM response cache: keys, LRU eviction, reuse of extractions on disk (llm_cache.py).
+
+    python -m pytest scripts/test_llm_cache.py
+    python scripts/test_llm_cache.py
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+import extract_data
+from llm_cache import LLMCache, cache_key
+from store import content_hash
+
+KEY_ARGS = ("текст", "prompt", "provider/model", 0.1, ["A", "B"])
+
+
+def age(cache, key, seconds):
+    # Backdates an entry: mtime order is the cache's LRU order.
+    t = time.time() - seconds
+    os.utime(cache._path(key), (t, t))
+
+
+def test_key_changes_with_every_input():
+    key = cache_key(*KEY_ARGS)
+    assert cache_key(*KEY_ARGS) == key
+    for i, changed in enumerate(("другой текст", "prompt 2", "provider/other", 0.7, ["A"])):
+        args = list(KEY_ARGS)
+        args[i] = changed
+        assert cache_key(*args) != key
+
+
+def test_get_put_and_broken_entries():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = LLMCache(directory, 10 ** 6)
+        key = cache_key(*KEY_ARGS)
+        assert cache.get(key) is None
+        cache.put(key, {"metadata": {"title": "Письмо"}})
+        assert cache.get(key) == {"metadata": {"title": "Письмо"}}
+        with open(cache._path(key), 'w', encoding='utf-8') as f:
+            f.write('{"metadata": ')
+        assert cache.get(key) is None
+
+
+def test_eviction_drops_the_least_recently_used():
+    with tempfile.TemporaryDirectory() as directory:
+        entry = {"analysis": "x" * 1000}
+        cache = LLMCache(directory, 2500)
+        keys = [cache_key(str(i), *KEY_ARGS[1:]) for i in range(3)]
+        cache.put(keys[0], entry)
+        cache.put(keys[1], entry)
+        age(cache, keys[0], 200)
+        age(cache, keys[1], 100)
+        assert cache.get(keys[0]) is not None  # now the most recent
+        cache.put(keys[2], entry)
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+        assert cache._total <= 2500
+
+
+def test_overwrite_does_not_grow_the_total():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = LLMCache(directory, 10 ** 6)
+        key = cache_key(*KEY_ARGS)
+        for _ in range(20):
+            cache.put(key, {"analysis": "x" * 1000})
+        assert cache._total == os.path.getsize(cache._path(key))
+
+
+def test_extraction_on_disk_is_reused_on_a_cache_miss():
+    config = extract_data.load_config(os.path.join(SCRIPT_DIR, "no-such-config.yml"))
+    content = "# Письмо\n\nТекст письма о приходе."
+    with tempfile.TemporaryDirectory() as directory:
+        cache = LLMCache(os.path.join(directory, ".llm_cache"), 10 ** 6)
+        json_path = os.path.join(directory, "doc.json")
+        assert extract_data.needs_llm(content, json_path, config, cache)
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({"metadata": {"title": "Письмо"}, "analysis": "", "source_hash": content_hash(content)}, f)
+        assert not extract_data.needs_llm(content, json_path, config, cache)
+        assert extract_data.needs_llm(content + " Изменено.", json_path, config, cache)
+        assert extract_data.needs_llm(content, json_path, config, cache, refresh=True)
+        cache.put(extract_data.request_cache_key(extract_data.document_message(content + " Изменено."), config),
+                  {"metadata": {}, "analysis": ""})
+        assert not extract_data.needs_llm(content + " Изменено.", json_path, config, cache)
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
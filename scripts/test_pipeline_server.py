@@ -0,0 +1,198 @@
+"""JSON-RPC protocol of the --serve worker: submit, cancel, status, errors (pipeline_server.py).
+
+The pipeline itself is replaced by a fake; see test_pipeline.py for real runs.
+
+    python -m pytest scripts/test_pipeline_server.py
+    python scripts/test_pipeline_server.py
+"""
+import os
+import sys
+import json
+import time
+import queue
+import threading
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+import extract_data
+import pipeline_server
+import process_pipeline
+import progress
+
+
+class Client:
+    # Plays the app: writes request lines to serve()'s stdin and reads its
+    # stdout as parsed messages.
+
+    def __init__(self):
+        self.lines = queue.Queue()
+        self.messages = queue.Queue()
+        self.seen = []
+        self._next_id = 1
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        defaults = process_pipeline.build_parser().parse_args([])
+        self.code = pipeline_server.serve(defaults, stdin=self, stdout=self)
+
+    def __iter__(self):
+        while True:
+            line = self.lines.get()
+            if line is None:
+                return
+            yield line
+
+    def write(self, text):
+        for line in text.splitlines():
+            self.messages.put(json.loads(line))
+
+    def flush(self):
+        pass
+
+    def send(self, line):
+        self.lines.put(line + "\n")
+
+    def close(self):
+        self.lines.put(None)
+        self.thread.join(10)
+        assert not self.thread.is_alive()
+
+    def wait_for(self, match):
+        for message in self.seen:
+            if match(message):
+                return message
+        deadline = time.monotonic() + 10
+        while True:
+            message = self.messages.get(timeout=max(0.01, deadline - time.monotonic()))
+            self.seen.append(message)
+            if match(message):
+                return message
+
+    def call(self, method, params=None):
+        request_id = self._next_id
+        self._next_id += 1
+        self.send(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}}))
+        return self.wait_for(lambda m: m.get("id") == request_id)
+
+    def notifications(self, method, job):
+        return [m["params"] for m in self.seen if m.get("method") == method and m["params"].get("job") == job]
+
+
+class FakePipeline:
+    # Stands in for process_pipeline.run_pipeline. Jobs whose first file is
+    # "block" run until cancelled, like the real pipeline between documents.
+
+    def __init__(self):
+        self.runs = []
+
+    def __call__(self, args, open_result=True):
+        self.runs.append(args)
+        print(f"обработка {len(args.input_files)} файлов")
+        progress.plan('copy', 1)
+        progress.stage_event(args.input_files[0], 'copy', 'done')
+        if args.input_files[0] == "block":
+            while not progress.cancelled():
+                time.sleep(0.01)
+            return 1
+        return 0
+
+
+def with_fake_pipeline(func):
+    saved = (process_pipeline.run_pipeline, process_pipeline.find_pandoc, process_pipeline.forget_missing_pandoc,
+             extract_data.preload)
+    fake = FakePipeline()
+    process_pipeline.run_pipeline = fake
+    process_pipeline.find_pandoc = lambda: "pandoc"
+    process_pipeline.forget_missing_pandoc = lambda: None
+    extract_data.preload = lambda: None
+    try:
+        return func(fake)
+    finally:
+        (process_pipeline.run_pipeline, process_pipeline.find_pandoc, process_pipeline.forget_missing_pandoc,
+         extract_data.preload) = saved
+        progress.reset()
+
+
+def test_bad_requests_get_json_rpc_errors():
+    def check(fake):
+        client = Client()
+        assert client.wait_for(lambda m: m.get("method") == "ready")["params"]["pid"] == os.getpid()
+        client.send("{not json")
+        assert client.wait_for(lambda m: "error" in m)["error"]["code"] == pipeline_server.PARSE_ERROR
+        client.send(json.dumps({"id": 7, "params": {}}))
+        assert client.wait_for(lambda m: m.get("id") == 7)["error"]["code"] == pipeline_server.INVALID_REQUEST
+        assert client.call("no-such-method")["error"]["code"] == pipeline_server.METHOD_NOT_FOUND
+        assert client.call("submit-files", {"files": "a.docx"})["error"]["code"] == pipeline_server.INVALID_PARAMS
+        assert client.call("cancel", ["not", "an", "object"])["error"]["code"] == pipeline_server.INVALID_PARAMS
+        assert client.call("shutdown")["result"] == {}
+        client.close()
+        assert client.code == 0 and fake.runs == []
+        assert sys.stdout is not client
+    with_fake_pipeline(check)
+
+
+def test_submitted_job_reports_logs_progress_and_result():
+    def check(fake):
+        output_dir = os.path.join(SCRIPT_DIR, "no-such-output")
+        client = Client()
+        reply = client.call("submit-files", {"files": ["a.docx", "b.docx"], "output_dir": output_dir,
+                                             "refresh": True})
+        job = reply["result"]["job"]
+        done = client.wait_for(lambda m: m.get("method") == "job-done")["params"]
+        assert done["job"] == job and done["ok"] and not done["cancelled"] and done["html"] is None
+        assert {"job": job, "text": "обработка 2 файлов"} in client.notifications("log", job)
+        events = client.notifications("progress", job)
+        assert [e["event"] for e in events] == ["plan", "stage"] and events[1]["doc"] == "a.docx"
+        # the reply with the job id comes before anything the job sends
+        assert client.seen.index(reply) < client.seen.index({"jsonrpc": "2.0", "method": "log",
+                                                             "params": {"job": job, "text": "обработка 2 файлов"}})
+        args = fake.runs[0]
+        assert args.input_files == ["a.docx", "b.docx"] and args.output_dir == output_dir
+        assert args.refresh and not args.no_cache and not args.serve
+        status = client.call("status")["result"]
+        assert status == {"running": None, "queued": [], "warm": {"litellm": True, "pandoc": "pandoc"}}
+        client.call("shutdown")
+        client.close()
+    with_fake_pipeline(check)
+
+
+def test_cancel_running_and_queued_jobs():
+    def check(fake):
+        client = Client()
+        first = client.call("submit-files", {"files": ["block"]})["result"]["job"]
+        client.wait_for(lambda m: m.get("method") == "progress" and m["params"]["job"] == first)
+        second = client.call("submit-files", {"files": ["c.docx"]})["result"]["job"]
+        status = client.call("status")["result"]
+        assert status["running"]["job"] == first and status["running"]["totals"] == {"copy": 1}
+        assert status["queued"] == [{"job": second, "kind": "submit-files"}]
+        assert client.call("cancel", {"job": second})["result"] == {"cancelled": True}
+        assert client.call("cancel", {"job": 99})["result"] == {"cancelled": False}
+        assert client.call("status")["result"]["queued"] == []
+        assert client.call("cancel")["result"] == {"cancelled": True}
+        for job in (first, second):
+            done = client.wait_for(lambda m: m.get("method") == "job-done" and m["params"]["job"] == job)
+            assert done["params"]["cancelled"] and not done["params"]["ok"]
+        assert len(fake.runs) == 1
+        client.call("shutdown")
+        client.close()
+    with_fake_pipeline(check)
+
+
+def test_closed_stdin_cancels_the_running_job():
+    def check(fake):
+        client = Client()
+        job = client.call("submit-files", {"files": ["block"]})["result"]["job"]
+        client.wait_for(lambda m: m.get("method") == "progress" and m["params"]["job"] == job)
+        client.close()
+        done = client.wait_for(lambda m: m.get("method") == "job-done")["params"]
+        assert done["job"] == job and done["cancelled"]
+    with_fake_pipeline(check)
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
@@ -0,0 +1,137 @@
+"""Stage events, listeners, token counters and the measured ETA (progress.py).
+
+    python -m pytest scripts/test_progress.py
+    python scripts/test_progress.py
+"""
+import io
+import os
+import sys
+import json
+import threading
+import contextlib
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+import progress
+
+
+class FakeClock:
+    # Replaces the time module inside progress so durations are exact.
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+def run_fresh(func):
+    real = progress.time
+    clock = progress.time = FakeClock()
+    progress.reset()
+    try:
+        return func(clock)
+    finally:
+        progress.time = real
+        progress.reset()
+        progress.configure("text")
+        progress._state["learned"].clear()
+        progress._state["priors"].clear()
+
+
+def test_jsonl_lines_describe_each_stage():
+    def check(clock):
+        progress.configure("jsonl")
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            progress.plan('convert', 2)
+            progress.stage_event("a", 'convert', 'start')
+            clock.now += 1.5
+            progress.stage_event("a", 'convert', 'done', error=None, chars=120)
+        plan, start, done = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert plan == {"event": "plan", "stage": "convert", "total": 2, "time": 1000.0}
+        assert start["status"] == "start" and start["done"] == 0 and "duration" not in start
+        assert done["duration"] == 1.5 and done["done"] == 1 and done["total"] == 2
+        assert done["chars"] == 120 and "error" not in done
+        assert done["eta"] == 1.5  # one document left at the measured speed
+    run_fresh(check)
+
+
+def test_text_format_prints_nothing_but_listeners_hear_everything():
+    def check(clock):
+        heard = []
+        progress.add_listener(heard.append)
+        progress.add_listener(heard.append)
+        out = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(out):
+                progress.plan('copy', 1)
+                progress.stage_event("a", 'copy', 'skipped')
+        finally:
+            progress.remove_listener(heard.append)
+        progress.stage_event("b", 'copy', 'skipped')
+        assert out.getvalue() == ""
+        assert [(e["event"], e.get("status")) for e in heard] == [("plan", None), ("stage", "skipped")]
+    run_fresh(check)
+
+
+def test_counters_are_attached_to_the_finished_extraction():
+    def check(clock):
+        heard = []
+        progress.add_listener(heard.append)
+        try:
+            progress.stage_event("a", 'extract', 'start')
+            progress.add(prompt_tokens=100, retries=0)
+            shared = progress.counters()
+            worker = threading.Thread(target=lambda: (progress.use_counters(shared), progress.add(prompt_tokens=50)))
+            worker.start()
+            worker.join()
+            progress.stage_event("a", 'extract', 'done')
+            progress.stage_event("b", 'extract', 'start')
+            progress.stage_event("b", 'extract', 'done')
+        finally:
+            progress.remove_listener(heard.append)
+        assert heard[1]["prompt_tokens"] == 150 and "retries" not in heard[1]
+        assert "prompt_tokens" not in heard[3]
+    run_fresh(check)
+
+
+def test_eta_switches_from_the_prior_to_the_measured_speed():
+    def check(clock):
+        progress.set_prior('extract', 30.0)
+        progress.plan('extract', 4)
+        assert progress.eta() == 120.0
+        progress.stage_event("a", 'extract', 'start')
+        progress.stage_event("b", 'extract', 'start')
+        clock.now += 10
+        progress.stage_event("a", 'extract', 'done')
+        progress.stage_event("b", 'extract', 'done')
+        progress.stage_event("c", 'extract', 'skipped')  # skips do not speed up the estimate
+        assert progress.seconds_per_doc('extract') == 5.0
+        assert progress.eta() == 5.0
+        assert progress.snapshot() == {"totals": {"extract": 4}, "done": {"extract": 3}, "eta": 5.0,
+                                       "cancelled": False}
+        progress.reset()
+        # the next run in the same process starts from what was measured
+        assert progress.seconds_per_doc('extract') == 5.0
+    run_fresh(check)
+
+
+def test_cancel_lasts_until_the_next_run():
+    def check(clock):
+        progress.cancel()
+        assert progress.cancelled() and progress.snapshot()["cancelled"]
+        progress.reset()
+        assert not progress.cancelled()
+    run_fresh(check)
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
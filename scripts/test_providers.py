@@ -0,0 +1,156 @@
+"""Provider chain, health tracking, failover and hedged requests (providers.py, extract_data.py).
+
+    python -m pytest scripts/test_providers.py
+    python scripts/test_providers.py
+"""
+import os
+import sys
+import time
+import threading
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+import extract_data
+import providers
+from providers import ProviderHealth, available_chain, hedge_delay, provider_chain, provider_label
+
+MESSAGES = [{"role": "system", "content": "s"}, {"role": "user", "content": "u"}]
+
+
+def settings(model, **extra):
+    return dict({"provider": "openai", "model": model, "api_key": "k", "hedging": True,
+                 "hedge_default_delay": 0.1, "fallbacks": []}, **extra)
+
+
+class FakeProviders:
+    # Stands in for call_provider_json. behaviour[model] is "ok", "fail" or
+    # "slow" (answers after 2 s unless told to stop).
+
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.calls = []
+        self.stopped = []
+        self._lock = threading.Lock()
+
+    def __call__(self, messages, llm_settings, config, validate=None, stop=None, hedge=False):
+        model = llm_settings['model']
+        with self._lock:
+            self.calls.append((model, hedge))
+        kind = self.behaviour[model]
+        if kind == "slow":
+            if stop is not None and stop.wait(2):
+                with self._lock:
+                    self.stopped.append(model)
+                return None
+        if kind == "fail":
+            return None
+        return {"answer": model}
+
+
+def call_with(fake, llm_settings):
+    real = extract_data.call_provider_json
+    extract_data.call_provider_json = fake
+    try:
+        return extract_data.call_llm_json(MESSAGES, {"llm_settings": llm_settings})
+    finally:
+        extract_data.call_provider_json = real
+        providers.reset()
+
+
+def test_fallbacks_inherit_generation_settings_only():
+    chain = provider_chain(settings("main", temperature=0.3, timeout=60, fallbacks=[
+        {"provider": "openai", "model": "same-provider"},
+        {"provider": "openrouter", "model": "other", "api_key": "k2"},
+        {"provider": "ollama", "model": "local", "temperature": 0.0},
+    ]))
+    assert [provider_label(s) for s in chain] == ["openai:main", "openai:same-provider", "openrouter:other",
+                                                   "ollama:local"]
+    assert chain[1]["api_key"] == "k" and chain[2]["api_key"] == "k2" and "api_key" not in chain[3]
+    assert chain[1]["temperature"] == 0.3 and chain[3]["temperature"] == 0.0 and chain[3]["timeout"] == 60
+    assert "fallbacks" not in chain[1]
+
+
+def test_health_cooldown_and_recovery():
+    health = ProviderHealth(max_failures=2, cooldown=0.2)
+    assert not health.record_failure("p")
+    health.record_success("p", 1.0)
+    assert not health.record_failure("p")
+    assert health.record_failure("p")
+    assert not health.is_healthy("p")
+    time.sleep(0.25)
+    assert health.is_healthy("p")
+
+
+def test_p95_needs_enough_samples():
+    health = ProviderHealth()
+    for latency in range(1, 5):
+        health.record_success("p", float(latency))
+    assert health.p95("p") is None
+    for latency in range(5, 21):
+        health.record_success("p", float(latency))
+    assert health.p95("p") == 20.0
+
+
+def test_unhealthy_providers_are_skipped_unless_all_are():
+    llm_settings = settings("health-a", health_failures=1, fallbacks=[{"provider": "openai", "model": "health-b"}])
+    health = providers.get_health(llm_settings)
+    try:
+        health.record_failure("openai:health-a")
+        assert [s["model"] for s in available_chain(llm_settings)] == ["health-b"]
+        health.record_failure("openai:health-b")
+        assert [s["model"] for s in available_chain(llm_settings)] == ["health-a", "health-b"]
+    finally:
+        providers.reset()
+
+
+def test_hedge_delay_follows_the_p95():
+    llm_settings = settings("delay", hedge_default_delay=90, hedge_min_delay=10)
+    primary = provider_chain(llm_settings)[0]
+    assert hedge_delay(llm_settings, primary) == 90.0
+    health = providers.get_health(llm_settings)
+    for _ in range(10):
+        health.record_success("openai:delay", 3.0)
+    assert hedge_delay(llm_settings, primary) == 10.0
+    for _ in range(10):
+        health.record_success("openai:delay", 40.0)
+    assert hedge_delay(llm_settings, primary) == 40.0
+
+
+def test_failover_without_hedging():
+    fake = FakeProviders({"a": "fail", "b": "fail", "c": "ok"})
+    llm_settings = settings("a", hedging=False, fallbacks=[{"provider": "openai", "model": m} for m in "bc"])
+    assert call_with(fake, llm_settings) == ({"answer": "c"}, "c")
+    assert fake.calls == [("a", False), ("b", False), ("c", False)]
+
+
+def test_slow_primary_is_hedged_and_stopped():
+    fake = FakeProviders({"slow": "slow", "fast": "ok"})
+    llm_settings = settings("slow", fallbacks=[{"provider": "openai", "model": "fast"}])
+    started = time.monotonic()
+    assert call_with(fake, llm_settings) == ({"answer": "fast"}, "fast")
+    assert time.monotonic() - started < 1.5
+    assert ("fast", True) in fake.calls
+    for _ in range(50):
+        if fake.stopped:
+            break
+        time.sleep(0.02)
+    assert fake.stopped == ["slow"]
+
+
+def test_failed_racer_hands_over_to_the_next_backup():
+    fake = FakeProviders({"bad": "fail", "b1": "fail", "b2": "ok"})
+    llm_settings = settings("bad", hedge_default_delay=5,
+                            fallbacks=[{"provider": "openai", "model": m} for m in ("b1", "b2")])
+    assert call_with(fake, llm_settings) == ({"answer": "b2"}, "b2")
+    assert fake.calls == [("bad", False), ("b1", False), ("b2", False)]
+    fake = FakeProviders({"bad": "fail", "b1": "fail"})
+    llm_settings = settings("bad", fallbacks=[{"provider": "openai", "model": "b1"}])
+    assert call_with(fake, llm_settings) == (None, None)
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
@@ -0,0 +1,103 @@
+"""Error classification, provider-hinted backoff and token buckets (rate_limit.py).
+
+    python -m pytest scripts/test_rate_limit.py
+    python scripts/test_rate_limit.py
+"""
+import os
+import sys
+import time
+import email.utils
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+from rate_limit import RateLimiter, TokenBucket, backoff_delay, classify_error, get_limiter, retry_after
+
+
+class FakeError(Exception):
+    def __init__(self, status_code=None, headers=None):
+        super().__init__("fake")
+        self.status_code = status_code
+        self.headers = headers
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+def test_classify_error():
+    assert classify_error(FakeError(429)) == 'rate_limit'
+    assert classify_error(RateLimitError()) == 'rate_limit'
+    assert classify_error(FakeError(401)) == 'fatal'
+    assert classify_error(AuthenticationError()) == 'fatal'
+    assert classify_error(FakeError(503)) == 'retryable'
+    assert classify_error(TimeoutError()) == 'retryable'
+
+
+def test_retry_after_headers():
+    assert retry_after(FakeError(429, {"Retry-After": "20"})) == 20.0
+    assert retry_after(FakeError(429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(FakeError(429, {"x-ratelimit-reset-requests": "1m30s"})) == 90.0
+    assert retry_after(FakeError(429, {"x-ratelimit-reset-tokens": "250ms"})) == 0.25
+    reset = str(int((time.time() + 30) * 1000))
+    assert 28 <= retry_after(FakeError(429, {"x-ratelimit-reset": reset})) <= 30
+    date = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 <= retry_after(FakeError(429, {"retry-after": date})) <= 60
+    assert retry_after(FakeError(429)) is None
+    assert retry_after(FakeError(429, {"retry-after": "soon"})) is None
+
+
+def test_backoff_delay_bounds():
+    for attempt in range(8):
+        delay = backoff_delay(attempt, base=2.0, cap=60.0)
+        expected = min(60.0, 2.0 * 2 ** attempt)
+        assert expected / 2 <= delay <= expected
+    assert 5.0 <= backoff_delay(0, hinted=5.0) <= 6.0
+    assert backoff_delay(0, hinted=600.0) <= 61.0
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    assert bucket.wait_time(60, now, 1.0) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(30, now, 1.0) == 30.0
+    assert bucket.wait_time(30, now, 0.5) == 60.0
+    assert bucket.wait_time(30, now + 30, 1.0) == 0.0
+    assert bucket.wait_time(1000, now + 30, 1.0) == 30.0
+
+
+def test_limiter_backs_off_and_recovers():
+    limiter = RateLimiter(rpm=600, tpm=60000)
+    limiter.acquire(tokens=1000)
+    limiter.rate_limited(0.2)
+    assert limiter.scale == 0.75
+    start = time.monotonic()
+    limiter.acquire(tokens=1000)
+    assert time.monotonic() - start >= 0.15
+    for _ in range(10):
+        limiter.succeeded()
+    assert limiter.scale == 1.0
+    level = limiter.tokens.level
+    limiter.succeeded(estimated_tokens=1000, used_tokens=1500)
+    assert limiter.tokens.level == level - 500
+
+
+def test_limiter_follows_config_changes():
+    config = {"rate_limits": {"default": {"rpm": 60}}}
+    limiter = get_limiter('test-provider', config)
+    assert get_limiter('test-provider', config) is limiter
+    config["rate_limits"]["test-provider"] = {"rpm": 30, "tpm": 1000}
+    changed = get_limiter('test-provider', config)
+    assert changed is not limiter and changed.limits == (30.0, 1000.0)
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
@@ -0,0 +1,78 @@
+"""Learned per-document costs and the ETA computed from them (scheduler.py, progress.py).
+
+    python -m pytest scripts/test_scheduler.py
+    python scripts/test_scheduler.py
+"""
+import os
+import sys
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+import progress
+from scheduler import MAX_SAMPLES, CostModel, _fit, longest_first
+
+
+def test_fit_is_a_line_through_the_samples():
+    a, b = _fit([[1000, 3.0], [2000, 5.0], [3000, 7.0]])
+    assert abs(a - 1.0) < 1e-9 and abs(b - 0.002) < 1e-9
+
+
+def test_fit_falls_back_to_the_mean():
+    assert _fit([]) is None
+    assert _fit([[100, 2.0], [200, 4.0]]) == (3.0, 0.0)
+    assert _fit([[100, 2.0], [100, 4.0], [100, 6.0]]) == (4.0, 0.0)
+    assert _fit([[100, 9.0], [200, 5.0], [300, 1.0]]) == (5.0, 0.0)
+
+
+def test_model_predicts_records_and_reloads():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history", "latency_history.json")
+        model = CostModel(path)
+        assert model.predict('extract', 'p:m', 1000) is None
+        assert model.typical('extract') is None
+        for size, seconds in ((1000, 3.0), (2000, 5.0), (3000, 7.0)):
+            model.record('extract', 'p:m', size, seconds)
+        model.record('extract', 'other:m', 1000, 11.0)
+        assert abs(model.predict('extract', 'p:m', 4000) - 9.0) < 1e-6
+        assert model.typical('extract', 'p:m') == 5.0
+        assert model.typical('extract') == 6.5
+        model.save()
+        again = CostModel(path)
+        assert abs(again.predict('extract', 'p:m', 4000) - 9.0) < 1e-6
+
+
+def test_model_keeps_the_last_samples():
+    with tempfile.TemporaryDirectory() as directory:
+        model = CostModel(os.path.join(directory, "latency_history.json"))
+        for i in range(MAX_SAMPLES + 50):
+            model.record('convert', 'native', 100, float(i))
+        history = model.samples['convert']['native']
+        assert len(history) == MAX_SAMPLES and history[0][1] == 50.0
+
+
+def test_longest_first():
+    costs = {"a": 1.0, "b": 5.0, "c": 3.0}
+    assert longest_first(costs, costs.get) == ["b", "c", "a"]
+
+
+def test_eta_uses_the_predicted_costs():
+    progress.reset()
+    try:
+        progress.set_prior('extract', 5.0)
+        progress.plan('extract', 3)
+        progress.expect('extract', {"a": 10.0, "b": 20.0}, workers=2)
+        assert progress.eta() == 20.0  # (10 + 20) / 2 workers + 1 doc at the prior
+        progress.stage_event("a", 'extract', 'skipped')
+        assert progress.eta() == 15.0
+    finally:
+        progress.reset()
+        progress._state["priors"].clear()
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
@@ -0,0 +1,115 @@
+"""Parsing, repair and validation of LLM answers (schema.py, json_stream.close_truncated).
+
+    python -m pytest scripts/test_schema.py
+    python scripts/test_schema.py
+"""
+import os
+import sys
+import json
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+from json_stream import close_truncated
+from schema import SchemaError, parse_llm_json, validate_extraction, validate_packed
+
+
+def raises_schema_error(func, *args):
+    try:
+        func(*args)
+    except SchemaError:
+        return True
+    return False
+
+
+def test_plain_json_has_no_warnings():
+    warnings = []
+    assert parse_llm_json('{"a": 1}', warnings) == {"a": 1}
+    assert warnings == []
+
+
+def test_fenced_json_is_not_a_repair():
+    warnings = []
+    assert parse_llm_json('```json\n{"a": 1}\n```', warnings) == {"a": 1}
+    assert warnings == []
+
+
+def test_prose_around_json_is_dropped():
+    warnings = []
+    assert parse_llm_json('Вот ответ: {"a": [1, 2]} Надеюсь, помог.', warnings) == {"a": [1, 2]}
+    assert warnings == ["вокруг JSON был лишний текст — отброшен"]
+
+
+def test_truncated_json_is_closed():
+    warnings = []
+    data = parse_llm_json('{"metadata": {"topics": ["a"]}, "analysis": "обры', warnings)
+    assert data == {"metadata": {"topics": ["a"]}, "analysis": "обры"}
+    assert warnings == ["JSON был обрезан — недостающие скобки закрыты"]
+
+
+def test_unrepairable_answers_raise():
+    assert raises_schema_error(parse_llm_json, "Извините, не могу.", [])
+    assert raises_schema_error(parse_llm_json, '{"a": 1,, "b": 2}', [])
+    assert raises_schema_error(parse_llm_json, None, [])
+
+
+def test_validation_fills_defaults_and_drops_bad_items():
+    warnings = []
+    data = validate_extraction({"metadata": {
+        "date": 1921,
+        "topics": "Приход",
+        "entities": [{"name": " Ломако "}, {"type": "Person"}],
+        "events": [{"date": "1921", "actor": "A", "desc": ["не строка"]}],
+    }}, warnings)
+    meta = data["metadata"]
+    assert meta["date"] == "1921"
+    assert meta["topics"] == ["Приход"]
+    assert meta["entities"] == [{"name": "Ломако", "type": "Person", "group": "Other"}]
+    assert meta["events"][0]["desc"] == ""
+    assert meta["relationships"] == []
+    assert data["analysis"] == ""
+    assert len(warnings) == 2
+
+
+def test_missing_metadata_raises():
+    assert raises_schema_error(validate_extraction, {"analysis": "x"}, [])
+    assert raises_schema_error(validate_extraction, ["metadata"], [])
+
+
+def test_packed_answer_drops_slots_without_id():
+    warnings = []
+    data = validate_packed({"documents": [
+        {"id": 1, "metadata": {}, "analysis": "a"},
+        {"metadata": {}},
+        {"id": "3"},
+    ]}, warnings)
+    assert [d["id"] for d in data["documents"]] == ["1"]
+    assert len(warnings) == 2
+    assert raises_schema_error(validate_packed, {"documents": {}}, [])
+
+
+def test_close_truncated_string_and_open_brackets():
+    repaired = close_truncated('{"metadata": {"topics": ["a", "b"]}, "analysis": "текст обры')
+    assert json.loads(repaired) == {"metadata": {"topics": ["a", "b"]}, "analysis": "текст обры"}
+
+
+def test_close_truncated_drops_a_half_written_value():
+    repaired = close_truncated('{"events": [{"date": "1921"}, {"date": "19')
+    assert json.loads(repaired) == {"events": [{"date": "1921"}, {"date": "19"}]}
+    repaired = close_truncated('{"a": 1, "b": [1, 2], "c": tr')
+    assert json.loads(repaired) == {"a": 1, "b": [1, 2]}
+    repaired = close_truncated('{"a": 1, "key_cut')
+    assert json.loads(repaired) == {"a": 1}
+
+
+def test_close_truncated_gives_up_on_broken_json():
+    assert close_truncated("нет JSON") is None
+    assert close_truncated('{"a": 1,, "b"') is None
+    assert close_truncated('{"a": 1} хвост') == '{"a": 1}'
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
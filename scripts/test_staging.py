@@ -0,0 +1,73 @@
+"""Content-addressed staging: hashing, placing files and the manifest (staging.py).
+
+    python -m pytest scripts/test_staging.py
+    python scripts/test_staging.py
+"""
+import os
+import sys
+import hashlib
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+import staging
+from staging import Manifest, hash_file, place_file
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_hash_file_reads_in_chunks():
+    with tempfile.TemporaryDirectory() as directory:
+        data = os.urandom(10000)
+        path = write(os.path.join(directory, "a.docx"), data)
+        assert hash_file(path, chunk_size=1000) == hashlib.sha256(data).hexdigest()
+
+
+def test_place_file_replaces_the_target():
+    with tempfile.TemporaryDirectory() as directory:
+        src = write(os.path.join(directory, "src.docx"), b"new")
+        dst = write(os.path.join(directory, "dst.docx"), b"old")
+        assert place_file(src, dst) in ("reflink", "hardlink", "copy")
+        with open(dst, 'rb') as f:
+            assert f.read() == b"new"
+        assert sorted(os.listdir(directory)) == ["dst.docx", "src.docx"]
+
+
+def test_hash_of_does_not_read_a_known_file_again():
+    with tempfile.TemporaryDirectory() as directory:
+        path = write(os.path.join(directory, "a.docx"), b"content")
+        manifest = Manifest(directory)
+        digest = manifest.hash_of(path)
+        real = staging.hash_file
+        staging.hash_file = None
+        try:
+            assert manifest.hash_of(path) == digest
+        finally:
+            staging.hash_file = real
+
+
+def test_manifest_records_artifacts_and_reloads():
+    with tempfile.TemporaryDirectory() as directory:
+        manifest = Manifest(directory)
+        md = write(os.path.join(directory, "a.md"), b"# A")
+        manifest.record("h1", md=md, json=os.path.join(directory, "a.json"))
+        assert manifest.existing("h1", "md") == md
+        assert manifest.existing("h1", "json") is None
+        # a.md now belongs to the changed document
+        manifest.record("h2", md=md)
+        assert manifest.artifacts("h1") == {"json": "a.json"}
+        manifest.save()
+        again = Manifest(directory)
+        assert again.entries() == {"h1": {"json": "a.json"}, "h2": {"md": "a.md"}}
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
@@ -0,0 +1,92 @@
+"""CI test: cold start of `process_pipeline --help` must stay within a time budget
+and must not import the heavy dependencies (litellm, yaml, ...)."""
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stderr.reconfigure(encoding='utf-8')
+
+from test_pipeline import SCRIPT_DIR, find_pipeline_exe
+
+# Each Electron drop starts a fresh process, so this is paid on every run.
+DEFAULT_BUDGET = 1.0          # seconds, python scripts/process_pipeline.py --help
+DEFAULT_FROZEN_BUDGET = 5.0   # seconds, PyInstaller build (includes unpacking)
+
+# Imported only inside the stages that need them.
+FORBIDDEN_MODULES = ['litellm', 'openai', 'yaml', 'tiktoken', 'requests', 'pandas', 'bs4', 'docx', 'extract_data']
+
+def log(msg):
+    print(f"[TEST] {msg}")
+    sys.stdout.flush()
+
+def time_command(cmd, runs):
+    # Median of several cold starts; the first one also warms the disk cache.
+    times = []
+    for _ in range(runs + 1):
+        started = time.perf_counter()
+        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=120)
+        times.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            log(f"FAIL: {' '.join(cmd)} exited with {result.returncode}\n{result.stderr[:2000]}")
+            sys.exit(1)
+    times = sorted(times[1:])
+    return times[len(times) // 2]
+
+def imported_modules(script):
+    # -X importtime writes "import time: self | cumulative | module" to stderr.
+    cmd = [sys.executable, "-X", "importtime", script, "--help"]
+    result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace', timeout=120)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if len(parts) == 3 and parts[1].isdigit():
+            modules[parts[2]] = int(parts[1])
+    return modules
+
+def main(args_list=None):
+    parser = argparse.ArgumentParser(description="Check the cold-start time of process_pipeline --help.")
+    parser.add_argument("--budget", type=float, help="Seconds allowed for one cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--frozen", action="store_true", help="Time the PyInstaller build in dist/ instead")
+    args = parser.parse_args(args_list)
+
+    script = os.path.join(SCRIPT_DIR, "process_pipeline.py")
+    failed = False
+
+    if args.frozen:
+        exe = find_pipeline_exe()
+        if not exe:
+            log("FAIL: no bundled exe in dist/")
+            sys.exit(1)
+        cmd = [exe, "--help"]
+        budget = args.budget or DEFAULT_FROZEN_BUDGET
+    else:
+        cmd = [sys.executable, script, "--help"]
+        budget = args.budget or float(os.environ.get("HDP_STARTUP_BUDGET", DEFAULT_BUDGET))
+        modules = imported_modules(script)
+        heavy = sorted(m for m in modules if m.split('.')[0] in FORBIDDEN_MODULES)
+        if heavy:
+            log(f"FAIL: --help imports {', '.join(heavy)}")
+            failed = True
+        slowest = sorted(modules.items(), key=lambda item: -item[1])[:5]
+        log("Slowest imports: " + ", ".join(f"{name} {us / 1000:.1f} ms" for name, us in slowest))
+
+    median = time_command(cmd, args.runs)
+    if median > budget:
+        log(f"FAIL: cold start {median:.3f} s > budget {budget:.3f} s")
+        failed = True
+    else:
+        log(f"PASS: cold start {median:.3f} s (budget {budget:.3f} s)")
+
+    if failed:
+        sys.exit(1)
+    log("ALL CHECKS PASSED")
+
+if __name__ == "__main__":
+    main()
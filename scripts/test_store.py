@@ -0,0 +1,113 @@
+"""SQLite store for extraction results: replace-on-save, timeline rows, JSON export/import (store.py).
+
+    python -m pytest scripts/test_store.py
+    python scripts/test_store.py
+"""
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+from generate_tufte_viz import load_document
+from store import ExtractionStore, content_hash
+
+
+def extraction(title, actor, topics=("Храм",)):
+    return {
+        "metadata": {
+            "date": "1905-03-01", "type": "Письмо", "title": title, "author": actor,
+            "entities": [{"name": actor, "type": "person", "group": "clergy"}],
+            "relationships": [{"source": actor, "target": "Приход", "type": "служит", "desc": "настоятель"}],
+            "events": [{"date": "1905-03-01", "actor": actor, "target": "Приход", "type": "письмо", "desc": title},
+                       {"date": "1905-04-01", "actor": actor, "target": "Епархия", "type": "отчёт", "desc": "отчёт"}],
+            "topics": list(topics),
+        },
+        "analysis": "анализ",
+    }
+
+
+def count(store, table):
+    return store.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_save_replaces_the_document_and_its_rows():
+    with tempfile.TemporaryDirectory() as directory:
+        store = ExtractionStore(os.path.join(directory, "extraction.sqlite"))
+        store.save("doc", extraction("Первое", "Иванов"), content_hash("v1"))
+        store.save("doc", extraction("Второе", "Петров", topics=()), content_hash("v2"))
+        assert count(store, "documents") == 1
+        assert (count(store, "entities"), count(store, "relationships"), count(store, "events"),
+                count(store, "topics")) == (1, 1, 2, 0)
+        assert store.document_hash("doc") == content_hash("v2")
+        assert store.document_hash("missing") is None
+        title, author = store.conn.execute("SELECT title, author FROM documents").fetchone()
+        assert (title, author) == ("Второе", "Петров")
+        store.close()
+
+
+def test_timeline_matches_the_json_files_and_skips_duplicates():
+    with tempfile.TemporaryDirectory() as directory:
+        store = ExtractionStore(os.path.join(directory, "extraction.sqlite"))
+        docs = {"a": extraction("Первое", "Иванов"),
+                "b": extraction("Второе", "Петров", topics=("Школа", "Храм")),
+                "c": dict(extraction("Копия", "Сидоров"), duplicate_of="a")}
+        entities, events, topics = [], [], set()
+        for name, data in docs.items():
+            store.save(name, data)
+            path = os.path.join(directory, name + ".json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            loaded = load_document(path)
+            if loaded:
+                entities.extend(loaded[0])
+                events.extend(loaded[1])
+                topics.update(loaded[2])
+        assert store.load_timeline() == (entities, events, topics)
+        assert "Сидоров" not in {e["actor"] for e in events}
+        store.close()
+
+
+def test_export_and_import_round_trip():
+    with tempfile.TemporaryDirectory() as directory:
+        store = ExtractionStore(os.path.join(directory, "one.sqlite"))
+        store.save("a", extraction("Первое", "Иванов"))
+        store.save("b", extraction("Второе", "Петров"))
+        json_dir = os.path.join(directory, "json")
+        assert store.export_json(json_dir) == 2
+        store.close()
+        with open(os.path.join(json_dir, "skip.json"), 'w', encoding='utf-8') as f:
+            json.dump({"source": "not an extraction"}, f)
+        with open(os.path.join(json_dir, "broken.json"), 'w', encoding='utf-8') as f:
+            f.write('{"metadata": ')
+        copy = ExtractionStore(os.path.join(directory, "two.sqlite"))
+        assert copy.import_json(json_dir) == 2
+        with open(os.path.join(json_dir, "a.json"), encoding='utf-8') as f:
+            assert json.load(f) == extraction("Первое", "Иванов")
+        assert count(copy, "events") == 4
+        copy.close()
+
+
+def test_old_database_gets_the_duplicate_column():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "extraction.sqlite")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE documents (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, content_hash TEXT, "
+                     "processed_at TEXT NOT NULL, date TEXT, type TEXT, title TEXT, author TEXT, location TEXT, "
+                     "data TEXT NOT NULL)")
+        conn.commit()
+        conn.close()
+        store = ExtractionStore(path)
+        store.save("c", dict(extraction("Копия", "Сидоров"), duplicate_of="a"))
+        assert store.load_timeline() == ([], [], set())
+        store.close()
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
@@ -0,0 +1,110 @@
+"""Packing small documents into shared requests and splitting the answers (token_budget.py, extract_data.py).
+
+    python -m pytest scripts/test_token_budget.py
+    python scripts/test_token_budget.py
+"""
+import os
+import sys
+import json
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+import extract_data
+from llm_cache import LLMCache
+from schema import validate_packed
+from token_budget import plan_batches, projected_usage
+
+SETTINGS = {"context_tokens": 10000, "output_tokens_per_doc": 1000, "pack_max_docs": 3, "pack_doc_tokens": 1500}
+
+
+def answer(title):
+    return {"metadata": {"title": title}, "analysis": f"анализ {title}"}
+
+
+class FakeLLM:
+    # Stands in for call_llm_json: a packed answer that skips one document,
+    # repeats another and adds an unknown id; single requests always answer.
+
+    def __init__(self, packed_ids):
+        self.packed_ids = packed_ids
+        self.calls = []
+
+    def __call__(self, messages, config, validate=None):
+        user = messages[-1]['content']
+        self.calls.append(user)
+        if validate is validate_packed:
+            documents = [dict(answer(f"пакет {i}"), id=i) for i in self.packed_ids]
+            return validate(json.loads(json.dumps({"documents": documents})), []), "model"
+        return validate(answer("отдельно"), []), "model"
+
+
+def with_fake_llm(fake, func):
+    real = extract_data.call_llm_json
+    extract_data.call_llm_json = fake
+    try:
+        return func()
+    finally:
+        extract_data.call_llm_json = real
+
+
+def test_small_documents_are_packed_up_to_the_limits():
+    docs = [("a", 500), ("b", 500), ("c", 500), ("d", 500), ("big", 4000), ("e", 500)]
+    assert plan_batches(docs, 1000, SETTINGS) == [["a", "b", "c"], ["big"], ["d", "e"]]
+    assert plan_batches(docs, 1000, dict(SETTINGS, packing=False)) == [[d] for d, _ in docs]
+
+
+def test_packs_respect_the_context_window():
+    # 2000 system + 3 * (1400 + 1000 output) > 8000: the third goes to a new request
+    docs = [("a", 1400), ("b", 1400), ("c", 1400)]
+    assert plan_batches(docs, 2000, dict(SETTINGS, context_tokens=8000)) == [["a", "b"], ["c"]]
+
+
+def test_projected_usage():
+    batches = [["a", "b"], ["c"]]
+    usage = projected_usage(batches, {"a": 100, "b": 200, "c": 300}, 1000, pack_overhead_tokens=50)
+    assert usage == {"documents": 3, "requests": 2, "prompt_tokens": 2650, "prompt_tokens_unpacked": 3600}
+
+
+def test_packed_answer_is_split_into_slots():
+    config = extract_data.load_config(os.path.join(SCRIPT_DIR, "no-such-config.yml"))
+    fake = FakeLLM(["3", "1", "1", "9"])
+    texts = ["первый", "второй", "третий"]
+    with tempfile.TemporaryDirectory() as directory:
+        cache = LLMCache(directory, 10 ** 6)
+        slots = with_fake_llm(fake, lambda: extract_data.request_packed_extraction(texts, config, cache))
+        assert [s and s["metadata"]["title"] for s in slots] == ["пакет 1", None, "пакет 3"]
+        assert "=== ДОКУМЕНТ 2 ===\nвторой" in fake.calls[0]
+        # each answered document is cached as if it had been asked alone
+        assert not extract_data.needs_llm(texts[0], os.path.join(directory, "x.json"), config, cache)
+        assert extract_data.needs_llm(texts[1], os.path.join(directory, "x.json"), config, cache)
+
+
+def test_document_missing_from_a_packed_answer_is_asked_alone():
+    config = extract_data.load_config(os.path.join(SCRIPT_DIR, "no-such-config.yml"))
+    fake = FakeLLM(["1", "3"])
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i, text in enumerate(["первый", "второй", "третий"]):
+            paths.append(os.path.join(directory, f"doc{i}.md"))
+            with open(paths[-1], 'w', encoding='utf-8') as f:
+                f.write(text)
+        json_dir, md_dir = os.path.join(directory, "json"), os.path.join(directory, "md")
+        os.makedirs(json_dir)
+        os.makedirs(md_dir)
+        ok = with_fake_llm(fake, lambda: extract_data.process_batch(paths, config, json_dir, md_dir))
+        assert ok and fake.calls[1:] == [extract_data.document_message("второй")]
+        titles = []
+        for i in range(3):
+            with open(os.path.join(json_dir, f"doc{i}.json"), encoding='utf-8') as f:
+                titles.append(json.load(f)["metadata"]["title"])
+        assert titles == ["пакет 1", "отдельно", "пакет 3"]
+        assert sorted(os.listdir(md_dir)) == ["doc0.md", "doc1.md", "doc2.md"]
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
@@ -0,0 +1,133 @@
+"""Watch-folder mode: file filter, change detection and debouncing (watch_folder.py).
+
+    python -m pytest scripts/test_watch_folder.py
+    python scripts/test_watch_folder.py
+"""
+import os
+import sys
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+import watch_folder
+from watch_folder import Debouncer, PollingWatcher, open_watcher, watched
+
+
+class FakeClock:
+    # Replaces the time module inside watch_folder so the quiet period
+    # passes without sleeping.
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def with_clock(func):
+    real = watch_folder.time
+    clock = watch_folder.time = FakeClock()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            return func(clock, directory)
+    finally:
+        watch_folder.time = real
+
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def test_only_documents_are_watched():
+    assert watched("Письмо.docx") and watched("notes.MD")
+    assert not watched("~$Письмо.docx") and not watched(".notes.md.123.tmp") and not watched("scan.pdf")
+
+
+def test_path_is_ready_after_a_quiet_period():
+    def check(clock, directory):
+        path = os.path.join(directory, "a.md")
+        write(path, "текст")
+        debouncer = Debouncer(2.0)
+        debouncer.touch(path)
+        clock.now += 1.5
+        assert debouncer.ready() == []
+        debouncer.touch(path)  # another event restarts the wait
+        clock.now += 1.5
+        assert debouncer.ready() == []
+        clock.now += 0.5
+        assert debouncer.ready() == [path]
+        assert debouncer.ready() == [] and debouncer.pending == {}
+    with_clock(check)
+
+
+def test_growing_file_waits_until_it_stops():
+    def check(clock, directory):
+        path = os.path.join(directory, "big.docx")
+        write(path, "x" * 10)
+        debouncer = Debouncer(2.0)
+        debouncer.touch(path)
+        write(path, "x" * 1000)  # still being copied, no new event
+        clock.now += 2.0
+        assert debouncer.ready() == []
+        clock.now += 2.0
+        assert debouncer.ready() == [path]
+    with_clock(check)
+
+
+def test_vanished_file_is_dropped():
+    def check(clock, directory):
+        kept, gone = os.path.join(directory, "b.md"), os.path.join(directory, "a.md")
+        write(kept, "оставлен")
+        write(gone, "временный")
+        debouncer = Debouncer(1.0)
+        debouncer.touch(gone)
+        debouncer.touch(kept)
+        os.remove(gone)
+        clock.now += 1.0
+        assert debouncer.ready() == [kept] and debouncer.pending == {}
+    with_clock(check)
+
+
+def test_polling_reports_new_and_changed_files():
+    with tempfile.TemporaryDirectory() as directory:
+        old = os.path.join(directory, "old.md")
+        write(old, "1")
+        watcher = PollingWatcher(directory, interval=0)
+        assert watcher.changes(0) == set()
+        new = os.path.join(directory, "new.docx")
+        write(new, "2")
+        write(os.path.join(directory, "~$new.docx"), "lock")
+        assert watcher.changes(0) == {new}
+        write(old, "1 изменён")
+        assert watcher.changes(0) == {old}
+
+
+def test_inotify_reports_written_documents():
+    if not sys.platform.startswith('linux'):
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        watcher = open_watcher(directory)
+        try:
+            if isinstance(watcher, PollingWatcher):
+                return
+            path = os.path.join(directory, "a.md")
+            write(path, "текст")
+            write(os.path.join(directory, "scan.pdf"), "pdf")
+            os.makedirs(os.path.join(directory, "folder.md"))
+            changes = set()
+            for _ in range(10):
+                changes |= watcher.changes(0.2)
+                if changes:
+                    break
+            assert changes == {path}
+        finally:
+            watcher.close()
+
+
+if __name__ == "__main__":
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"[TEST] PASS: {name}")
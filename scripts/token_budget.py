@@ -0,0 +1,71 @@
+"""Token counting (tiktoken) and packing of small documents into shared requests."""
+import threading
+
+from chunking import approx_tokens
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    # tiktoken downloads its BPE table on first use; when that is impossible
+    # (offline, frozen build without the cache) fall back to the estimate.
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            try:
+                import tiktoken
+                _encoder = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                _encoder = False
+    return _encoder
+
+
+def count_tokens(text):
+    encoder = _get_encoder()
+    if not encoder:
+        return approx_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def plan_batches(docs, system_tokens, llm_settings):
+    # docs: list of (doc_id, tokens) in dispatch order.
+    # Returns a list of batches (lists of doc_ids). Small documents are packed
+    # next-fit into one request as long as prompt + reserved output fits the
+    # context window; anything large or with packing disabled goes alone.
+    context_tokens = int(llm_settings.get('context_tokens', 32000))
+    per_doc_output = int(llm_settings.get('output_tokens_per_doc', 1500))
+    max_docs = int(llm_settings.get('pack_max_docs', 6))
+    pack_doc_tokens = int(llm_settings.get('pack_doc_tokens', 1500))
+    packing = llm_settings.get('packing', True) and max_docs > 1
+
+    batches, current, current_tokens = [], [], system_tokens
+    for doc_id, tokens in docs:
+        if not packing or tokens > pack_doc_tokens:
+            batches.append([doc_id])
+            continue
+        fits = current_tokens + tokens + per_doc_output * (len(current) + 1) <= context_tokens
+        if current and (len(current) >= max_docs or not fits):
+            batches.append(current)
+            current, current_tokens = [], system_tokens
+        current.append(doc_id)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def projected_usage(batches, doc_tokens, system_tokens, pack_overhead_tokens=0):
+    # Prompt tokens for the planned requests vs. one request per document.
+    packed = 0
+    for batch in batches:
+        packed += system_tokens + sum(doc_tokens[d] for d in batch)
+        if len(batch) > 1:
+            packed += pack_overhead_tokens
+    unpacked = sum(system_tokens + doc_tokens[d] for batch in batches for d in batch)
+    return {
+        "documents": sum(len(b) for b in batches),
+        "requests": len(batches),
+        "prompt_tokens": packed,
+        "prompt_tokens_unpacked": unpacked,
+    }
@@ -0,0 +1,150 @@
+"""Cached discovery of external tools (pandoc, ...).
+
+Finding a bundled binary can mean walking the whole bundle, and checking it
+means starting it; with antivirus scanning on Windows both cost seconds per
+launch. The resolved path, version and capabilities are kept in a small
+JSON file in the user cache folder and reused until the key changes:
+
+- the build ID of the app (size and mtime of the frozen executable), and
+- the binary itself (size, plus mtime unless it lives in the onefile
+  extraction folder, which is recreated on every start).
+
+    tool = toolchain.resolve("pandoc", locate, probe)
+    tool["path"], tool["version"], tool["capabilities"]
+"""
+import os
+import sys
+import json
+import threading
+
+from journal import atomic_write_json
+
+CACHE_NAME = "toolchain.json"
+CACHE_VERSION = 1
+
+_lock = threading.Lock()
+
+
+def cache_dir():
+    if os.environ.get('HDP_CACHE_DIR'):
+        return os.environ['HDP_CACHE_DIR']
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), 'AppData', 'Local')
+    elif sys.platform == 'darwin':
+        base = os.path.join(os.path.expanduser('~'), 'Library', 'Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'konspekt-hdp')
+
+
+def build_id():
+    if getattr(sys, 'frozen', False):
+        st = os.stat(sys.executable)
+        return f"frozen:{st.st_size}:{st.st_mtime_ns}"
+    return "source:" + os.path.abspath(sys.executable)
+
+
+def _roots():
+    # Placeholders for bundle folders, so a cached path survives the
+    # per-run _MEIxxxx folder of onefile builds.
+    roots = []
+    if hasattr(sys, '_MEIPASS'):
+        roots.append(("{bundle}", os.path.abspath(sys._MEIPASS)))
+    if getattr(sys, 'frozen', False):
+        roots.append(("{app}", os.path.dirname(os.path.abspath(sys.executable))))
+    return roots
+
+
+def _contract(path):
+    path = os.path.abspath(path)
+    for name, root in _roots():
+        if path == root or path.startswith(root + os.sep):
+            return name + path[len(root):]
+    return path
+
+
+def _expand(path):
+    for name, root in _roots():
+        if path.startswith(name):
+            return root + path[len(name):]
+    return path
+
+
+def _stamp(path):
+    st = os.stat(path)
+    if _contract(path).startswith("{bundle}"):
+        return f"{st.st_size}"
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def _load():
+    try:
+        with open(os.path.join(cache_dir(), CACHE_NAME), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != CACHE_VERSION:
+        return {}
+    return data.get('tools', {})
+
+
+def _save(tools):
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        atomic_write_json(os.path.join(cache_dir(), CACHE_NAME), {"version": CACHE_VERSION, "tools": tools})
+    except OSError:
+        pass  # read-only profile: discovery simply runs again next time
+
+
+def cached(name):
+    # The cached entry for `name` if its key still matches, else None.
+    with _lock:
+        entry = _load().get(name)
+    if not entry or entry.get('build') != build_id():
+        return None
+    path = _expand(entry['path'])
+    try:
+        if _stamp(path) != entry.get('stamp'):
+            return None
+    except OSError:
+        return None
+    return {"path": path, "version": entry.get('version'), "capabilities": dict(entry.get('capabilities', {}))}
+
+
+def resolve(name, locate, probe):
+    # locate() -> path or None; probe(path) -> (version, capabilities), or
+    # None when the binary does not work. Both only run on a cache miss.
+    # Returns {"path", "version", "capabilities"}, or None if not found; a
+    # binary that fails the probe is returned with version None and not cached.
+    tool = cached(name)
+    if tool:
+        return tool
+    path = locate()
+    if not path:
+        return None
+    result = probe(path)
+    if result is None:
+        return {"path": path, "version": None, "capabilities": {}}
+    version, capabilities = result
+    try:
+        stamp = _stamp(path)
+    except OSError:
+        stamp = None
+    with _lock:
+        tools = _load()
+        tools[name] = {"build": build_id(), "path": _contract(path), "stamp": stamp,
+                       "version": version, "capabilities": capabilities}
+        _save(tools)
+    return {"path": path, "version": version, "capabilities": dict(capabilities)}
+
+
+def update(name, **capabilities):
+    # Records what was learned while using a tool (e.g. that its server mode
+    # does not work), for the next runs with the same key.
+    with _lock:
+        tools = _load()
+        entry = tools.get(name)
+        if not entry or entry.get('build') != build_id():
+            return
+        entry.setdefault('capabilities', {}).update(capabilities)
+        _save(tools)
@@ -0,0 +1,295 @@
+"""Watch-folder mode (process_pipeline.py --watch DIR).
+
+New or changed .docx/.md files in DIR are picked up as they appear, after
+they have been quiet for --debounce seconds, and go one by one through
+conversion, extraction and the processed Markdown. The timeline page is
+regenerated from results kept in memory, re-reading only the JSON of
+documents that changed, at most once per --viz-interval seconds.
+
+Changes come from inotify on Linux (through ctypes, no extra package) and
+from a periodic listing of the folder elsewhere.
+"""
+import os
+import sys
+import time
+import queue
+import struct
+import select
+import threading
+
+import progress
+import process_pipeline
+from journal import get_journal
+from ordered_log import log as ordered_log
+from staging import get_manifest
+
+WATCHED = ('.docx', '.md')
+POLL_INTERVAL = 2.0
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct('iIII')
+
+
+def log(message):
+    ordered_log(f"[{time.strftime('%H:%M:%S')}] {message}")
+
+
+def watched(name):
+    # Office lock files (~$x.docx) and our own temp files (.x.md.123.tmp)
+    # are not documents.
+    return name.lower().endswith(WATCHED) and not name.startswith(('~$', '.'))
+
+
+class InotifyWatcher:
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+        self.directory = directory
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch {directory}")
+
+    def changes(self, timeout):
+        # -> set of changed paths; None when the kernel queue overflowed and
+        # events were lost (the caller rescans once).
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        paths = set()
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            name = os.fsdecode(name)
+            if not mask & IN_ISDIR and watched(name):
+                paths.add(os.path.join(self.directory, name))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    # Lists the folder every `interval` seconds and compares size and mtime;
+    # no file is opened.
+
+    def __init__(self, directory, interval=POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and watched(entry.name):
+                    st = entry.stat()
+                    snapshot[entry.path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def changes(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        current = self._scan()
+        paths = {path for path, stamp in current.items() if self.snapshot.get(path) != stamp}
+        self.snapshot = current
+        return paths
+
+    def close(self):
+        pass
+
+
+def open_watcher(directory, polling=False, interval=POLL_INTERVAL):
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            log(f"inotify недоступен ({e}) — опрос папки каждые {interval} сек")
+    return PollingWatcher(directory, interval)
+
+
+class Debouncer:
+    # A path is ready once no event arrived for `delay` seconds and its size
+    # stopped changing (a large file still being copied keeps it waiting).
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.pending = {}
+
+    def touch(self, path):
+        self.pending[path] = (time.monotonic(), self._size(path))
+
+    def _size(self, path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    def ready(self):
+        now = time.monotonic()
+        done = []
+        for path, (last, size) in list(self.pending.items()):
+            if now - last < self.delay:
+                continue
+            current = self._size(path)
+            if current is None:
+                del self.pending[path]  # gone again (a temp copy, or deleted)
+            elif current != size:
+                self.pending[path] = (now, current)
+            else:
+                del self.pending[path]
+                done.append(path)
+        return sorted(done)
+
+
+def watch(args):
+    directory = os.path.abspath(args.watch)
+    os.makedirs(directory, exist_ok=True)
+    args.output_dir = directory
+    progress.configure(args.progress_format)
+    journal = get_journal(directory, args.resume)
+    manifest = get_manifest(directory)
+
+    import extract_data
+    import generate_tufte_viz
+    from entity_index import open_index
+
+    json_dir = os.path.join(directory, "json")
+    html_path = os.path.join(directory, "tufte_timeline.html")
+    timeline = generate_tufte_viz.Timeline()
+    for json_path in sorted(os.listdir(json_dir)) if os.path.isdir(json_dir) else []:
+        if json_path.endswith('.json'):
+            timeline.load(os.path.join(json_dir, json_path))
+
+    # Extraction keeps running on its own thread, fed one document at a time.
+    ready = queue.Queue(maxsize=max(1, args.queue_size))
+
+    def extract():
+        try:
+            extract_data.main(process_pipeline.extraction_args(args, directory), source=ready)
+        except Exception as e:
+            log(f"Ошибка при извлечении данных: {e}")
+
+    extractor = threading.Thread(target=extract, name="extract", daemon=True)
+    extractor.start()
+
+    def offer(item):
+        # False once extraction has stopped and nobody takes items any more.
+        while extractor.is_alive():
+            try:
+                ready.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def render(docs):
+        for doc in docs:
+            timeline.load(os.path.join(json_dir, doc + ".json"))
+        # Extraction's alias index while it runs, so the two never overwrite
+        # each other's file.
+        entity_index = extract_data.ENTITY_INDEX or open_index(directory)
+        return timeline.render(html_path, entity_index)
+
+    changed = set()
+    changed_lock = threading.Lock()
+
+    def on_event(event):
+        if event.get("event") == "stage" and event.get("stage") == 'render' and event.get("status") == 'done':
+            with changed_lock:
+                changed.add(event["doc"])
+
+    progress.add_listener(on_event)
+    # .md files this loop wrote itself; their events are not new input.
+    produced = {}
+
+    def hand_over(md_path):
+        try:
+            produced[md_path] = os.stat(md_path).st_mtime_ns
+        except OSError:
+            pass
+        offer(md_path)
+
+    def process(path, announce=False):
+        if path.lower().endswith('.docx'):
+            if announce:
+                log(f"Изменён файл: {os.path.basename(path)}")
+            ok = process_pipeline.convert_documents(directory, directory, journal, 1, args.converter,
+                                                    on_ready=hand_over, servers=args.pandoc_servers,
+                                                    docx_files=[path])
+            if not ok:
+                log(f"Не удалось конвертировать {os.path.basename(path)}: pandoc не найден")
+            return
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        if produced.get(path) == mtime:
+            return
+        if announce:
+            log(f"Изменён файл: {os.path.basename(path)}")
+        offer(path)
+
+    watcher = open_watcher(directory, args.poll)
+    debouncer = Debouncer(args.debounce)
+    log(f"Наблюдение за {directory} ({type(watcher).__name__}); Ctrl+C для выхода")
+
+    # Catch up once with what arrived while nobody was watching; unchanged
+    # documents are recognised by the staging manifest and the caches.
+    names = sorted(n for n in os.listdir(directory) if watched(n))
+    for name in sorted(names, key=lambda n: not n.lower().endswith('.docx')):
+        process(os.path.join(directory, name))
+    manifest.save()
+
+    last_viz = 0.0
+    try:
+        while not progress.cancelled():
+            if not extractor.is_alive():
+                log("Извлечение данных остановилось — наблюдение прекращено")
+                break
+            paths = watcher.changes(0.5)
+            if paths is None:
+                log("Очередь событий переполнена — повторный просмотр папки")
+                paths = {os.path.join(directory, n) for n in os.listdir(directory) if watched(n)}
+            for path in paths:
+                debouncer.touch(path)
+            for path in debouncer.ready():
+                process(path, announce=True)
+                manifest.save()
+            with changed_lock:
+                docs, pending = set(changed), bool(changed)
+            if pending and time.monotonic() - last_viz >= args.viz_interval:
+                with changed_lock:
+                    changed.difference_update(docs)
+                if render(docs):
+                    log(f"Визуализация обновлена ({len(docs)} док.): {html_path}")
+                last_viz = time.monotonic()
+    except KeyboardInterrupt:
+        log("Остановка наблюдения...")
+    finally:
+        watcher.close()
+        offer(None)
+        extractor.join()
+        progress.remove_listener(on_event)
+        manifest.save()
+        if changed:
+            render(changed)
+    return 0